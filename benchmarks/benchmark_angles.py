@@ -0,0 +1,65 @@
+'''
+Benchmark of angle of incidence sweeps (A/R/T, psi/Delta and layerwise absorption): one simulation per angle
+vs. all angles as leading axis of the matrices in one vectorized calculation (Optics.angleSweep)
+
+run from the OptiSim directory:
+    python benchmarks/benchmark_angles.py [stackfile] [angle step (°)]
+'''
+
+import os
+import sys
+import copy
+import time
+import logging
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+
+from classes.materials import CRILoader, loadMaterialDB
+from classes.simulation import loadStack
+from classes.layerstack import LayerStack
+from classes.optics import Optics
+
+def simulate(name, stack, settings, references, getCRI, calculations):
+    optics = Optics(name, LayerStack(name, copy.deepcopy(stack), settings, getCRI), references, settings)
+    for calculation in calculations:
+        getattr(optics, calculation)()
+    return optics
+
+if __name__ == '__main__':
+    logging.disable(logging.INFO)
+    fName = os.path.abspath(sys.argv[1]) if len(sys.argv) > 1 else os.path.join(ROOT, 'stacks', 'StartStack.mop')
+    step = float(sys.argv[2]) if len(sys.argv) > 2 else 1
+    name, settings, defaults, references, stack = loadStack(fName)
+    references = dict([(key, ['', 0]) for key in references])
+    wavelengthRange = settings['wavelengthRange']
+    settings['wavelength'] = np.arange(wavelengthRange[0], wavelengthRange[1] + wavelengthRange[2], wavelengthRange[2])
+    materialDB = settings['MaterialDBPath'] if os.path.isdir(settings['MaterialDBPath']) else os.path.join(ROOT, 'materialDB')
+    getCRI = CRILoader(loadMaterialDB(materialDB), settings)
+    angles = np.arange(0, 85 + step / 2, step)
+    print('{} ({} layers, {} wavelengths), {} angles of incidence'.format(name, len(stack), len(settings['wavelength']), len(angles)))
+
+    start = time.perf_counter()
+    single = []
+    for angle in angles:
+        single.append(simulate(name, stack, dict(settings, angle = angle), references, getCRI,
+                               ['calcStack', 'calcFieldIntensity', 'calcAbsorption', 'calcEllipsometry']))
+    tSingle = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for angle in angles:
+        simulate(name, stack, dict(settings, angle = angle), references, getCRI, ['calcStack', 'calcEllipsometry'])
+    tSingleSpectra = time.perf_counter() - start
+    print('one simulation per angle: {:.1f} ms, without layerwise absorption {:.1f} ms'.format(tSingle * 1e3, tSingleSpectra * 1e3))
+
+    for layerwise, reference in [(True, tSingle), (False, tSingleSpectra)]:
+        start = time.perf_counter()
+        results = simulate(name, stack, settings, references, getCRI, []).angleSweep(angles, layerwise)
+        tSweep = time.perf_counter() - start
+        deviation = 0
+        for key, attribute in [('R', 'RspectrumSystem'), ('T', 'TspectrumSystem'), ('psi', 'psi'), ('Delta', 'delta')]:
+            deviation = max(deviation, np.max(np.abs(results[key] - [getattr(optics, attribute) for optics in single])))
+        print('all angles in one calculation{}: {:.1f} ms (speedup {:.1f}x, max. deviation {:.1e})'.format(
+                    '' if layerwise else ', without layerwise absorption', tSweep * 1e3, reference / tSweep, deviation))
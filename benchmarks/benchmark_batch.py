@@ -0,0 +1,44 @@
+'''
+Benchmark of parallel batch simulations: thickness sweep with different numbers of processes
+
+run from the OptiSim directory:
+    python benchmarks/benchmark_batch.py [stackfile] [points]
+'''
+
+import os
+import sys
+import time
+import logging
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from classes.batch import makeBatchJobs, runBatch
+from classes.materials import loadMaterialDB
+from classes.simulation import loadStack
+
+import optisim
+
+if __name__ == '__main__':
+    logging.disable(logging.INFO)
+    fName = sys.argv[1] if len(sys.argv) > 1 else os.path.join(ROOT, 'stacks', 'StartStack.mop')
+    points = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    name, settings, defaults, references, stack = loadStack(fName)
+    settings['MaterialDBPath'] = os.path.join(ROOT, 'materialDB')
+    materialDB = loadMaterialDB(settings['MaterialDBPath'])
+    # thickness sweep of the thickest layer
+    layer = max(stack, key = lambda layer: layer.thickness)
+    variable = [0, layer.name, 'thickness', [layer.thickness, 1, layer.thickness + points - 1]]
+    jobs = makeBatchJobs(name, stack, settings, [variable])
+    print('{} jobs: thickness of {} from {} to {} nm, {} cores'.format(len(jobs), layer.name, variable[3][0], variable[3][2], os.cpu_count()))
+    
+    workers = 1
+    serial = None
+    while workers <= (os.cpu_count() or 1):
+        start = time.perf_counter()
+        for i, optics in runBatch(jobs, optisim.noReferences(), [0, 1, 2, 3], materialDB, workers):
+            pass
+        t = time.perf_counter() - start
+        serial = serial or t
+        print('{:>3} processes: {:7.2f} s  speedup {:5.2f}  efficiency {:4.0%}'.format(workers, t, serial / t, serial / t / workers))
+        workers *= 2
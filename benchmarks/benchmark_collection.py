@@ -0,0 +1,86 @@
+'''
+Benchmark of diffusion length fit iterations (EQE): new LayerStack and Optics, incremental update of the optics (updateOptics),
+collection only with the kept absorption (Optics.updateCollection) and many diffusion lengths at once (Optics.collectionCandidates)
+
+run from the OptiSim directory:
+    python benchmarks/benchmark_collection.py [stackfile] [layer name]
+'''
+
+import os
+import sys
+import copy
+import time
+import logging
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+
+from classes.materials import CRILoader, loadMaterialDB
+from classes.simulation import loadStack, updateOptics
+from classes.layerstack import LayerStack
+from classes.optics import Optics
+
+ITERATIONS = 30
+CANDIDATES = 1000
+
+def calculate(optics):
+    optics.calcStack()
+    optics.calcFieldIntensity()
+    optics.calcAbsorption()
+    optics.calcQE()
+    return optics
+
+def iterate(name, stack, settings, references, getCRI, index, values, mode):
+    '''
+    returns time per iteration and the EQE of all iterations
+    '''
+    stack = copy.deepcopy(stack)
+    layer = stack[index]
+    optics = None
+    results = []
+    start = time.perf_counter()
+    for value in values:
+        layer.collection['diffLength'] = value
+        layer.makeXcollection()
+        if mode == 'rebuild':
+            optics = calculate(Optics(name, LayerStack(name, stack, settings, getCRI), references, settings))
+        elif mode == 'incremental' or optics is None or not optics.updateCollection(stack, [layer.name]):
+            optics = calculate(updateOptics(optics, name, stack, settings, references, getCRI, {layer.name: {'collection'}}))
+        results.append(optics.EQE.copy())
+    return (time.perf_counter() - start) / len(values), results
+
+if __name__ == '__main__':
+    logging.disable(logging.INFO)
+    fName = os.path.abspath(sys.argv[1]) if len(sys.argv) > 1 else os.path.join(ROOT, 'stacks', 'StartStack.mop')
+    name, settings, defaults, references, stack = loadStack(fName)
+    references = dict([(key, ['', 0]) for key in references])
+    wavelengthRange = settings['wavelengthRange']
+    settings['wavelength'] = np.arange(wavelengthRange[0], wavelengthRange[1] + wavelengthRange[2], wavelengthRange[2])
+    materialDB = settings['MaterialDBPath'] if os.path.isdir(settings['MaterialDBPath']) else os.path.join(ROOT, 'materialDB')
+    getCRI = CRILoader(loadMaterialDB(materialDB), settings)
+    names = [layer.name for layer in stack]
+    index = names.index(sys.argv[2]) if len(sys.argv) > 2 else int(np.argmax([layer.thickness for layer in stack]))
+    stack = copy.deepcopy(stack)
+    layer = stack[index]
+    if layer.collection['source'] != 'from diffusion length':
+        layer.collection.update({'source': 'from diffusion length', 'diffLength': 1000, 'SCRwidth': 200, 'recVel': 1e5, 'SCRside': 0})
+        layer.makeXcollection()
+    print('{} ({} layers, {} wavelengths), fitted diffusion length of {}'.format(name, len(stack), len(settings['wavelength']), layer.name))
+    values = np.linspace(200, 3000, ITERATIONS)
+    times = {}
+    results = {}
+    for mode in ['rebuild', 'incremental', 'collection only']:
+        times[mode], results[mode] = iterate(name, stack, settings, references, getCRI, index, values, mode)
+        deviation = max(np.max(np.abs(a - b)) for a, b in zip(results['rebuild'], results[mode]))
+        print('{}: {:.2f} ms per iteration (speedup {:.1f}x, max. deviation {:.1e})'.format(
+                    mode, times[mode] * 1e3, times['rebuild'] / times[mode], deviation))
+    optics = calculate(Optics(name, LayerStack(name, stack, settings, getCRI), references, settings))
+    candidates = np.linspace(200, 3000, CANDIDATES)
+    start = time.perf_counter()
+    EQE = optics.collectionCandidates(layer.name, 'diffLength', candidates)
+    duration = (time.perf_counter() - start) / CANDIDATES
+    deviation = np.max(np.abs(EQE[np.searchsorted(candidates, values[-1])] - results['rebuild'][-1]))
+    print('{} candidates at once: {:.3f} ms per diffusion length (speedup {:.0f}x, max. deviation {:.1e})'.format(
+                CANDIDATES, duration * 1e3, times['rebuild'] / duration, deviation))
@@ -0,0 +1,69 @@
+'''
+Benchmark of the diffuse light (Haze) of rough interfaces: iterative raytracer with decreasing minimum intensity
+vs. all bounces solved at once (one linear system per wavelength, Optics.solveDiffuseLight)
+
+run from the OptiSim directory:
+    python benchmarks/benchmark_diffuse.py [stackfile]
+'''
+
+import os
+import sys
+import copy
+import time
+import logging
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+
+from classes.materials import CRILoader, loadMaterialDB
+from classes.simulation import loadStack
+from classes.layerstack import LayerStack
+from classes.optics import Optics
+
+HAZE = [0.2, 0.3] # Haze R and T of all rough interfaces
+MININTENSITIES = [1e-3, 1e-5, 1e-7, 1e-9]
+MAXITERATIONS = 100000
+REPETITIONS = 5
+
+def calculate(name, stack, settings, references, getCRI):
+    '''
+    returns time (s) of the diffuse light, reflection and the generation of the stack
+    '''
+    optics = Optics(name, LayerStack(name, copy.deepcopy(stack), settings, getCRI), references, settings)
+    optics.calcStack()
+    optics.calcFieldIntensity()
+    optics.calcAbsorption()
+    optics.calcQE()
+    optics.calcGeneration()
+    start = time.perf_counter()
+    for i in range(REPETITIONS):
+        optics.calcDiffuseLight()
+    return (time.perf_counter() - start) / REPETITIONS, optics.RspectrumSystem, optics.scalars['generated current (mA/cm²)']
+
+if __name__ == '__main__':
+    logging.disable(logging.INFO)
+    fName = os.path.abspath(sys.argv[1]) if len(sys.argv) > 1 else os.path.join(ROOT, 'stacks', 'StartStack.mop')
+    name, settings, defaults, references, stack = loadStack(fName)
+    references = dict([(key, ['', 0]) for key in references])
+    wavelengthRange = settings['wavelengthRange']
+    settings['wavelength'] = np.arange(wavelengthRange[0], wavelengthRange[1] + wavelengthRange[2], wavelengthRange[2])
+    materialDB = settings['MaterialDBPath'] if os.path.isdir(settings['MaterialDBPath']) else os.path.join(ROOT, 'materialDB')
+    getCRI = CRILoader(loadMaterialDB(materialDB), settings)
+    stack = copy.deepcopy(stack)
+    for layer in stack[1:]:
+        layer.srough = True
+        layer.sroughThickness = 20
+        layer.sroughHazeR, layer.sroughHazeT = HAZE
+    print('{} ({} layers, {} wavelengths), Haze R/T {} at {} interfaces'.format(name, len(stack), len(settings['wavelength']), HAZE, len(stack) - 1))
+
+    settings['diffuse light raytracer'] = False
+    tDirect, R, generation = calculate(name, stack, settings, references, getCRI)
+    print('all bounces at once: {:.1f} ms'.format(tDirect * 1e3))
+    settings['diffuse light raytracer'] = True
+    for minIntensity in MININTENSITIES:
+        settings['roughness Haze calc diffuse'] = [True, MAXITERATIONS, minIntensity]
+        tRaytracer, RRaytracer, generationRaytracer = calculate(name, stack, settings, references, getCRI)
+        print('raytracer down to {:.0e}: {:.1f} ms (direct {:.1f}x faster), deviation R {:.1e}, generated current {:.1e} mA/cm²'.format(
+                    minIntensity, tRaytracer * 1e3, tRaytracer / tDirect, np.max(np.abs(RRaytracer - R)), abs(generationRaytracer - generation)))
@@ -0,0 +1,55 @@
+'''
+Benchmark of the transfer matrix engine: wavelength loop vs. vectorized
+
+run from the OptiSim directory:
+    python benchmarks/benchmark_engine.py [stackfile]
+'''
+
+import os
+import sys
+import time
+import logging
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from classes.layerstack import LayerStack
+from classes.optics import Optics
+from classes.materials import CRILoader, loadMaterialDB
+from classes.simulation import loadStack
+
+REPEATS = 5
+
+def timeit(function):
+    times = []
+    for i in range(REPEATS):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def benchmark(name, settings, stack, step):
+    settings = dict(settings)
+    w = settings['wavelengthRange']
+    settings['wavelength'] = np.arange(w[0], w[1] + step, step)
+    getCRI = CRILoader(loadMaterialDB('materialDB'), settings)
+    layerstack = LayerStack(name, stack, settings, getCRI)
+    optics = Optics(name, layerstack, {}, settings)
+    optics.updateMatrices()
+    
+    tLoop = timeit(optics.getSystemMatrixLoop)
+    loop = [optics.SystemMatrix] + [optics.LayerResults[n].PSI_Field for n in optics.names]
+    tVec = timeit(optics.getSystemMatrixVectorized)
+    vec = [optics.SystemMatrix] + [optics.LayerResults[n].PSI_Field for n in optics.names]
+    diff = max(np.max(np.abs(a - b) / np.maximum(np.abs(a), 1e-300)) for a, b in zip(loop, vec))
+    print('{:>6} wavelengths, {:>3} layers: loop {:8.2f} ms  vectorized {:7.2f} ms  speedup {:6.1f}  max. rel. deviation {:.1e}'.format(
+            len(settings['wavelength']), len(optics.names), tLoop * 1e3, tVec * 1e3, tLoop / tVec, diff))
+
+if __name__ == '__main__':
+    logging.disable(logging.INFO)
+    fName = sys.argv[1] if len(sys.argv) > 1 else os.path.join('stacks', 'StartStack.mop')
+    name, settings, defaults, references, stack = loadStack(fName)
+    print('stack {} ({})'.format(name, fName))
+    for step in [5, 1]:
+        benchmark(name, settings, stack, step)
@@ -0,0 +1,77 @@
+'''
+Benchmark of the peak memory of field intensity, absorption, QE and generation:
+(x, wavelength) maps kept for 2D plots vs. evaluation in depth chunks (settings['keep 2D data'] = False)
+for a CIGS stack with a 3 um absorber and a constant mesh distance of 1 nm in all layers
+
+run from the OptiSim directory:
+    python benchmarks/benchmark_fieldmemory.py [stackfile] [absorber name] [wavelength step (nm)]
+'''
+
+import os
+import sys
+import copy
+import time
+import logging
+import tracemalloc
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+
+from classes.materials import CRILoader, loadMaterialDB
+from classes.simulation import loadStack
+from classes.layerstack import LayerStack
+from classes.optics import Optics
+
+THICKNESS = 3000
+MESHDISTANCE = 1
+
+def measure(name, stack, settings, references, getCRI, keep2D):
+    '''
+    returns peak memory (MB) above the start of the calculation, time (s) and the scalars
+    '''
+    settings = dict(settings, **{'keep 2D data': keep2D})
+    optics = Optics(name, LayerStack(name, stack, settings, getCRI), references, settings)
+    optics.calcStack()
+    tracemalloc.start()
+    start = time.perf_counter()
+    optics.calcFieldIntensity()
+    optics.calcAbsorption()
+    optics.calcQE()
+    optics.calcGeneration()
+    duration = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1024**2, duration, optics.scalars
+
+if __name__ == '__main__':
+    logging.disable(logging.INFO)
+    fName = os.path.abspath(sys.argv[1]) if len(sys.argv) > 1 else os.path.join(ROOT, 'stacks', 'StartStack.mop')
+    absorber = sys.argv[2] if len(sys.argv) > 2 else 'CIS_Richter'
+    name, settings, defaults, references, stack = loadStack(fName)
+    references = dict([(key, ['', 0]) for key in references])
+    if len(sys.argv) > 3:
+        settings['wavelengthRange'][2] = float(sys.argv[3])
+    wavelengthRange = settings['wavelengthRange']
+    settings['wavelength'] = np.arange(wavelengthRange[0], wavelengthRange[1] + wavelengthRange[2], wavelengthRange[2])
+    materialDB = settings['MaterialDBPath'] if os.path.isdir(settings['MaterialDBPath']) else os.path.join(ROOT, 'materialDB')
+    getCRI = CRILoader(loadMaterialDB(materialDB), settings)
+    stack = copy.deepcopy(stack)
+    for layer in stack:
+        if layer.name == absorber:
+            layer.thickness = THICKNESS
+        layer.mesh['meshing'] = 1
+        layer.mesh['Dist'] = MESHDISTANCE
+        layer.makeXnodes()
+        layer.makeXcollection()
+        layer.makeXgrading()
+    points = sum(len(layer.x) for layer in stack)
+    print('{} with {} = {} nm: {} depths x {} wavelengths'.format(name, absorber, THICKNESS, points, len(settings['wavelength'])))
+    results = {}
+    for keep2D in [True, False]:
+        peak, duration, scalars = measure(name, stack, settings, references, getCRI, keep2D)
+        results[keep2D] = scalars
+        print('{}: peak memory {:.1f} MB, time {:.3f} s'.format('2D maps kept' if keep2D else 'depth chunks', peak, duration))
+    deviation = max(abs(results[True][key] - results[False][key]) for key in ['generated current (mA/cm²)'])
+    print('max. deviation of generated current: {:.1e} mA/cm²'.format(deviation))
@@ -0,0 +1,83 @@
+'''
+Benchmark of fit iterations: new LayerStack and Optics in each iteration vs. incremental update (classes.simulation.updateOptics)
+the thickness and the diffusion length (if collection from diffusion length) of one layer are varied as in the fitting tools
+
+run from the OptiSim directory:
+    python benchmarks/benchmark_fit.py [stackfile] [layer name]
+'''
+
+import os
+import sys
+import copy
+import time
+import logging
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+
+from classes.materials import CRILoader, loadMaterialDB
+from classes.simulation import loadStack, updateOptics
+from classes.layerstack import LayerStack
+from classes.optics import Optics
+
+ITERATIONS = 30
+
+def calculate(optics, EQE):
+    optics.calcStack()
+    if EQE:
+        optics.calcFieldIntensity()
+        optics.calcAbsorption()
+        optics.calcQE()
+        return optics.EQE
+    return optics.RspectrumSystem
+
+def iterate(name, stack, settings, references, getCRI, index, parameter, values, incremental, EQE):
+    '''
+    returns time per iteration and the results of all iterations
+    '''
+    stack = copy.deepcopy(stack)
+    layer = stack[index]
+    optics = None
+    results = []
+    start = time.perf_counter()
+    for value in values:
+        if parameter == 'thickness':
+            layer.thickness = value
+            layer.makeXnodes()
+            layer.makeXcollection()
+            layer.makeXgrading()
+        else:
+            layer.collection['diffLength'] = value
+            layer.makeXcollection()
+        if incremental:
+            optics = updateOptics(optics, name, stack, settings, references, getCRI, {layer.name: {parameter}})
+        else:
+            optics = Optics(name, LayerStack(name, stack, settings, getCRI), references, settings)
+        results.append(calculate(optics, EQE).copy())
+    return (time.perf_counter() - start) / len(values), results
+
+if __name__ == '__main__':
+    logging.disable(logging.INFO)
+    fName = os.path.abspath(sys.argv[1]) if len(sys.argv) > 1 else os.path.join(ROOT, 'stacks', 'StartStack.mop')
+    name, settings, defaults, references, stack = loadStack(fName)
+    references = dict([(key, ['', 0]) for key in references])
+    wavelengthRange = settings['wavelengthRange']
+    settings['wavelength'] = np.arange(wavelengthRange[0], wavelengthRange[1] + wavelengthRange[2], wavelengthRange[2])
+    materialDB = settings['MaterialDBPath'] if os.path.isdir(settings['MaterialDBPath']) else os.path.join(ROOT, 'materialDB')
+    getCRI = CRILoader(loadMaterialDB(materialDB), settings)
+    names = [layer.name for layer in stack]
+    index = names.index(sys.argv[2]) if len(sys.argv) > 2 else int(np.argmax([layer.thickness for layer in stack if not layer.thick] or [0]))
+    layer = stack[index]
+    print('{} ({} layers, {} wavelengths), fitted layer {}'.format(name, len(stack), len(settings['wavelength']), layer.name))
+    cases = [('thickness', layer.thickness * np.linspace(0.8, 1.2, ITERATIONS))]
+    if layer.collection['source'] == 'from diffusion length':
+        cases.append(('collection', layer.collection['diffLength'] * np.linspace(0.5, 2, ITERATIONS)))
+    for parameter, values in cases:
+        for EQE in [False, True]:
+            tRebuild, rRebuild = iterate(name, stack, settings, references, getCRI, index, parameter, values, False, EQE)
+            tUpdate, rUpdate = iterate(name, stack, settings, references, getCRI, index, parameter, values, True, EQE)
+            deviation = max(np.max(np.abs(a - b)) for a, b in zip(rRebuild, rUpdate))
+            print('{} -> {}: rebuild {:.2f} ms, incremental {:.2f} ms per iteration (speedup {:.1f}x, max. deviation {:.1e})'.format(
+                        parameter, 'EQE' if EQE else 'R', tRebuild * 1e3, tUpdate * 1e3, tRebuild / tUpdate, deviation))
@@ -0,0 +1,96 @@
+'''
+Benchmark of the interface table (Optics.fresnel): Fresnel coefficients calculated by each optics stage
+(interface matrices, ellipsometry, diffuse light, derivatives) vs. once per interface and reused,
+for a stack with haze at all interfaces and fit iterations which change the thickness of one layer
+
+run from the OptiSim directory:
+    python benchmarks/benchmark_fresnel.py [stackfile]
+'''
+
+import os
+import sys
+import copy
+import time
+import logging
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+
+import classes.optics
+from classes.materials import CRILoader, loadMaterialDB
+from classes.simulation import loadStack, updateOptics
+from classes.optics import Optics
+
+HAZE = [0.2, 0.3] # Haze R and T of all rough interfaces
+ITERATIONS = 20
+CALCULATIONS = ['calcStack', 'calcEllipsometry', 'calcFieldIntensity', 'calcAbsorption']
+
+calls = {'r_ij': 0, 't_ij': 0}
+
+def counted(name):
+    function = getattr(classes.optics, name)
+    def wrapper(*args):
+        calls[name] += 1
+        return function(*args)
+    return wrapper
+
+def uncachedFresnel(self, i, pol, rough = True):
+    '''
+    Optics.fresnel without interface table (every call calculates the coefficients)
+    '''
+    self.clearFresnel()
+    return cachedFresnel(self, i, pol, rough)
+
+cachedFresnel = Optics.fresnel
+
+def iterate(name, stack, settings, references, getCRI, index, values):
+    '''
+    returns time per iteration, Fresnel coefficient calls per iteration and the results of all iterations
+    '''
+    stack = copy.deepcopy(stack)
+    layer = stack[index]
+    optics = None
+    results = []
+    calls.update({'r_ij': 0, 't_ij': 0})
+    start = time.perf_counter()
+    for value in values:
+        layer.thickness = value
+        layer.makeXnodes()
+        layer.makeXcollection()
+        layer.makeXgrading()
+        optics = updateOptics(optics, name, stack, settings, references, getCRI, {layer.name: {'thickness'}})
+        for calculation in CALCULATIONS:
+            getattr(optics, calculation)()
+        results.append(np.concatenate([optics.RspectrumSystem, optics.psi, optics.delta]))
+    return (time.perf_counter() - start) / len(values), (calls['r_ij'] + calls['t_ij']) / len(values), results
+
+if __name__ == '__main__':
+    logging.disable(logging.INFO)
+    classes.optics.r_ij = counted('r_ij')
+    classes.optics.t_ij = counted('t_ij')
+    fName = os.path.abspath(sys.argv[1]) if len(sys.argv) > 1 else os.path.join(ROOT, 'stacks', 'StartStack.mop')
+    name, settings, defaults, references, stack = loadStack(fName)
+    references = dict([(key, ['', 0]) for key in references])
+    wavelengthRange = settings['wavelengthRange']
+    settings['wavelength'] = np.arange(wavelengthRange[0], wavelengthRange[1] + wavelengthRange[2], wavelengthRange[2])
+    materialDB = settings['MaterialDBPath'] if os.path.isdir(settings['MaterialDBPath']) else os.path.join(ROOT, 'materialDB')
+    getCRI = CRILoader(loadMaterialDB(materialDB), settings)
+    stack = copy.deepcopy(stack)
+    for layer in stack[1:]:
+        layer.srough = True
+        layer.sroughThickness = 20
+        layer.sroughHazeR, layer.sroughHazeT = HAZE
+    index = int(np.argmax([layer.thickness if not layer.thick else 0 for layer in stack]))
+    values = stack[index].thickness * np.linspace(0.8, 1.2, ITERATIONS)
+    print('{} ({} layers, {} wavelengths), Haze R/T {}, fitted layer {}'.format(name, len(stack), len(settings['wavelength']), HAZE, stack[index].name))
+
+    Optics.fresnel = uncachedFresnel
+    tUncached, nUncached, rUncached = iterate(name, stack, settings, references, getCRI, index, values)
+    Optics.fresnel = cachedFresnel
+    tCached, nCached, rCached = iterate(name, stack, settings, references, getCRI, index, values)
+    deviation = max(np.max(np.abs(a - b)) for a, b in zip(rUncached, rCached))
+    print('coefficients per stage: {:.2f} ms, {:.0f} Fresnel calls per iteration'.format(tUncached * 1e3, nUncached))
+    print('interface table: {:.2f} ms, {:.0f} Fresnel calls per iteration (speedup {:.1f}x, max. deviation {:.1e})'.format(
+                tCached * 1e3, nCached, tUncached / tCached, deviation))
@@ -0,0 +1,83 @@
+'''
+Benchmark of the partial system matrices for deep stacks: graded absorber (one sublayer per 5 mesh points)
+with an increasing number of sublayers, former product over all following coherent layers for each layer
+(quadratic in the number of layers) vs. backward scan of suffix products (Optics.getSystemMatrixVectorized)
+
+run from the OptiSim directory:
+    python benchmarks/benchmark_graded.py [stackfile] [layer name]
+'''
+
+import os
+import sys
+import copy
+import time
+import logging
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+
+from classes.materials import CRILoader, loadMaterialDB
+from classes.simulation import loadStack
+from classes.layerstack import LayerStack
+from classes.optics import Optics
+
+SUBLAYERS = [50, 100, 200, 300, 600]
+GRADING = [[0, 1.0, 'CIS_Richter.dat'], [1, 1.68, 'CGS_Minoura.dat']] # x (Ga/(Ga+In)), Eg, cri file
+REPETITIONS = 3
+
+def quadraticPSO(optics):
+    '''
+    E-field partial system matrices out of all coherent layers as product over the following coherent layers
+    '''
+    layers = [optics.LayerResults[name] for name in optics.names]
+    PSOs = []
+    for i, layer in enumerate(layers):
+        PSO = layer.InterfaceMatrix.copy()
+        for j in range(i+1, len(layers)):
+            if layers[j].thick:
+                break
+            PSO = np.matmul(PSO, layers[j].StepMatrix)
+        PSOs.append(PSO)
+    return PSOs
+
+def timed(function):
+    start = time.perf_counter()
+    for i in range(REPETITIONS):
+        function()
+    return (time.perf_counter() - start) / REPETITIONS
+
+if __name__ == '__main__':
+    logging.disable(logging.INFO)
+    fName = os.path.abspath(sys.argv[1]) if len(sys.argv) > 1 else os.path.join(ROOT, 'stacks', 'StartStack.mop')
+    name, settings, defaults, references, stack = loadStack(fName)
+    references = dict([(key, ['', 0]) for key in references])
+    wavelengthRange = settings['wavelengthRange']
+    settings['wavelength'] = np.arange(wavelengthRange[0], wavelengthRange[1] + wavelengthRange[2], wavelengthRange[2])
+    materialDB = settings['MaterialDBPath'] if os.path.isdir(settings['MaterialDBPath']) else os.path.join(ROOT, 'materialDB')
+    getCRI = CRILoader(loadMaterialDB(materialDB), settings)
+    names = [layer.name for layer in stack]
+    index = names.index(sys.argv[2]) if len(sys.argv) > 2 else int(np.argmax([layer.thickness if not layer.thick else 0 for layer in stack]))
+    absorber = stack[index]
+    absorber.criSource = 'graded'
+    absorber.criGrading['files'] = [[x, Eg, os.path.join(materialDB, f)] for x, Eg, f in GRADING]
+    absorber.criGrading['mode'] = 'function'
+    absorber.criGrading['value'] = '0.3+0.4*(x/dx-0.5)**2'
+    print('{} ({} wavelengths), graded layer {}'.format(name, len(settings['wavelength']), absorber.name))
+
+    for sublayers in SUBLAYERS:
+        absorber.mesh['meshing'] = 0
+        absorber.mesh['Points'] = 5 * sublayers + 1
+        absorber.makeXnodes()
+        absorber.makeXcollection()
+        absorber.makeXgrading()
+        optics = Optics(name, LayerStack(name, copy.deepcopy(stack), settings, getCRI), references, settings)
+        optics.updateMatrices()
+        tScan = timed(optics.getSystemMatrixVectorized)
+        tQuadratic = timed(lambda: quadraticPSO(optics))
+        coherent = [optics.LayerResults[key] for key in optics.names if not optics.LayerResults[key].thick]
+        PSOs = [PSO for PSO, key in zip(quadraticPSO(optics), optics.names) if not optics.LayerResults[key].thick]
+        deviation = max(np.max(np.abs(layer.PSO_Field - PSO) / np.abs(PSO).max()) for layer, PSO in zip(coherent, PSOs))
+        print('{} layers: system matrices with suffix scan {:.1f} ms, former partial matrices out alone {:.1f} ms '
+              '(max. relative deviation {:.1e})'.format(len(optics.names), tScan * 1e3, tQuadratic * 1e3, deviation))
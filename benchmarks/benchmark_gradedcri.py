@@ -0,0 +1,97 @@
+'''
+Benchmark of the n, k of the sublayers of a graded layer: former loop over the sublayers (np.interp for each
+wavelength or interp1d of the shifted files) vs. all sublayers in a few array operations
+(classes.materials.gradedCRI) and a repeated call with the same compositions from the cache, for both grading models
+
+run from the OptiSim directory:
+    python benchmarks/benchmark_gradedcri.py [wavelength step (nm)]
+'''
+
+import os
+import sys
+import time
+import logging
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+from scipy.interpolate import interp1d
+
+from classes.layer import Layer
+from classes.materials import CRILoader, loadMaterialDB, gradedCRI, resampledCache
+
+SUBLAYERS = [20, 100, 500]
+GRADING = [[0, 1.0, 'CIS_Richter.dat'], [1, 1.68, 'CGS_Minoura.dat']] # x (Ga/(Ga+In)), Eg, cri file
+PROFILE = '0.3+0.4*(x/dx-0.5)**2'
+REPETITIONS = 3
+
+def loopCRI(criGrading, xMole, wvl, advanced):
+    '''
+    n, k of the sublayers one after the other as before (LayerStack.__init__)
+    '''
+    eV = 1239.941 / wvl
+    xMoles = np.array(criGrading['xMoles'])
+    Egs = np.array(criGrading['Egs'])
+    n_idx = np.array(criGrading['n_idc']).T
+    k_idx = np.array(criGrading['k_idc']).T
+    ns, ks = [], []
+    for x in xMole:
+        if x in xMoles:
+            idx = np.nonzero(xMoles == x)
+            ns.append(np.reshape(n_idx[:, idx], len(wvl)))
+            ks.append(np.reshape(k_idx[:, idx], len(wvl)))
+            continue
+        if advanced:
+            idx1 = np.nonzero(xMoles < x)[0][-1]
+            idx2 = np.nonzero(xMoles > x)[0][0]
+            eV1 = eV + (Egs[idx2] - Egs[idx1]) * x
+            n1 = interp1d(eV1, n_idx[:, idx1].T, bounds_error=False)(eV)
+            n2 = interp1d(eV1, n_idx[:, idx2].T, bounds_error=False)(eV)
+            k1 = interp1d(eV1, k_idx[:, idx1].T, bounds_error=False)(eV)
+            k2 = interp1d(eV1, k_idx[:, idx2].T, bounds_error=False)(eV)
+            for k in range(len(wvl)):
+                if np.isnan(n1[k]):
+                    if np.isnan(n1[k-1]):
+                        n1[k], n2[k], k1[k], k2[k] = n1[k+1], n2[k+1], 0, 0
+                    else:
+                        n1[k], n2[k], k1[k], k2[k] = n1[k-1], n2[k-1], 0, 0
+            ns.append(np.mean([n1, n2], axis=0))
+            ks.append(np.mean([k1, k2], axis=0))
+        else:
+            ns.append(np.array([np.interp(x, xMoles, n_idx[i]) for i in range(len(wvl))]))
+            ks.append(np.array([np.interp(x, xMoles, k_idx[i]) for i in range(len(wvl))]))
+    return np.array(ns), np.array(ks)
+
+def timed(function):
+    start = time.perf_counter()
+    for i in range(REPETITIONS):
+        result = function()
+    return (time.perf_counter() - start) / REPETITIONS, result
+
+if __name__ == '__main__':
+    logging.disable(logging.INFO)
+    step = float(sys.argv[1]) if len(sys.argv) > 1 else 1.0
+    wvl = np.arange(300, 1300 + step, step)
+    materialDB = os.path.join(ROOT, 'materialDB')
+    settings = {'wavelength': wvl, 'MaterialDBPath': materialDB}
+    getCRI = CRILoader(loadMaterialDB(materialDB), settings)
+    layer = Layer('graded', 2000, 'graded')
+    layer.criGrading['files'] = [[x, Eg, os.path.join(materialDB, f)] for x, Eg, f in GRADING]
+    layer.criGrading['mode'] = 'function'
+    layer.criGrading['value'] = PROFILE
+    getCRI(layer)
+    print('{} wavelengths, xMole {}'.format(len(wvl), PROFILE))
+
+    for advanced in [False, True]:
+        print('n, k {}:'.format('shifted by Eg (grading advanced)' if advanced else 'interpolated in xMole'))
+        for sublayers in SUBLAYERS:
+            xMole = 0.3 + 0.4 * (np.linspace(0, 1, sublayers) - 0.5)**2
+            tLoop, (nLoop, kLoop) = timed(lambda: loopCRI(layer.criGrading, xMole, wvl, advanced))
+            tVectorized, (n, k) = timed(lambda: gradedCRI(layer.criGrading, xMole, wvl, advanced))
+            resampledCache.clear()
+            gradedCRI(layer.criGrading, xMole, wvl, advanced, layer.criKey)
+            tCached, cached = timed(lambda: gradedCRI(layer.criGrading, xMole, wvl, advanced, layer.criKey))
+            deviation = max(np.max(np.abs(n - nLoop)), np.max(np.abs(k - kLoop)))
+            print('\t{} sublayers: loop {:.1f} ms, vectorized {:.2f} ms (speedup {:.0f}x, max. deviation {:.1e}), '
+                  'cached {:.3f} ms'.format(sublayers, tLoop * 1e3, tVectorized * 1e3, tLoop / tVectorized, deviation, tCached * 1e3))
@@ -0,0 +1,124 @@
+'''
+Benchmark of a fit of several thicknesses and constant n,k to R and EQE with a gradient method of scipy.optimize.minimize:
+gradient by finite differences (one optics calculation per parameter) vs. analytic derivatives (Optics.calcDerivatives)
+the references are simulated with the original parameters, the fit starts from changed values;
+for unpolarized light the analytic gradient is the mean of the gradients of s and p polarization;
+as in the advanced fitting tool the support of the analytic gradient is probed once before the fit
+
+run from the OptiSim directory:
+    python benchmarks/benchmark_gradient.py [stackfile] [method]
+'''
+
+import os
+import sys
+import copy
+import time
+import logging
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+from scipy.optimize import minimize
+
+from classes.errors import *
+from classes.materials import CRILoader, loadMaterialDB
+from classes.simulation import loadStack, updateOptics, chiSquareGradient
+
+class Fit:
+    '''
+    chi square of R and EQE and its gradient for parameters [(layer index, 'thickness', 'n' or 'k'), ...]
+    '''
+    def __init__(self, name, stack, settings, references, getCRI, parameters, data):
+        self.name = name
+        self.stack = copy.deepcopy(stack)
+        self.settings = settings
+        self.references = references
+        self.getCRI = getCRI
+        self.parameters = parameters
+        self.data = data
+        self.optics = None
+        self.values = None
+        self.evaluations = 0
+        self.derivatives = 0
+        
+    def setValues(self, values):
+        dirty = {}
+        for (index, kind), value in zip(self.parameters, values):
+            layer = self.stack[index]
+            if kind == 'thickness':
+                layer.thickness = value
+                layer.makeXnodes()
+                layer.makeXcollection()
+                layer.makeXgrading()
+            else:
+                layer.criConstant[0 if kind == 'n' else 1] = value
+            dirty.setdefault(layer.name, set()).add('thickness' if kind == 'thickness' else 'nk')
+        self.optics = updateOptics(self.optics, self.name, self.stack, self.settings, self.references, self.getCRI, dirty)
+        self.optics.calcStack()
+        self.optics.calcFieldIntensity()
+        self.optics.calcAbsorption()
+        self.optics.calcQE()
+        self.values = np.array(values)
+        self.evaluations += 1
+        
+    def chiSquare(self, values):
+        self.setValues(values)
+        models = {'R reference': self.optics.RspectrumSystem, 'EQE reference': self.optics.EQE}
+        return sum(np.sum(((models[key] - data) / data)**2) for key, data in self.data.items())
+        
+    def gradient(self, values):
+        if self.values is None or not np.array_equal(values, self.values):
+            self.setValues(values)
+        self.derivatives += 1
+        parameters = [(self.stack[index].name, kind) for index, kind in self.parameters]
+        return chiSquareGradient(self.optics, parameters, self.data)
+        
+    def jacobian(self, start):
+        '''
+        gradient function if the analytic gradient is supported, else None (finite differences of scipy)
+        as in FittingAdvancedDlg.on_fitPB_clicked
+        '''
+        try:
+            self.gradient(start)
+            return self.gradient
+        except NotImplementedError as e:
+            print('\t{} --> gradient by finite differences'.format(e))
+            return None
+
+if __name__ == '__main__':
+    logging.disable(logging.INFO)
+    fName = os.path.abspath(sys.argv[1]) if len(sys.argv) > 1 else os.path.join(ROOT, 'stacks', 'StartStack.mop')
+    method = sys.argv[2] if len(sys.argv) > 2 else 'L-BFGS-B'
+    name, settings, defaults, references, stack = loadStack(fName)
+    references = dict([(key, ['', 0]) for key in references])
+    wavelengthRange = settings['wavelengthRange']
+    settings['wavelength'] = np.arange(wavelengthRange[0], wavelengthRange[1] + wavelengthRange[2], wavelengthRange[2])
+    materialDB = settings['MaterialDBPath'] if os.path.isdir(settings['MaterialDBPath']) else os.path.join(ROOT, 'materialDB')
+    getCRI = CRILoader(loadMaterialDB(materialDB), settings)
+    stack = copy.deepcopy(stack)
+    parameters = [(index, 'thickness') for index, layer in enumerate(stack) if not layer.thick and layer.criSource != 'graded']
+    # constant n,k of the thinnest layer
+    index = min(range(len(stack)), key = lambda index: stack[index].thickness)
+    stack[index].criSource = 'constant'
+    stack[index].criConstant = [2.4, 0.1]
+    parameters += [(index, 'n'), (index, 'k')]
+    
+    for label, polarization in [('', settings['polarization']), ('unpolarized light: ', 2)]:
+        fitSettings = dict(settings, polarization = polarization)
+        original = Fit(name, stack, fitSettings, references, getCRI, parameters, {})
+        values = np.array([stack[index].thickness if kind == 'thickness' else stack[index].criConstant[0 if kind == 'n' else 1] 
+                            for index, kind in parameters], dtype = float)
+        original.setValues(values)
+        data = {'R reference': original.optics.RspectrumSystem.copy(), 'EQE reference': original.optics.EQE.copy()}
+        start = values * np.linspace(0.9, 1.1, len(values))
+        print('{}{} ({} wavelengths), {} parameters, method {}'.format(label, name, len(settings['wavelength']), len(parameters), method))
+        
+        for analytic in [False, True]:
+            fit = Fit(name, stack, fitSettings, references, getCRI, parameters, data)
+            begin = time.perf_counter()
+            result = minimize(fit.chiSquare, start, jac = fit.jacobian(start) if analytic else None, method = method, options = {'maxiter': 200})
+            duration = time.perf_counter() - begin
+            print('{}: {} optics calculations, {} derivatives, {:.2f} s, chi square {:.2e}'.format(
+                        'analytic gradient' if analytic else 'finite differences', fit.evaluations, fit.derivatives, 
+                        duration, result.fun))
@@ -0,0 +1,78 @@
+'''
+Benchmark of the sublayers of graded layers: one sublayer per 5 mesh points (default) vs. mesh points merged while
+their composition differs by at most a tolerance (setting 'grading tolerance', classes.layerstack.gradingSublayers),
+number of layers, time and deviation of R and EQE from one sublayer per mesh interval for both grading models
+
+run from the OptiSim directory:
+    python benchmarks/benchmark_grading.py [stackfile] [layer name]
+'''
+
+import os
+import sys
+import copy
+import time
+import logging
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+
+from classes.materials import CRILoader, loadMaterialDB
+from classes.simulation import loadStack
+from classes.layerstack import LayerStack
+from classes.optics import Optics
+
+GRADING = [[0, 1.0, 'CIS_Richter.dat'], [1, 1.68, 'CGS_Minoura.dat']] # x (Ga/(Ga+In)), Eg, cri file
+PROFILE = '0.1+0.5*(x/dx)**4' # flat at the top, steep at the back
+POINTS = 501
+TOLERANCES = [0.001, 0.002, 0.005, 0.01, 0.02, 0.05]
+REPETITIONS = 3
+
+def calculate(name, stack, settings, references, getCRI, tolerance):
+    '''
+    returns time (s), number of layers and R, EQE
+    '''
+    settings = dict(settings)
+    settings['grading tolerance'] = tolerance
+    start = time.perf_counter()
+    for i in range(REPETITIONS):
+        optics = Optics(name, LayerStack(name, copy.deepcopy(stack), settings, getCRI), references, settings)
+        R, EQE = optics.request('RspectrumSystem', 'EQE')
+    return (time.perf_counter() - start) / REPETITIONS, len(optics.names), R, EQE
+
+if __name__ == '__main__':
+    logging.disable(logging.INFO)
+    fName = os.path.abspath(sys.argv[1]) if len(sys.argv) > 1 else os.path.join(ROOT, 'stacks', 'StartStack.mop')
+    name, settings, defaults, references, stack = loadStack(fName)
+    references = dict([(key, ['', 0]) for key in references])
+    wavelengthRange = settings['wavelengthRange']
+    settings['wavelength'] = np.arange(wavelengthRange[0], wavelengthRange[1] + wavelengthRange[2], wavelengthRange[2])
+    materialDB = settings['MaterialDBPath'] if os.path.isdir(settings['MaterialDBPath']) else os.path.join(ROOT, 'materialDB')
+    getCRI = CRILoader(loadMaterialDB(materialDB), settings)
+    names = [layer.name for layer in stack]
+    index = names.index(sys.argv[2]) if len(sys.argv) > 2 else int(np.argmax([layer.thickness if not layer.thick else 0 for layer in stack]))
+    absorber = stack[index]
+    absorber.criSource = 'graded'
+    absorber.criGrading['files'] = [[x, Eg, os.path.join(materialDB, f)] for x, Eg, f in GRADING]
+    absorber.criGrading['mode'] = 'function'
+    absorber.criGrading['value'] = PROFILE
+    absorber.mesh['meshing'] = 0
+    absorber.mesh['Points'] = POINTS
+    absorber.makeXnodes()
+    absorber.makeXcollection()
+    absorber.makeXgrading()
+    print('{} ({} wavelengths), graded layer {} with {} mesh points, xMole {}'.format(name, len(settings['wavelength']), absorber.name, POINTS, PROFILE))
+
+    for advanced in [False, True]:
+        settings['grading advanced'] = advanced
+        print('n, k {}:'.format('shifted by Eg (grading advanced)' if advanced else 'interpolated in xMole'))
+        tFine, nFine, RFine, EQEFine = calculate(name, stack, settings, references, getCRI, 1e-12)
+        print('\tone sublayer per mesh interval: {} layers, {:.1f} ms'.format(nFine, tFine * 1e3))
+        tFixed, nFixed, R, EQE = calculate(name, stack, settings, references, getCRI, 0)
+        print('\tone sublayer per 5 mesh points: {} layers, {:.1f} ms, max. deviation R {:.1e}, EQE {:.1e}'.format(
+                    nFixed, tFixed * 1e3, np.max(np.abs(R - RFine)), np.max(np.abs(EQE - EQEFine))))
+        for tolerance in TOLERANCES:
+            t, n, R, EQE = calculate(name, stack, settings, references, getCRI, tolerance)
+            print('\txMole tolerance {}: {} layers, {:.1f} ms, max. deviation R {:.1e}, EQE {:.1e}'.format(
+                        tolerance, n, t * 1e3, np.max(np.abs(R - RFine)), np.max(np.abs(EQE - EQEFine))))
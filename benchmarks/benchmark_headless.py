@@ -0,0 +1,44 @@
+'''
+Benchmark of the headless API (optisim.py): import time and overhead per run
+
+run from the OptiSim directory:
+    python benchmarks/benchmark_headless.py [stackfile]
+'''
+
+import os
+import sys
+import time
+import logging
+import subprocess
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+RUNS = 20
+
+def importTime():
+    '''
+    import time of optisim in a fresh interpreter and check that no PyQt module is loaded
+    '''
+    code = 'import sys, time; t = time.perf_counter(); import optisim; print(time.perf_counter() - t, any(m.startswith("PyQt") for m in sys.modules))'
+    output = subprocess.check_output([sys.executable, '-W', 'ignore', '-c', code], cwd = ROOT).decode().split()
+    return float(output[0]), output[1] == 'True'
+
+if __name__ == '__main__':
+    logging.disable(logging.INFO)
+    times = [importTime() for i in range(3)]
+    print('import optisim: {:.3f} s (min of 3), PyQt imported: {}'.format(min(t[0] for t in times), times[0][1]))
+
+    import optisim
+    fName = sys.argv[1] if len(sys.argv) > 1 else os.path.join(ROOT, 'stacks', 'StartStack.mop')
+    for calculations in [[0], [0, 1, 2, 3, 4]]:
+        total = 0
+        calc = 0
+        for i in range(RUNS):
+            name, settings, defaults, references, stack = optisim.loadStack(fName)
+            start = time.perf_counter()
+            optics = optisim.run(stack, settings, None, calculations, os.path.join(ROOT, 'materialDB'), name)
+            total += time.perf_counter() - start
+            calc += optics.scalars['creation time (s)'] + optics.scalars['calc. time (s)']
+        print('calculations {}: run {:.2f} ms, LayerStack + Optics {:.2f} ms, overhead {:.2f} ms per run'.format(
+                calculations, total / RUNS * 1e3, calc / RUNS * 1e3, (total - calc) / RUNS * 1e3))
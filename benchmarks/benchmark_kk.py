@@ -0,0 +1,78 @@
+'''
+Benchmark of the Kramers-Kronig transform of oscillator models (classes.dielectricfunction):
+former loop of two trapezoidal integrals per energy vs. kernel matrix (first call with building the kernel 
+and cached), time and max. deviation of e1 of a Lorentz oscillator from its analytic e1 for increasing grid sizes,
+and time of calcFunction per iteration of an oscillator fit
+
+run from the OptiSim directory:
+    python benchmarks/benchmark_kk.py [end of the energy range (eV)]
+'''
+
+import os
+import sys
+import time
+import logging
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+from scipy import integrate
+
+from classes.materials import resampledCache
+from classes.dielectricfunction import KKR, lorentz, calcFunction
+
+POINTS = [100, 400, 1000, 3000]
+LORENTZ = [1, 3, 0.2] # Amp, En, Br
+COMPARED = [0.5, 6] # eV, deviation only inside (e1 of the truncated transform differs at the ends)
+OSCILLATORS = [{'name': 'Tauc-Lorentz', 'values': [20, 4, 0.5, 3.5], 'active': True}, 
+               {'name': 'Gaussian', 'values': [1, 3, 0.2], 'active': True}, 
+               {'name': 'Lorentz', 'values': [1, 5, 0.5], 'active': True}]
+REPETITIONS = 5
+
+def loopKKR(e2, eV):
+    '''
+    former KKR: trapezoidal integrals below and above each energy (uniform grid)
+    '''
+    E = eV
+    e1 = np.zeros(len(eV))
+    e1[0] = 1 + (2 / np.pi) * integrate.trapz(E[1:-1] * e2[1:-1] / (E[1:-1]**2 - E[0])) * (E[3]-E[2])
+    for i in range(1, len(E)):
+        e1_part1 = integrate.trapz(E[0:i-1] * e2[0:i-1] / (E[0:i-1]**2 - E[i]**2))
+        e1_part2 = integrate.trapz(E[i+1:-1] * e2[i+1:-1] / (E[i+1:-1]**2 - E[i]**2))
+        e1[i] = 1 + (2 / np.pi) * (e1_part1 + e1_part2) * (E[3]-E[2])
+    return e1
+
+def timed(function):
+    start = time.perf_counter()
+    for i in range(REPETITIONS):
+        result = function()
+    return (time.perf_counter() - start) / REPETITIONS, result
+
+if __name__ == '__main__':
+    logging.disable(logging.INFO)
+    end = float(sys.argv[1]) if len(sys.argv) > 1 else 20
+    print('Lorentz oscillator {} (Amp, En, Br) from 0.01 to {} eV, deviation of e1 between {} and {} eV'.format(LORENTZ, end, *COMPARED))
+    for points in POINTS:
+        eV = np.linspace(0.01, end, points)
+        e = lorentz(eV, *LORENTZ)
+        inside = (eV > COMPARED[0]) & (eV < COMPARED[1])
+        tLoop, e1Loop = timed(lambda: loopKKR(e.imag, eV))
+        resampledCache.clear()
+        start = time.perf_counter()
+        KKR(e.imag, eV)
+        tFirst = time.perf_counter() - start
+        tKernel, e1Kernel = timed(lambda: KKR(e.imag, eV))
+        print('{} energies: loop {:.2f} ms (max. deviation {:.1e}), kernel {:.2f} ms with building, {:.3f} ms cached '
+              '(speedup {:.0f}x, max. deviation {:.1e})'.format(points, tLoop * 1e3, np.max(np.abs(e1Loop - 1 - e.real)[inside]), 
+                                                                tFirst * 1e3, tKernel * 1e3, tLoop / tKernel, 
+                                                                np.max(np.abs(e1Kernel - 1 - e.real)[inside])))
+
+    for points in POINTS:
+        dielectricFunction = {'e0': 1.0, 'oscillators': OSCILLATORS, 'spectral range': [0.5, 6.0], 'points': points}
+        start = time.perf_counter()
+        calcFunction(dielectricFunction)
+        tFirst = time.perf_counter() - start
+        t, result = timed(lambda: calcFunction(dielectricFunction))
+        print('calcFunction of {} oscillators on {} energies: first call {:.2f} ms, {:.2f} ms per fit iteration'.format(
+                    len(OSCILLATORS), points, tFirst * 1e3, t * 1e3))
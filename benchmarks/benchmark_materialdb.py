@@ -0,0 +1,76 @@
+'''
+Benchmark of the compiled material database: parsing of the cri text files vs. the binary store,
+cold creation of a LayerStack (empty material cache) and startup in a fresh interpreter, each before and after compiling
+
+run from the OptiSim directory:
+    python benchmarks/benchmark_materialdb.py [stackfile]
+'''
+
+import os
+import sys
+import time
+import shutil
+import logging
+import tempfile
+import subprocess
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+
+from classes.materials import materialCache, loadMaterialDB, compileMaterialDB, criLoadFile, CRILoader, STOREFILE, INDEXFILE
+from classes.simulation import loadStack
+from classes.layerstack import LayerStack
+
+RUNS = 5
+
+def loadAll(materialDB):
+    materialCache.clear()
+    start = time.perf_counter()
+    for fName in materialDB.values():
+        materialCache.load(fName, criLoadFile)
+    return time.perf_counter() - start
+
+def coldStack(fName, materialDB):
+    materialCache.clear()
+    name, settings, defaults, references, stack = loadStack(fName)
+    wavelengthRange = settings['wavelengthRange']
+    settings['wavelength'] = np.arange(wavelengthRange[0], wavelengthRange[1] + wavelengthRange[2], wavelengthRange[2])
+    start = time.perf_counter()
+    LayerStack(name, stack, settings, CRILoader(materialDB, settings))
+    return time.perf_counter() - start
+
+def startup(fName, path):
+    '''
+    import, loading of the material database and cold LayerStack in a fresh interpreter
+    '''
+    code = ('import time; t = time.perf_counter(); import optisim; '
+            'name, settings, defaults, references, stack = optisim.loadStack({!r}); '
+            'optisim.run(stack, settings, materialDB = {!r}); print(time.perf_counter() - t)').format(fName, path)
+    return float(subprocess.check_output([sys.executable, '-W', 'ignore', '-c', code], cwd = ROOT).decode())
+
+def report(label, fName, path):
+    materialDB = loadMaterialDB(path)
+    print('{}:'.format(label))
+    print('\tload {} materials: {:.2f} ms'.format(len(materialDB), min(loadAll(materialDB) for i in range(RUNS)) * 1e3))
+    print('\tcold LayerStack: {:.2f} ms'.format(min(coldStack(fName, materialDB) for i in range(RUNS)) * 1e3))
+    print('\tstartup + first run (fresh process): {:.1f} ms'.format(min(startup(fName, path) for i in range(3)) * 1e3))
+
+if __name__ == '__main__':
+    logging.disable(logging.INFO)
+    fName = os.path.abspath(sys.argv[1]) if len(sys.argv) > 1 else os.path.join(ROOT, 'stacks', 'StartStack.mop')
+    # work on a copy, the material database of OptiSim is not changed
+    path = os.path.join(tempfile.mkdtemp(), 'materialDB')
+    shutil.copytree(os.path.join(ROOT, 'materialDB'), path)
+    for file in [STOREFILE, INDEXFILE]:
+        if os.path.isfile(os.path.join(path, file)):
+            os.remove(os.path.join(path, file))
+    try:
+        report('text files', fName, path)
+        start = time.perf_counter()
+        compileMaterialDB(path)
+        print('compile: {:.2f} ms'.format((time.perf_counter() - start) * 1e3))
+        report('compiled store', fName, path)
+    finally:
+        shutil.rmtree(os.path.dirname(path))
@@ -0,0 +1,87 @@
+'''
+Benchmark of the depth nodes: fixed number of points and constant depth step vs. adaptive nodes from n, k 
+(mesh mode 3, classes.layer.adaptiveNodes) for decreasing tolerances, number of nodes, time and deviation of 
+the layerwise absorption and EQE from a fine mesh, stack with a glass substrate on top (thick layer)
+
+run from the OptiSim directory:
+    python benchmarks/benchmark_mesh.py [stackfile]
+'''
+
+import os
+import sys
+import copy
+import time
+import logging
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+
+from classes.layer import Layer
+from classes.materials import CRILoader, loadMaterialDB
+from classes.simulation import loadStack
+from classes.layerstack import LayerStack
+from classes.optics import Optics
+
+GLASS = ['glass', 1e6, [1.5, 1e-7]] # name, thickness (nm), constant n, k
+FINE = 0.05 # depth step (nm) of the reference (thick layer 1001 points)
+TOLERANCES = [0.01, 0.001, 0.0001]
+OUTPUTS = ['absorption layerwise (mA/cm²) ', 'EQE']
+REPETITIONS = 3
+
+def meshed(stack, meshing, value = None):
+    '''
+    copy of stack with the meshing of all layers (0: value points, None: points for a depth step FINE, 
+    1: depth step value, 3: adaptive with tolerance value)
+    '''
+    stack = copy.deepcopy(stack)
+    for layer in stack:
+        layer.mesh['meshing'] = meshing
+        if meshing == 0:
+            layer.mesh['Points'] = value if value else int(np.ceil(layer.thickness / FINE)) + 1
+        elif meshing == 1:
+            layer.mesh['Dist'] = value
+        elif meshing == 3:
+            layer.mesh['tolerance'] = value
+        if layer.thick and meshing != 3:
+            layer.mesh['meshing'] = 0 # 1001 points in a thick substrate (except adaptive)
+            layer.mesh['Points'] = 1001
+        layer.makeXnodes()
+        layer.makeXcollection()
+        layer.makeXgrading()
+    return stack
+
+def calculate(name, stack, settings, references, getCRI):
+    '''
+    returns time (s), number of depth nodes and layerwise absorption (mA/cm²), EQE
+    '''
+    start = time.perf_counter()
+    for i in range(REPETITIONS):
+        optics = Optics(name, LayerStack(name, copy.deepcopy(stack), settings, getCRI), references, settings)
+        absorption, EQE = optics.request(*OUTPUTS)
+    return (time.perf_counter() - start) / REPETITIONS, optics.layerstack.meshPoints, np.array(absorption), EQE
+
+if __name__ == '__main__':
+    logging.disable(logging.INFO)
+    fName = os.path.abspath(sys.argv[1]) if len(sys.argv) > 1 else os.path.join(ROOT, 'stacks', 'StartStack.mop')
+    name, settings, defaults, references, stack = loadStack(fName)
+    references = dict([(key, ['', 0]) for key in references])
+    wavelengthRange = settings['wavelengthRange']
+    settings['wavelength'] = np.arange(wavelengthRange[0], wavelengthRange[1] + wavelengthRange[2], wavelengthRange[2])
+    materialDB = settings['MaterialDBPath'] if os.path.isdir(settings['MaterialDBPath']) else os.path.join(ROOT, 'materialDB')
+    getCRI = CRILoader(loadMaterialDB(materialDB), settings)
+    glass = Layer(GLASS[0], GLASS[1], 'constant', criConstant = GLASS[2])
+    glass.thick = True
+    stack = [glass] + stack
+    print('{} ({} wavelengths) below {} mm {}'.format(name, len(settings['wavelength']), GLASS[1] * 1e-6, glass.name))
+
+    fine = meshed(stack, 0)
+    tFine, nFine, absorptionFine, EQEFine = calculate(name, fine, settings, references, getCRI)
+    print('reference depth step {} nm: {} nodes, {:.1f} ms'.format(FINE, nFine, tFine * 1e3))
+    meshes = [('100 points per layer', 0, 100), ('depth step 1 nm', 1, 1)] + \
+             [('adaptive, tolerance {}'.format(tolerance), 3, tolerance) for tolerance in TOLERANCES]
+    for label, meshing, value in meshes:
+        t, n, absorption, EQE = calculate(name, meshed(stack, meshing, value), settings, references, getCRI)
+        print('{}: {} nodes, {:.1f} ms, max. deviation layerwise absorption {:.1e} mA/cm², EQE {:.1e}'.format(
+                    label, n, t * 1e3, np.max(np.abs(absorption - absorptionFine)), np.max(np.abs(EQE - EQEFine))))
@@ -0,0 +1,78 @@
+'''
+Benchmark of both polarizations: ellipsometry from two runs of the stack (s and p) vs. stack optics with one pass of
+the s and p system matrices (Optics.calcEllipsometry), and unpolarized light as mean of an s and a p simulation
+vs. one simulation with settings['polarization'] = 2
+
+run from the OptiSim directory:
+    python benchmarks/benchmark_polarization.py [stackfile] [repetitions]
+'''
+
+import os
+import sys
+import copy
+import time
+import logging
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+
+from classes.materials import CRILoader, loadMaterialDB
+from classes.simulation import loadStack
+from classes.layerstack import LayerStack
+from classes.optics import Optics
+
+CALCULATIONS = ['calcStack', 'calcFieldIntensity', 'calcAbsorption', 'calcQE', 'calcGeneration']
+
+def calculate(name, stack, settings, references, getCRI, polarization, calculations):
+    optics = Optics(name, LayerStack(name, copy.deepcopy(stack), settings, getCRI), references, dict(settings, polarization = polarization))
+    for calculation in calculations:
+        getattr(optics, calculation)()
+    return optics
+
+def ellipsometryTwoRuns(name, stack, settings, references, getCRI):
+    '''
+    psi and Delta from the complete coherent system matrices of an s and a p calculation of the stack
+    '''
+    rs, rp = [calculate(name, stack, settings, references, getCRI, pol, ['calcStack']).SystemFieldMatrix for pol in [0, 1]]
+    rs = rs[:, 1, 0] / rs[:, 0, 0]
+    rp = rp[:, 1, 0] / rp[:, 0, 0]
+    degree = np.pi/180
+    return np.arctan(abs(rp/rs))/degree, np.angle(-rp/rs)/degree
+
+def timed(function, repetitions):
+    start = time.perf_counter()
+    for i in range(repetitions):
+        result = function()
+    return (time.perf_counter() - start) / repetitions, result
+
+if __name__ == '__main__':
+    logging.disable(logging.INFO)
+    fName = os.path.abspath(sys.argv[1]) if len(sys.argv) > 1 else os.path.join(ROOT, 'stacks', 'StartStack.mop')
+    repetitions = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    name, settings, defaults, references, stack = loadStack(fName)
+    references = dict([(key, ['', 0]) for key in references])
+    wavelengthRange = settings['wavelengthRange']
+    settings['wavelength'] = np.arange(wavelengthRange[0], wavelengthRange[1] + wavelengthRange[2], wavelengthRange[2])
+    settings['angle'] = 45
+    materialDB = settings['MaterialDBPath'] if os.path.isdir(settings['MaterialDBPath']) else os.path.join(ROOT, 'materialDB')
+    getCRI = CRILoader(loadMaterialDB(materialDB), settings)
+    print('{} ({} layers, {} wavelengths), angle of incidence 45°'.format(name, len(stack), len(settings['wavelength'])))
+
+    tTwo, (psi, delta) = timed(lambda: ellipsometryTwoRuns(name, stack, settings, references, getCRI), repetitions)
+    tOne, optics = timed(lambda: calculate(name, stack, settings, references, getCRI, 0, ['calcStack', 'calcEllipsometry']), repetitions)
+    deviation = max(np.max(np.abs(psi - optics.psi)), np.max(np.abs(delta - optics.delta)))
+    print('stack optics and ellipsometry, s and p run: {:.1f} ms'.format(tTwo * 1e3))
+    print('stack optics and ellipsometry, one pass for s and p: {:.1f} ms (speedup {:.1f}x, max. deviation {:.1e}°)'.format(
+                tOne * 1e3, tTwo / tOne, deviation))
+
+    runs = lambda: [calculate(name, stack, settings, references, getCRI, pol, CALCULATIONS) for pol in [0, 1]]
+    tTwo, (s, p) = timed(runs, repetitions)
+    tOne, unpolarized = timed(lambda: calculate(name, stack, settings, references, getCRI, 2, CALCULATIONS), repetitions)
+    deviation = 0
+    for key in ['RspectrumSystem', 'TspectrumSystem', 'EQE', 'G_x']:
+        mean = (np.array(getattr(s, key)) + np.array(getattr(p, key))) / 2
+        deviation = max(deviation, np.max(np.abs(np.array(getattr(unpolarized, key)) - mean)) / np.max(np.abs(mean)))
+    print('unpolarized as mean of s and p simulation: {:.1f} ms'.format(tTwo * 1e3))
+    print('unpolarized in one simulation: {:.1f} ms (speedup {:.1f}x, max. relative deviation {:.1e})'.format(tOne * 1e3, tTwo / tOne, deviation))
@@ -0,0 +1,103 @@
+'''
+Benchmark of repeat blocks (Layer.repeat): Bragg reflector of PAIRS high/low index pairs on top of the stack
+entered as explicit layers vs. one repeat block whose periods are collapsed into one matrix power
+(LayerStack.expandRepeatBlocks, Optics.periodMatrices), compared with a stack of 6 layers;
+for an absorbing high index layer also layerwise absorption, EQE and the energy balance 
+(sum of the layerwise absorption vs. 1 - R - T) of explicit layers and repeat block (Optics.blockAbsorption)
+and the Lambert-Beer absorbance (Optics.blockLambertBeer)
+
+run from the OptiSim directory:
+    python benchmarks/benchmark_repeat.py [stackfile] [pairs]
+'''
+
+import os
+import sys
+import copy
+import time
+import logging
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+
+from classes.layer import Layer
+from classes.materials import CRILoader, loadMaterialDB
+from classes.simulation import loadStack
+from classes.layerstack import LayerStack
+from classes.optics import Optics
+
+PERIOD = [['high', 60, [2.3, 0.0]], ['low', 95, [1.45, 0.0]]] # name, thickness (nm), constant n, k
+ABSORBING = 0.05 # k of the high index layer for the energy balance
+OUTPUTS = ['RspectrumSystem', 'TspectrumSystem', 'psi', 'delta']
+LAYERWISE = ['EQE', 'absorption layerwise (mA/cm²) ', 'absorbance LB (%)']
+REPETITIONS = 5
+
+def bragg(pairs, repeat, k = 0.0):
+    '''
+    layers of the Bragg reflector, one repeat block or all periods as explicit layers, k of the high index layer
+    '''
+    layers = [Layer(name, thickness, 'constant', criConstant = list(cri)) for name, thickness, cri in PERIOD]
+    layers[0].criConstant[1] = k
+    if repeat:
+        layers[0].repeat = {'layers': len(layers), 'times': pairs, 'show': []}
+        return layers
+    periods = []
+    for no in range(pairs):
+        for layer in layers:
+            periodLayer = copy.deepcopy(layer)
+            periodLayer.name = '{}_period{}'.format(layer.name, no)
+            periods.append(periodLayer)
+    return periods
+
+def calculate(name, stack, settings, references, getCRI):
+    '''
+    returns time (s) of layer stack, matrices, stack optics and ellipsometry and the outputs
+    '''
+    start = time.perf_counter()
+    for i in range(REPETITIONS):
+        optics = Optics(name, LayerStack(name, copy.deepcopy(stack), settings, getCRI), references, settings)
+        values = optics.request(*OUTPUTS)
+    return (time.perf_counter() - start) / REPETITIONS, len(optics.names), np.concatenate(values)
+
+def energyBalance(name, stack, settings, references, getCRI):
+    '''
+    EQE, absorption (mA/cm²) of the layers of the Bragg reflector (periods summed up),
+    max. deviation of the sum of the layerwise absorption from 1 - R - T and Lambert-Beer absorbance (%)
+    '''
+    optics = Optics(name, LayerStack(name, copy.deepcopy(stack), settings, getCRI), references, settings)
+    EQE, layerwise, absorbanceLB = optics.request(*LAYERWISE)
+    names = [layer.name for layer in optics.layerstack.stack_rough]
+    bragg = [sum([value for layerName, value in zip(names, layerwise) if layerName.split('_period')[0] == periodName]) 
+                for periodName, thickness, cri in PERIOD]
+    absorption = sum([optics.LayerResults[key].absorption for key in optics.names])
+    return EQE, np.array(bragg), np.max(np.abs(absorption - optics.AspectrumSystem)), absorbanceLB
+
+if __name__ == '__main__':
+    logging.disable(logging.INFO)
+    fName = os.path.abspath(sys.argv[1]) if len(sys.argv) > 1 else os.path.join(ROOT, 'stacks', 'StartStack.mop')
+    pairs = int(sys.argv[2]) if len(sys.argv) > 2 else 40
+    name, settings, defaults, references, stack = loadStack(fName)
+    references = dict([(key, ['', 0]) for key in references])
+    wavelengthRange = settings['wavelengthRange']
+    settings['wavelength'] = np.arange(wavelengthRange[0], wavelengthRange[1] + wavelengthRange[2], wavelengthRange[2])
+    materialDB = settings['MaterialDBPath'] if os.path.isdir(settings['MaterialDBPath']) else os.path.join(ROOT, 'materialDB')
+    getCRI = CRILoader(loadMaterialDB(materialDB), settings)
+    print('{} ({} layers, {} wavelengths) with a Bragg reflector of {} pairs'.format(name, len(stack), len(settings['wavelength']), pairs))
+
+    sixLayers = bragg(3, False)[:6 - len(stack)] + stack if len(stack) < 6 else stack[:6]
+    tSix, nSix, values = calculate(name, sixLayers, settings, references, getCRI)
+    tExplicit, nExplicit, explicit = calculate(name, bragg(pairs, False) + stack, settings, references, getCRI)
+    tRepeat, nRepeat, repeated = calculate(name, bragg(pairs, True) + stack, settings, references, getCRI)
+    print('stack of 6 layers: {:.1f} ms'.format(tSix * 1e3))
+    print('explicit layers ({} in the layer sequence): {:.1f} ms'.format(nExplicit, tExplicit * 1e3))
+    print('repeat block ({} in the layer sequence): {:.1f} ms (speedup {:.1f}x, max. deviation {:.1e})'.format(
+                nRepeat, tRepeat * 1e3, tExplicit / tRepeat, np.max(np.abs(explicit - repeated))))
+
+    EQE, absorption, balance, LB = energyBalance(name, bragg(pairs, False, ABSORBING) + stack, settings, references, getCRI)
+    EQEBlock, absorptionBlock, balanceBlock, LBBlock = energyBalance(name, bragg(pairs, True, ABSORBING) + stack, settings, references, getCRI)
+    print('k = {} in the high index layer: absorption of the Bragg reflector (mA/cm²) explicit {}, repeat block {}'.format(
+                ABSORBING, np.round(absorption, 4), np.round(absorptionBlock, 4)))
+    print('\tmax. deviation of the layerwise absorption from 1 - R - T: explicit layers {:.1e}, repeat block {:.1e}; '
+          'max. deviation of EQE {:.1e}'.format(balance, balanceBlock, np.max(np.abs(EQE - EQEBlock))))
+    print('\tLambert-Beer absorbance (%): explicit layers {:.4f}, repeat block {:.4f}'.format(LB, LBBlock))
@@ -0,0 +1,59 @@
+'''
+Benchmark of several illumination spectra: one simulation per spectrum vs. one simulation and re-weighting (Optics.evaluateSpectra)
+
+run from the OptiSim directory:
+    python benchmarks/benchmark_spectra.py [stackfile]
+'''
+
+import os
+import sys
+import copy
+import time
+import logging
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+
+from classes.errors import *
+from classes.materials import CRILoader, loadMaterialDB
+from classes.simulation import loadStack, simulate
+from classes.spectra import spectrumLibrary
+
+CALCULATIONS = [0, 1, 2, 3, 4]
+KEYS = ['absorbance (mA/cm²)', 'reflectance (mA/cm²)', 'generated current (mA/cm²)']
+
+if __name__ == '__main__':
+    logging.disable(logging.INFO)
+    fName = os.path.abspath(sys.argv[1]) if len(sys.argv) > 1 else os.path.join(ROOT, 'stacks', 'StartStack.mop')
+    name, settings, defaults, references, stack = loadStack(fName)
+    references = dict([(key, ['', 0]) for key in references])
+    wavelengthRange = settings['wavelengthRange']
+    settings['wavelength'] = np.arange(wavelengthRange[0], wavelengthRange[1] + wavelengthRange[2], wavelengthRange[2])
+    materialDB = settings['MaterialDBPath'] if os.path.isdir(settings['MaterialDBPath']) else os.path.join(ROOT, 'materialDB')
+    getCRI = CRILoader(loadMaterialDB(materialDB), settings)
+    spectra = []
+    for spectrum in spectrumLibrary.available():
+        try:
+            spectrumLibrary.load(spectrum)
+            spectra.append(spectrum)
+        except LoadError:
+            continue # files with other format
+    print('{} spectra, calculations {}'.format(len(spectra), CALCULATIONS))
+
+    start = time.perf_counter()
+    simulated = []
+    for spectrum in spectra:
+        optics = simulate(name, copy.deepcopy(stack), dict(settings, spectrum = spectrum), references, CALCULATIONS, getCRI)
+        simulated.append(optics.scalars)
+    tSimulate = time.perf_counter() - start
+
+    start = time.perf_counter()
+    optics = simulate(name, copy.deepcopy(stack), settings, references, CALCULATIONS, getCRI)
+    weighted = optics.evaluateSpectra(spectra)
+    tWeight = time.perf_counter() - start
+
+    deviation = max(abs(a[key] - b[key]) / max(abs(a[key]), 1e-30) for a, b in zip(simulated, weighted) for key in KEYS)
+    print('one simulation per spectrum: {:.1f} ms'.format(tSimulate * 1e3))
+    print('one simulation + re-weighting: {:.1f} ms (speedup {:.1f}x, max. relative deviation {:.1e})'.format(tWeight * 1e3, tSimulate / tWeight, deviation))
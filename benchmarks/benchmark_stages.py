@@ -0,0 +1,68 @@
+'''
+Benchmark of the calculation stages of Optics (classes.optics.STAGES):
+all calculations of a fit iteration as before vs. only the stages of the requested output (Optics.request),
+and all stages one after the other vs. independent stages (ellipsometry, field intensity ...) in threads
+
+run from the OptiSim directory:
+    python benchmarks/benchmark_stages.py [stackfile] [repetitions]
+'''
+
+import os
+import sys
+import copy
+import time
+import logging
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+
+from classes.materials import CRILoader, loadMaterialDB
+from classes.simulation import loadStack
+from classes.layerstack import LayerStack
+from classes.optics import Optics
+
+ALL = ['calcStack', 'calcFieldIntensity', 'calcAbsorption', 'calcQE', 'calcEllipsometry'] # former FittingAdvancedDlg.runOptics
+OUTPUTS = ['RspectrumSystem', 'psi', 'EQE']
+
+def timed(function, repetitions):
+    start = time.perf_counter()
+    for i in range(repetitions):
+        result = function()
+    return (time.perf_counter() - start) / repetitions, result
+
+def allCalculations(name, stack, settings, references, getCRI, output):
+    optics = Optics(name, LayerStack(name, copy.deepcopy(stack), settings, getCRI), references, settings)
+    for calculation in ALL:
+        getattr(optics, calculation)()
+    return getattr(optics, output)
+
+def requested(name, stack, settings, references, getCRI, outputs, threads = False):
+    optics = Optics(name, LayerStack(name, copy.deepcopy(stack), settings, getCRI), references, settings)
+    return optics.request(*outputs, threads = threads)
+
+if __name__ == '__main__':
+    logging.disable(logging.INFO)
+    fName = os.path.abspath(sys.argv[1]) if len(sys.argv) > 1 else os.path.join(ROOT, 'stacks', 'StartStack.mop')
+    repetitions = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    name, settings, defaults, references, stack = loadStack(fName)
+    references = dict([(key, ['', 0]) for key in references])
+    wavelengthRange = settings['wavelengthRange']
+    settings['wavelength'] = np.arange(wavelengthRange[0], wavelengthRange[1] + wavelengthRange[2], wavelengthRange[2])
+    materialDB = settings['MaterialDBPath'] if os.path.isdir(settings['MaterialDBPath']) else os.path.join(ROOT, 'materialDB')
+    getCRI = CRILoader(loadMaterialDB(materialDB), settings)
+    print('{} ({} layers, {} wavelengths)'.format(name, len(stack), len(settings['wavelength'])))
+
+    for output in OUTPUTS:
+        tAll, reference = timed(lambda: allCalculations(name, stack, settings, references, getCRI, output), repetitions)
+        tRequest, value = timed(lambda: requested(name, stack, settings, references, getCRI, [output]), repetitions)
+        print('{}: all calculations {:.1f} ms, requested stages {:.1f} ms (speedup {:.1f}x, max. deviation {:.1e})'.format(
+                    output, tAll * 1e3, tRequest * 1e3, tAll / tRequest, np.max(np.abs(reference - value))))
+
+    outputs = ['EQE', 'psi', 'delta', 'generated current (mA/cm²)', 'absorbance LB (mA/cm²)']
+    tSequential, sequential = timed(lambda: requested(name, stack, settings, references, getCRI, outputs), repetitions)
+    tThreads, parallel = timed(lambda: requested(name, stack, settings, references, getCRI, outputs, True), repetitions)
+    deviation = max(np.max(np.abs(np.array(a) - np.array(b))) for a, b in zip(sequential, parallel))
+    print('all stages one after the other {:.1f} ms, independent stages in threads {:.1f} ms (speedup {:.1f}x, max. deviation {:.1e})'.format(
+                tSequential * 1e3, tThreads * 1e3, tSequential / tThreads, deviation))
@@ -0,0 +1,64 @@
+'''
+Benchmark of adaptive wavelengths (setting 'wavelength tolerance', classes.simulation.adaptiveWavelengths):
+all wavelengths of a 1 nm grid vs. non-uniform grids for decreasing tolerances, number of wavelengths of the grid 
+and calculated during the refinement, time and relative deviation of the integrated scalars, 
+for the stack and the stack below a transparent film with interference fringes
+
+run from the OptiSim directory:
+    python benchmarks/benchmark_wavelengths.py [stackfile] [film thickness (nm)]
+'''
+
+import os
+import sys
+import copy
+import time
+import logging
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+
+from classes.layer import Layer
+from classes.materials import CRILoader, loadMaterialDB
+from classes.simulation import loadStack, simulate, adaptiveWavelengths
+
+STEP = 1 # nm
+FILM = [1.5, 0.0] # constant n, k of the film
+TOLERANCES = [0.01, 0.001, 0.0001]
+CALCULATIONS = [0, 1, 2, 3, 4] # up to generation
+SCALARS = ['absorbance (%)', 'reflectance (%)', 'absorbance (mA/cm²)', 'reflectance (mA/cm²)', 'generated current (mA/cm²)']
+REPETITIONS = 3
+
+def calculate(name, stack, settings, references, getCRI):
+    '''
+    returns time (s) and Optics
+    '''
+    start = time.perf_counter()
+    for i in range(REPETITIONS):
+        optics = simulate(name, copy.deepcopy(stack), settings, references, CALCULATIONS, getCRI)
+    return (time.perf_counter() - start) / REPETITIONS, optics
+
+if __name__ == '__main__':
+    logging.disable(logging.INFO)
+    fName = os.path.abspath(sys.argv[1]) if len(sys.argv) > 1 else os.path.join(ROOT, 'stacks', 'StartStack.mop')
+    film = float(sys.argv[2]) if len(sys.argv) > 2 else 3000
+    name, settings, defaults, references, stack = loadStack(fName)
+    references = dict([(key, ['', 0]) for key in references])
+    wavelengthRange = settings['wavelengthRange']
+    settings['wavelength'] = np.arange(wavelengthRange[0], wavelengthRange[1] + STEP, STEP)
+    materialDB = settings['MaterialDBPath'] if os.path.isdir(settings['MaterialDBPath']) else os.path.join(ROOT, 'materialDB')
+    getCRI = CRILoader(loadMaterialDB(materialDB), settings)
+
+    for label, layers in [(name, stack), ('{} below {} nm film'.format(name, film), [Layer('film', film, 'constant', criConstant = FILM)] + stack)]:
+        tUniform, uniform = calculate(name, layers, settings, references, getCRI)
+        Jmax = uniform.scalars['Jmax (mA/cm²)']
+        print('{}: {} wavelengths {:.1f} ms'.format(label, len(uniform.wavelength), tUniform * 1e3))
+        for tolerance in TOLERANCES:
+            adaptive = dict(settings, **{'wavelength tolerance': tolerance})
+            t, optics = calculate(name, layers, adaptive, references, getCRI)
+            calculated = adaptiveWavelengths(name, layers, settings, references, getCRI, tolerance, True)[1]
+            deviation = max([abs(optics.scalars[key] - uniform.scalars[key]) / (100 if '%' in key else Jmax) for key in SCALARS])
+            print('\ttolerance {}: {} wavelengths ({} calculated during refinement), {:.1f} ms (speedup {:.1f}x), '
+                  'max. relative deviation of the scalars {:.1e}'.format(tolerance, len(optics.wavelength), calculated, 
+                                                                        t * 1e3, tUniform / t, deviation))
@@ -0,0 +1,307 @@
+'''
+batch simulations (parameter variations) independent of the GUI
+'''
+
+import os
+import copy
+import logging
+import itertools
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+
+from classes.errors import *
+from classes.materials import CRILoader
+from classes.simulation import simulate
+
+def batchValues(valueRange):
+    '''
+    values of a batch variable from [start, step, stop]
+    '''
+    start, step, stop = valueRange
+    return np.arange(start, stop + step, step)
+
+def setParameter(stack, settings, variable, value):
+    '''
+    set the parameter of a batch variable [category, name, parameter, range] to value in stack and settings
+    returns the part of the result name or None if the parameter can not be varied
+    '''
+    category, name, parameter = variable[0], variable[1], variable[2]
+    if category == 0:
+        # case of layer parametervariation
+        layers = [layer for layer in stack if layer.name == name]
+        if not layers:
+            return None
+        layer = layers[-1]
+        if parameter == 'thickness':
+            layer.thickness = value
+            layer.makeXnodes()
+            layer.makeXcollection()
+            layer.makeXgrading()
+            return name + ' t = '
+        elif parameter == 'roughness' and layer.srough == True:
+            layer.sroughThickness = value
+            return name + ' rough t = '
+        elif parameter == 'Haze R' and layer.srough == True:
+            layer.sroughHazeR = value
+            return name + ' haze R = '
+        elif parameter == 'Haze T' and layer.srough == True:
+            layer.sroughHazeT = value
+            return name + ' haze T = '
+        elif parameter == 'constant n' and layer.criSource == 'constant':
+            layer.criConstant = [float(value), layer.criConstant[1]]
+            return name + ' n = '
+        elif parameter == 'constant k' and layer.criSource == 'constant':
+            layer.criConstant = [layer.criConstant[0], float(value)]
+            return name + ' k = '
+        elif parameter == 'diffusion length' and layer.collection['source'] == 'from diffusion length':
+            layer.collection['diffLength'] = value
+            layer.makeXcollection()
+            return name + ' D_l = '
+    elif category == 1:
+        # case of layer stack variation
+        if name == 'excitation' and parameter == 'angle of incidence':
+            settings['angle'] = value
+            return ' angle = '
+    return None
+
+def getParameter(stack, settings, variable):
+    '''
+    current value of the parameter of a batch variable (None if it can not be varied)
+    '''
+    category, name, parameter = variable[0], variable[1], variable[2]
+    if category == 0:
+        layers = [layer for layer in stack if layer.name == name]
+        if not layers:
+            return None
+        layer = layers[-1]
+        values = {  'thickness': layer.thickness, 
+                    'roughness': layer.sroughThickness, 
+                    'Haze R': layer.sroughHazeR, 
+                    'Haze T': layer.sroughHazeT, 
+                    'constant n': layer.criConstant[0], 
+                    'constant k': layer.criConstant[1], 
+                    'diffusion length': layer.collection['diffLength']}
+        return values.get(parameter)
+    elif name == 'excitation' and parameter == 'angle of incidence':
+        return settings['angle']
+    return None
+
+def variableName(variable):
+    return '{} {}'.format(variable[1], variable[2])
+
+def latinHypercube(batchVariables, samples, seed = None):
+    '''
+    latin hypercube sampling: each range [start, step, stop] is divided into samples intervals, 
+    every interval is taken once per variable; values are multiples of the step of the variable within their interval 
+    if the intervals are at least one step wide, otherwise they are not rounded (rounding would merge intervals)
+    '''
+    random = np.random.RandomState(seed)
+    points = np.empty((samples, len(batchVariables)))
+    for i, variable in enumerate(batchVariables):
+        start, step, stop = variable[3]
+        intervals = random.permutation(samples)
+        u = random.uniform(size = samples)
+        width = (stop - start) / samples
+        if step > 0 and width >= step:
+            # steps within [lower, upper) of each interval, the last interval includes stop
+            first = np.ceil(intervals * width / step - 1e-9)
+            last = np.ceil((intervals + 1) * width / step - 1e-9) - 1
+            last[intervals == samples - 1] = np.floor((stop - start) / step + 1e-9)
+            points[:, i] = start + (first + np.floor(u * (last - first + 1))) * step
+        else:
+            points[:, i] = start + (intervals + u) * width
+    return points
+
+def makeBatchJobs(stackname, stack, settings, batchVariables, mode = 'sequential', samples = 10, seed = None):
+    '''
+    expand the batch variables into independent jobs (name, stack, settings, parameters)
+    mode:
+        'sequential' - the variables are varied one after another, each starting from the last value of the previous one
+        'grid' - all combinations of the values of all variables (full factorial)
+        'latin hypercube' - samples space filling combinations within the ranges
+    jobs with identical parameters are simulated only once
+    '''
+    stack = copy.deepcopy(stack)
+    settings = copy.deepcopy(settings)
+    
+    variables = []
+    for variable in batchVariables:
+        value = getParameter(stack, settings, variable)
+        if value is None or setParameter(copy.deepcopy(stack), copy.deepcopy(settings), variable, value) is None:
+            logging.info('\tbatch variable {} can not be varied'.format(variableName(variable)))
+            if mode == 'sequential':
+                break # same as before: stop at first variable which can not be varied
+            continue
+        variables.append(variable)
+        
+    if mode == 'sequential':
+        combinations = []
+        current = [getParameter(stack, settings, variable) for variable in variables]
+        for i, variable in enumerate(variables):
+            for value in batchValues(variable[3]):
+                current[i] = value
+                combinations.append((i, list(current)))
+    elif mode == 'grid':
+        combinations = [(None, list(values)) for values in itertools.product(*[batchValues(variable[3]) for variable in variables])]
+    elif mode == 'latin hypercube':
+        combinations = [(None, list(values)) for values in latinHypercube(variables, samples, seed)]
+    else:
+        raise NotImplementedError('batch mode {} is not available'.format(mode))
+    
+    jobs = []
+    done = set()
+    for varied, values in combinations:
+        jobStack = copy.deepcopy(stack)
+        jobSettings = copy.deepcopy(settings)
+        NameParts = []
+        for i, (variable, value) in enumerate(zip(variables, values)):
+            NamePart = setParameter(jobStack, jobSettings, variable, value)
+            if varied is None or varied == i:
+                NameParts.append(NamePart + ' ' + str(value))
+        parameters = OrderedDict([(variableName(variable), getParameter(jobStack, jobSettings, variable)) for variable in variables])
+        key = tuple(round(float(value), 9) for value in parameters.values())
+        if key in done:
+            continue
+        done.add(key)
+        jobs.append((stackname + ' ' + ' '.join(NameParts), jobStack, jobSettings, parameters))
+    logging.info('\t{} batch jobs ({} duplicates removed)'.format(len(jobs), len(combinations) - len(jobs)))
+    if mode == 'latin hypercube' and variables and len(jobs) < samples:
+        logging.warning('\tonly {} of {} latin hypercube samples are different stacks'.format(len(jobs), samples))
+    return jobs
+
+def runJob(job, references, calculations, materialDB, scalarsOnly = False):
+    name, stack, settings, parameters = job
+    if scalarsOnly:
+        settings = dict(settings, **{'keep 2D data': False}) # no 2D plots of batch tables
+    optics = simulate(name, stack, settings, references, calculations, CRILoader(materialDB, settings))
+    if scalarsOnly:
+        return scalarColumns(optics)
+    return optics
+
+def workerJob(job):
+    '''
+    copy of a job for a worker process: layer colors (QColor) as rgba tuples, workers do not import PyQt
+    '''
+    name, stack, settings, parameters = job
+    stack = [copy.copy(layer) for layer in stack]
+    for layer in stack:
+        if hasattr(layer.color, 'getRgb'):
+            layer.color = layer.color.getRgb()
+    return name, stack, settings, parameters
+
+def restoreColors(optics, job):
+    '''
+    layer colors of the job (e.g. QColor in the GUI) in the stack and layer sequence of a result from a worker process
+    '''
+    colors = dict([(layer.name, layer.color) for layer in job[1]])
+    for layer in optics.layerstack.stack + optics.layerstack.layersequence:
+        for name in [layer.name, layer.parentName]:
+            if name in colors:
+                layer.color = colors[name]
+                break
+    return optics
+
+def runBatch(jobs, references, calculations, materialDB, workers = 0, scalarsOnly = False):
+    '''
+    run the jobs in a pool of processes and yield (job index, result) as soon as a job is finished
+    result is the Optics object or only its scalars (see scalarColumns) if scalarsOnly,
+    None for a job which failed (e.g. NotImplementedError for its parameters), the error is logged and the other jobs go on
+    workers: number of processes, 0 = number of cores, 1 = serial in this process
+    '''
+    if workers == 0:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(jobs))
+    if workers <= 1:
+        for i, job in enumerate(jobs):
+            try:
+                result = runJob(job, references, calculations, materialDB, scalarsOnly)
+            except Exception as e:
+                result = failedJob(job, e)
+            yield i, result
+        return
+    with ProcessPoolExecutor(max_workers = workers) as executor:
+        futures = {}
+        for i, job in enumerate(jobs):
+            futures[executor.submit(runJob, workerJob(job), references, calculations, materialDB, scalarsOnly)] = i
+        try:
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    result = future.result() if scalarsOnly else restoreColors(future.result(), jobs[i])
+                except Exception as e:
+                    result = failedJob(jobs[i], e)
+                yield i, result
+        finally:
+            for future in futures:
+                future.cancel()
+
+def failedJob(job, error):
+    '''
+    log the error of a failed job (with traceback if it is no error of classes.errors), its result is None
+    '''
+    logging.error('\t{} failed: {}'.format(job[0], getattr(error, 'msg', repr(error))), exc_info = not hasattr(error, 'msg'))
+    return None
+
+def scalarColumns(optics):
+    '''
+    scalars of an Optics object as flat dictionary, layerwise values get one column per layer
+    '''
+    columns = OrderedDict()
+    for key, value in optics.scalars.items():
+        if isinstance(value, list):
+            if len(value) == len(optics.layerstack.stack_rough):
+                names = [layer.name for layer in optics.layerstack.stack_rough]
+            elif len(value) == len(optics.layerstack.stack):
+                names = [layer.name for layer in optics.layerstack.stack]
+            else:
+                names = [str(i + 1) for i in range(len(value))]
+            for name, v in zip(names, value):
+                columns[key.strip() + ' ' + name] = v
+        else:
+            columns[key.strip()] = value
+    return columns
+
+class ResultTable:
+    '''
+    columnar table of batch results: job, name, parameters and all scalars of Optics
+    '''
+    def __init__(self, jobs):
+        self.jobs = jobs
+        self.columns = OrderedDict([('job', []), ('name', [])])
+        if jobs:
+            for parameter in jobs[0][3]:
+                self.columns[parameter] = []
+        self.rows = 0
+        
+    def add(self, index, result):
+        '''
+        add result (Optics object or scalarColumns) of job index
+        '''
+        if not isinstance(result, dict):
+            result = scalarColumns(result)
+        row = OrderedDict([('job', index), ('name', self.jobs[index][0])])
+        row.update(self.jobs[index][3])
+        row.update(result)
+        for key in row:
+            if key not in self.columns:
+                self.columns[key] = [np.nan] * self.rows
+        for key, column in self.columns.items():
+            column.append(row.get(key, np.nan))
+        self.rows += 1
+    
+    def column(self, key):
+        return np.array(self.columns[key])
+    
+    def write(self, fName):
+        '''
+        tab separated file with one header line, rows sorted by job
+        '''
+        order = np.argsort(self.columns['job'])
+        try:
+            with open(fName, 'w', encoding = 'utf-8') as f:
+                f.write('\t'.join(self.columns.keys()) + '\n')
+                for i in order:
+                    f.write('\t'.join([str(column[i]) for column in self.columns.values()]) + '\n')
+        except IOError as e:
+            raise WriteError("Could not write data to file {}: \n {}".format(fName, e.args[1]))
@@ -0,0 +1,139 @@
+'''
+dielectric function of a layer from oscillator models independent of the GUI:
+the models are numpy functions of the photon energy and their parameters,
+e1 of the models given by e2 follows from a Kramers-Kronig kernel matrix per energy grid
+'''
+
+import numpy as np
+
+from classes.materials import gridKey, resampledCache
+
+HC = 1239.941 # eV nm
+
+def gaussian(eV, Amp, En, Br):
+    sigma = Br / (2 * np.sqrt(np.log(2)))
+    return Amp * np.exp(-((eV - En) / sigma)**2) - Amp * np.exp(-((eV + En) / sigma)**2)
+
+def drude(eV, Amp, Br):
+    return (Amp * Br) / (eV**2 + 1j * Br * eV)
+
+def lorentz(eV, Amp, En, Br):
+    return (Amp * Br * En) / (En**2 - eV**2 - 1j * Br * eV)
+
+def taucLorentz(eV, Amp, En, C, Eg):
+    '''
+    0 for E <= Eg
+    '''
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        e2 = (Amp * C * En * (eV - Eg)**2) / (eV * ((eV**2 - En**2)**2 + C**2 * eV**2))
+    return np.where(eV > Eg, e2, 0.0)
+
+def codyLorentz(eV, Amp, En, Br, Eg, Ep, Et, Eu):
+    '''
+    Cody-Lorentz for E > Eg + Et, Urbach tail for E <= Eg + Et
+    '''
+    with np.errstate(divide = 'ignore', invalid = 'ignore', over = 'ignore'):
+        cody = ((eV - Eg)**2) / ((eV - Eg)**2 + Ep**2) * (Amp * En * Br * eV) / ((eV**2 - En**2)**2 + Br**2 * eV**2)
+        urbach = Et * cody / eV * np.exp((eV - Eg - Et) / Eu)
+    return np.where(eV > Eg + Et, cody, urbach)
+
+# 'function' gives the complex dielectric function (analytic models) or e2 ('kk': e1 by Kramers-Kronig)
+MODELS = {  'Gaussian' : {  'parameter': ['Amp', 'En', 'Br'],
+                            'defaults': [1, 3, 0.2],
+                            'function': gaussian,
+                            'kk': True},
+            'Drude' :  {    'parameter': ['Amp', 'Br'],
+                            'defaults': [1, 0.2],
+                            'function': drude,
+                            'kk': False},
+            'Lorentz' :  {  'parameter': ['Amp', 'En', 'Br'],
+                            'defaults': [1, 3, 0.2],
+                            'function': lorentz,
+                            'kk': False},
+            'Tauc-Lorentz' :  {  'parameter': ['Amp', 'En', 'C', 'Eg'],
+                            'defaults': [20, 4, 0.5, 3.5],
+                            'function': taucLorentz,
+                            'kk': True},
+            'Cody-Lorentz' :  {  'parameter': ['Amp', 'En', 'Br', 'Eg', 'Ep', 'Et', 'Eu'],
+                            'defaults': [20, 4, 0.1, 2.5, 1, 0, 0.5],
+                            'function': codyLorentz,
+                            'kk': True}
+            }
+
+def kkKernel(eV):
+    '''
+    matrix K with e1 = 1 + K e2 for e2 on the ascending energy grid eV (any spacing):
+    e1(E) = 1 + 2/pi P integral(E' e2(E') / (E'^2 - E^2) dE') over the grid for e2 linear between the grid points,
+    integrated analytically in each interval, the logarithmic singularities of the neighbouring intervals of E cancel
+    (at the first and last energy they are cut at the distance of the next energy)
+    cached per grid
+    '''
+    eV = np.ascontiguousarray(eV, dtype = np.float64)
+    key = ('kk', gridKey(eV))
+    entry = resampledCache.get(key)
+    if entry is not None:
+        return entry[0]
+    E = eV[:, np.newaxis]
+    x0 = eV[np.newaxis, :-1]
+    x1 = eV[np.newaxis, 1:]
+    h = x1 - x0
+    lnMinus = np.abs(eV[np.newaxis, :] - E)
+    lnMinus[np.diag_indices(len(eV))] = np.append(np.diff(eV), eV[-1] - eV[-2])
+    np.log(lnMinus, out = lnMinus)
+    lnPlus = np.log(eV[np.newaxis, :] + E)
+    # integrals of 1, E' and E'^2 over E'^2 - E^2 in each interval (in place, the kernel of large grids needs N^2 arrays)
+    P2 = np.diff(lnMinus - lnPlus, axis = 1)
+    P2 *= E / 2
+    P2 += h
+    lnMinus += lnPlus
+    del lnPlus
+    P1 = np.diff(lnMinus, axis = 1)
+    del lnMinus
+    P1 /= 2 * h
+    P2 /= h
+    # hat functions of the grid points: falling in the interval above, rising in the interval below
+    kernel = np.zeros((len(eV), len(eV)))
+    kernel[:, :-1] = x1 * P1
+    kernel[:, :-1] -= P2
+    P1 *= x0
+    P2 -= P1
+    kernel[:, 1:] += P2
+    kernel *= 2 / np.pi
+    resampledCache.put(key, (kernel, ))
+    return kernel
+
+def KKR(e2, eV):
+    '''
+    e1 = 1 + 2/pi P integral(E' e2(E') dE' / (E'^2 - E^2)) of e2 on the energy grid eV (see kkKernel),
+    e2 of shape (grid, ...) gives e1 of all columns at once
+    '''
+    return 1 + np.tensordot(kkKernel(eV), e2, axes = 1)
+
+def calcFunction(dielectricFunction):
+    '''
+    e1, e2, the dielectric function with 'n', 'k' and 'wvl' and the energies (eV) of the active oscillators
+    on 'points' energies (default 100) in the 'spectral range', e1 of each e2 model includes 1 (Kramers-Kronig)
+    '''
+    points = dielectricFunction['points'] if 'points' in dielectricFunction else 100
+    eV = np.linspace(dielectricFunction['spectral range'][0], dielectricFunction['spectral range'][1], points)
+    dielectricFunction['wvl'] = HC / eV
+
+    e = np.full(len(eV), dielectricFunction['e0'], dtype = np.complex128)
+    e2 = np.zeros(len(eV))
+    kk = 0
+    for osci in dielectricFunction['oscillators']:
+        if osci['active']:
+            model = MODELS[osci['name']]
+            if model['kk']:
+                e2 += model['function'](eV, *osci['values'])
+                kk += 1
+            else:
+                e += model['function'](eV, *osci['values'])
+    if kk:
+        e += KKR(e2, eV) + kk - 1 + 1j * e2
+    e1 = np.real(e)
+    e2 = np.imag(e)
+
+    dielectricFunction['n'] = (0.5 * (e1 + (e1**2 + e2**2)**0.5))**0.5
+    dielectricFunction['k'] = (0.5 * (-e1 + (e1**2 + e2**2)**0.5))**0.5
+    return e1, e2, dielectricFunction, eV
@@ -1,10 +1,39 @@
 '''
 class for creating a layer object
 '''
-from PyQt5.QtGui import QColor
+import sys
+import copy
 import numpy as np
 import numexpr as ne
 
+def adaptiveNodes(thickness, wavelength, n, k, tolerance, thick = False):
+    '''
+    depth nodes of a layer for a relative error tolerance of the absorption integrated with the trapezoidal rule:
+    the step at a depth is sqrt(12 * tolerance) / rate for the largest rate of all wavelengths whose light reaches 
+    this depth from the top or the bottom (attenuation exp(-alpha * depth) above the tolerance), 
+    rate: absorption coefficient alpha = 4 pi k / wavelength, for coherent layers at least the 
+    interference 4 pi n / wavelength (normal incidence),
+    the nodes divide the integral of the node density 1 / step into equal parts
+    '''
+    wavelength = np.asarray(wavelength, dtype = np.float64)
+    alpha = 4 * np.pi * np.abs(k) / wavelength
+    rate = alpha if thick else np.maximum(alpha, 4 * np.pi * np.abs(n) / wavelength)
+    with np.errstate(divide = 'ignore'):
+        reach = np.where(alpha > 0, np.log(1 / tolerance) / alpha, np.inf)
+    # largest rate of the wavelengths reaching a depth: maximum of the wavelengths with a larger reach
+    order = np.argsort(reach)
+    reach = reach[order]
+    largest = np.append(np.maximum.accumulate(rate[order][::-1])[::-1], 0)
+    edges = reach[reach < thickness]
+    edges = np.unique(np.concatenate([[0, thickness], edges, thickness - edges]))
+    middle = (edges[:-1] + edges[1:]) / 2
+    density = np.maximum(largest[np.searchsorted(reach, middle, side = 'right')], 
+                         largest[np.searchsorted(reach, thickness - middle, side = 'right')]) / np.sqrt(12 * tolerance)
+    nodes = np.concatenate([[0], np.cumsum(density * np.diff(edges))])
+    if nodes[-1] <= 1:
+        return np.array([0, thickness], dtype = np.float64)
+    return np.interp(np.linspace(0, nodes[-1], int(np.ceil(nodes[-1])) + 1), nodes, edges)
+
 class Layer:
     '''
     class of type Layer with properties 'name', 'thickness', 'nk'
@@ -41,6 +70,7 @@ class Layer:
         self.dielectricFunction = { 'e0': 0.0, 
                                     'oscillators': [{'name': 'Lorentz', 'values': [1, 3, 0.2], 'active': True}], 
                                     'spectral range': [0.5, 4.0], 
+                                    'points': 100, 
                                     'n': [], 
                                     'k': [], 
                                     'wvl': []
@@ -51,10 +81,15 @@ class Layer:
         self.mesh = {   'meshing': 0, 
                         'Points': 100, 
                         'Dist':  1, 
-                        'refine': False
+                        'refine': False, 
+                        'tolerance': 0.001 # relative integration error of the absorption for adaptive meshing
                        }
         
-        self.color = QColor(255, 255, 255)
+        if 'PyQt5.QtGui' in sys.modules:
+            from PyQt5.QtGui import QColor
+            self.color = QColor(255, 255, 255)
+        else:
+            self.color = (255, 255, 255, 255) # rgba without GUI (headless runs do not import PyQt)
         self.srough = False
         self.sroughThickness = 0
         self.sroughHazeR = 0.0
@@ -64,7 +99,11 @@ class Layer:
         self.wavelength = None
         self.n = None
         self.k = None
-        
+        self.criKey = None # identifies the loaded n, k data for the resampling cache (set by getCRI)
+        # repeat block (e.g. Bragg reflector): this layer and the following layers - 1 repeated times times,
+        # depth profiles only of the periods in show (0 is the top period), see LayerStack.expandRepeatBlocks
+        self.repeat = {'layers': 1, 'times': 1, 'show': []}
+
         self.collection = {'source': 'from collection function', 
                             'mode': 'constant', 'value': 1.0, 
                             'SCRwidth': 300, 'diffLength': 1000, 'recVel': 1e7, 'SCRside': 0} # default
@@ -74,11 +113,19 @@ class Layer:
         self.makeXgrading()
         
         
-    def makeXnodes(self):
+    def makeXnodes(self, wavelength = None, n = None, k = None):
+        '''
+        depth nodes of the layer for the meshing mode,
+        adaptive (mode 3) needs the wavelengths and n, k (default: of the layer), without them the fixed number is used
+        '''
         mode = self.mesh['meshing']
         number = self.mesh['Points']
         step = self.mesh['Dist']
-        if mode == 2: #'optimized':
+        if mode == 3 and wavelength is not None: # 'adaptive'
+            tolerance = self.mesh['tolerance'] if 'tolerance' in self.mesh else 0.001
+            self.x = adaptiveNodes(self.thickness, wavelength, self.n if n is None else n, self.k if k is None else k, 
+                                   tolerance, self.thick)
+        elif mode == 2: #'optimized':
             self.x = [0]
             x = 1
             while x < self.thickness/2:
@@ -107,40 +154,65 @@ class Layer:
             fc[fc > 1] = 1.0
             fc[fc < 0] = 0.0
             self.fc = np.array(fc)
-        else: # from diffusion length for constant difflength and constant field ((GreenProg. Photovolt: Res. Appl. 2009; 17:57–66, Eq. (22)
-            fc = np.zeros(len(self.x))
-            W_scr = self.collection['SCRwidth']
-            L = self.collection['diffLength']
-            if 'grading' in self.collection:
-                beta = self.collection['grading']
-            else:
-                beta = 0.0
-                
-            x = self.x
-            #x2 = self.x[self.x >= w] - w
-            W_abs = self.thickness
-            S = self.collection['recVel']                    # [cm/s] Oberflächenrekombination
-            D = 1.55                  # [cm²/s] Diffusionskonstante (also 1cm^2/s)
-            #beta = 89                   # [meV/µm] d(Bandlückenänderung)/dx; aus Thorstens MA
-            kB = 8.617e-5;            # [eV/K] Boltzmann
-            T = 300               # [K] Temperatur
-            chi = 1e-6*beta/(kB*T)   # [1/nm] reduziertes Feld
-            L_ = L/np.sqrt(1+(chi*L/2)**2) # [nm]
-            S_ = S + chi*D*1e7/2      # [cm/s]
+        else:
+            self.fc = self.diffusionCollection()
             
+    def diffusionCollection(self, **parameters):
+        '''
+        collection function from diffusion length for constant difflength and constant field ((GreenProg. Photovolt: Res. Appl. 2009; 17:57–66, Eq. (22)
+        parameters replace the values of self.collection ('SCRwidth', 'diffLength', 'recVel'), 
+        arrays of shape (M, 1) give M collection functions (M, len(x)) at once
+        '''
+        collection = dict(self.collection, **parameters)
+        W_scr = collection['SCRwidth']
+        L = collection['diffLength']
+        if 'grading' in collection:
+            beta = collection['grading']
+        else:
+            beta = 0.0
             
-            if self.collection['SCRside'] == 1: # bottom
-                fc[self.x[::-1] <= W_scr] = 1
-            else: # top
-                #fc[self.x < w] = 1
-                #fc[self.x >= w] = np.exp(-x2/2)*np.cosh(x2/L)/np.cosh(w/L)
-                # nach Green Prog. Photovolt: Res. Appl. 2009; 17:57–66;  Eq. (22)
-                fc = np.exp(chi*(x-W_scr)/2) * (np.cosh((W_abs-(x-W_scr))/L_) + 1e-7*S_*L_/D*np.sinh((W_abs-(x-W_scr))/L_)) / (np.cosh(W_abs/L_) + 1e-7*(S_*L_/D)*np.sinh(W_abs/L_))
-                
-                
-            fc[fc > 1] = 1.0
-            fc[fc < 0] = 0.0
-            self.fc = fc
+        x = self.x
+        #x2 = self.x[self.x >= w] - w
+        W_abs = self.thickness
+        S = collection['recVel']                    # [cm/s] Oberflächenrekombination
+        D = 1.55                  # [cm²/s] Diffusionskonstante (also 1cm^2/s)
+        #beta = 89                   # [meV/µm] d(Bandlückenänderung)/dx; aus Thorstens MA
+        kB = 8.617e-5;            # [eV/K] Boltzmann
+        T = 300               # [K] Temperatur
+        chi = 1e-6*beta/(kB*T)   # [1/nm] reduziertes Feld
+        L_ = L/np.sqrt(1+(chi*L/2)**2) # [nm]
+        S_ = S + chi*D*1e7/2      # [cm/s]
+        
+        
+        if collection['SCRside'] == 1: # bottom
+            fc = np.zeros(np.broadcast(x, W_scr, L, S).shape)
+            fc[np.broadcast_to(x[::-1] <= W_scr, fc.shape)] = 1
+        else: # top
+            #fc[self.x < w] = 1
+            #fc[self.x >= w] = np.exp(-x2/2)*np.cosh(x2/L)/np.cosh(w/L)
+            # nach Green Prog. Photovolt: Res. Appl. 2009; 17:57–66;  Eq. (22)
+            fc = np.exp(chi*(x-W_scr)/2) * (np.cosh((W_abs-(x-W_scr))/L_) + 1e-7*S_*L_/D*np.sinh((W_abs-(x-W_scr))/L_)) / (np.cosh(W_abs/L_) + 1e-7*(S_*L_/D)*np.sinh(W_abs/L_))
+            fc = np.broadcast_to(fc, np.broadcast(x, W_scr, L, S).shape).copy()
+            
+            
+        fc[fc > 1] = 1.0
+        fc[fc < 0] = 0.0
+        return fc
+        
+    def collectionDerivative(self):
+        '''
+        derivative of the collection function at the mesh points with respect to the thickness 
+        if the mesh points move with the thickness (central difference of makeXcollection)
+        '''
+        layer = copy.copy(self)
+        h = 1e-6 * self.thickness
+        fcs = []
+        for thickness in [self.thickness + h, self.thickness - h]:
+            layer.thickness = thickness
+            layer.x = self.x * thickness / self.thickness
+            layer.makeXcollection()
+            fcs.append(layer.fc)
+        return (fcs[0] - fcs[1]) / (2 * h)
             
     def makeXgrading(self):
         if self.criGrading['mode'] == 'constant':
@@ -3,14 +3,16 @@ Class for stack of layers as used for calculation
 '''
 from classes.layer import Layer
 
+import os
 import time
+import tempfile
 import logging
 import copy
 import numpy as np
 import scipy as sp
 from classes.errors import *
+from classes.materials import resampleCRI, gradedCRI
 from numpy import cos #, inf, zeros, array, exp, conj, nan, isnan
-from scipy.interpolate import interp1d
 
 def snell(cri1, cri2, theta1):
     '''
@@ -18,6 +20,50 @@ def snell(cri1, cri2, theta1):
     '''
     return sp.arcsin(np.real_if_close(cri1*np.sin(theta1) / cri2))
     
+def gradingSublayers(x, xMole, tolerance):
+    '''
+    sublayers (first and last mesh point, xMole) of a graded layer with composition xMole at its mesh points x:
+    consecutive mesh points are merged as long as the range of their xMole does not exceed tolerance, 
+    so flat gradings give few thick sublayers and steep gradings one sublayer per mesh interval,
+    each sublayer takes the mean xMole over its depth (the same optical thickness as the grading to first order)
+    '''
+    xMole = np.atleast_1d(xMole)
+    bounds = []
+    first = 0
+    low = high = xMole[0]
+    for j in range(1, len(xMole)):
+        if max(high, xMole[j]) - min(low, xMole[j]) > tolerance and j - 1 > first:
+            bounds.append((first, j - 1))
+            first = j - 1
+            low = high = xMole[first]
+        low, high = min(low, xMole[j]), max(high, xMole[j])
+    bounds.append((first, len(xMole) - 1))
+    sublayers = []
+    for first, last in bounds:
+        if x[last] > x[first]:
+            sublayers.append((first, last, np.trapz(xMole[first:last+1], x[first:last+1]) / (x[last] - x[first])))
+        else:
+            sublayers.append((first, last, xMole[first]))
+    return sublayers
+    
+def layerMatrices(xi, thickness):
+    '''
+    field and intensity propagation matrix of a layer with wave vector xi and thickness
+    '''
+    # layer matrix according to Egn 6 Pettersson
+    EXP = 1j * xi * thickness
+    LayerMatrix = np.zeros(np.shape(EXP) + (2, 2), np.complex)
+    LayerMatrixInc = np.zeros(np.shape(EXP) + (2, 2), np.complex)
+    
+    #if layer.thick:
+     #   EXP = EXP * 1000 # convert from mum to mm
+    # calculate electric field propagation matrix
+    LayerMatrix[..., 0, 0] = np.exp(-EXP)
+    LayerMatrix[..., 1, 1] = np.exp(EXP)
+    # calculate intensity propagation matrix
+    LayerMatrixInc[..., 0, 0] = np.abs(np.exp(-EXP))**2
+    LayerMatrixInc[..., 1, 1] = np.abs(np.exp(EXP))**2
+    return LayerMatrix, LayerMatrixInc
     
 class LayerStack:
     def __init__(self, stackname, stack, settings, getCRICallback):
@@ -43,19 +89,21 @@ class LayerStack:
         
         self.stack = copy.deepcopy(stack)
         self.stackname = stackname
+        self.settings = settings
         startCreationTime = time.time()
         self.wavelength = settings['wavelength']
         wvl = np.array(self.wavelength)
-        eV = 1239.941 / wvl
         self.theta0 = settings['angle'] * np.pi/180 # angle of incident in radians
         self.intensity = settings['intensity'] / 100 # factor used in optics class
-        self.layersequence = copy.deepcopy(stack) # change if TMM stack not actual Stack (Grading, Roughness)
         self.stack_rough = self.stack.copy()
+        stack = self.expandRepeatBlocks(stack)
+        self.layersequence = copy.deepcopy(stack) # change if TMM stack not actual Stack (Grading, Roughness, Repeat blocks)
         
         #TODO: check if layers have the same name
         self.HazeOn = False # Flag for calculating diffused light
         i = 0
         self.gradedLayers = []
+        gradedKeys = [] # criKey of the grading files of each graded layer (see gradedCRI)
         noOfGradedLayers = 0
         currentPosition = 0
         currentRoughPosition = 0
@@ -96,17 +144,32 @@ class LayerStack:
                     currentPosition = currentPosition - 1
                 self.layersequence.pop(currentPosition)
                 getCRICallback(layer)
+                gradedKeys.append(getattr(layer, 'criKey', None))
+                if layer.mesh['meshing'] == 3:
+                    # adaptive nodes for the largest n, k of the grading files (the layer of the stack is not changed)
+                    layer = copy.copy(layer)
+                    layer.makeXnodes(wvl, np.max(layer.criGrading['n_idc'], axis = 0), np.max(layer.criGrading['k_idc'], axis = 0))
+                    layer.makeXcollection()
+                    layer.makeXgrading()
+                    logging.info('\tadaptive depth mesh of {}: {} nodes'.format(name, len(layer.x)))
                 step = 5 # TODO: number of Xnodes which contain one graded layer (setting)
-                logging.info('\treplace layer {} with one graded layer for each {} meshpoints and assign collection and xMole...'.format(name, step))
-                idxrange = range(0, len(layer.x), step)
-                for no, idx in enumerate(idxrange):
+                tolerance = settings['grading tolerance'] if 'grading tolerance' in settings else 0
+                if tolerance > 0:
+                    sublayers = gradingSublayers(layer.x, layer.xMole, tolerance)
+                    logging.info('\treplace layer {} with {} graded layers (xMole tolerance {}) and assign collection and xMole...'.format(
+                                    name, len(sublayers), tolerance))
+                else:
+                    # only top of layer is considered
+                    sublayers = [(idx, idx + step, layer.xMole[idx]) for idx in range(0, len(layer.x), step)]
+                    logging.info('\treplace layer {} with one graded layer for each {} meshpoints and assign collection and xMole...'.format(name, step))
+                for no, (idx, last, xMole) in enumerate(sublayers):
                     gradedLayer = Layer(layer.name + '_graded' + str(no))
                     gradedLayer.parentName = name
                     gradedLayer.criSource = 'graded'
-                    gradedLayer.x = layer.x[idx:idx+step+1] - layer.x[idx]
+                    gradedLayer.x = layer.x[idx:last+1] - layer.x[idx]
                     gradedLayer.thickness = gradedLayer.x[-1]
-                    gradedLayer.fc = layer.fc[idx:idx+step+1]
-                    gradedLayer.xMole = layer.xMole[idx] # only top of layer is considered
+                    gradedLayer.fc = layer.fc[idx:last+1]
+                    gradedLayer.xMole = xMole
                     gradedLayer.wavelength = layer.wavelength
                     gradedLayer.criGrading = layer.criGrading
                     gradedLayer.thick = layer.thick
@@ -125,6 +188,7 @@ class LayerStack:
         self.names = []
         self.thicknesses = []
         roughLayers = []
+        resampled = [] # layers with cri and alpha from resampleCRI
         self.getCRI = getCRICallback
         
         #TODO: Check Input
@@ -136,6 +200,10 @@ class LayerStack:
             # load all cri except graded
             if '_graded' in element.name:
                 continue   # created in next for statement
+            if getattr(element, 'block', None):
+                self.makeBlockCRI(element)
+                resampled.append(i)
+                continue
             self.getCRI(element)
             if element.criSource == 'constant':
                 pass    # already maked
@@ -143,188 +211,339 @@ class LayerStack:
                 roughLayers.append(i)
                 continue   # created in next for statement
             else:
-                element.n = np.interp(wvl, element.wavelength, element.n)
-                element.k = np.interp(wvl, element.wavelength, element.k)
+                element.n, element.k, element.cri, element.alpha = resampleCRI(element, wvl)
+                resampled.append(i)
                 
-        #get cri for graded layers
+        #get cri for graded layers (all sublayers of a graded layer at once)
         for i, layerParent in enumerate(self.gradedLayers):
-            for index in self.gradedLayers[i]:
-                layer = self.layersequence[index]
-                xMoles = np.array(layer.criGrading['xMoles'])
-                Egs = np.array(layer.criGrading['Egs'])
-                n_idx = np.array(layer.criGrading['n_idc']).T
-                k_idx = np.array(layer.criGrading['k_idc']).T
-                if layer.xMole in xMoles:
-                    idx = np.nonzero(xMoles == layer.xMole)
-                    layer.n = np.reshape(n_idx[:, idx], len(wvl))
-                    layer.k = np.reshape(k_idx[:, idx], len(wvl))
-                    continue
-                if settings['grading advanced']:
-                    # this method takes the two adjacent nk-files matching the required xMole
-                    # and moves the curves according to the given Eg
-                    idx1 = np.nonzero(xMoles < layer.xMole)
-                    idx2 = np.nonzero(xMoles > layer.xMole)
-                    idx1 = idx1[0][-1]
-                    idx2 = idx2[0][0]
-                    Eg1 = Egs[idx1]
-                    Eg2 = Egs[idx2]
-                    n1 = n_idx[:, idx1].T
-                    n2 = n_idx[:, idx2].T
-                    k1 = k_idx[:, idx1].T
-                    k2 = k_idx[:, idx2].T
-                    eV1 = eV + (Eg2 - Eg1) * layer.xMole
-                    #eV2 = eV - (Eg2 - Eg1) * layer.xMole
-                    n1 = interp1d(eV1,n1, bounds_error=False)(eV)
-                    n2 = interp1d(eV1,n2, bounds_error=False)(eV)
-                    k1 = interp1d(eV1,k1, bounds_error=False)(eV)
-                    k2 = interp1d(eV1,k2, bounds_error=False)(eV)
-                    for k in range(len(wvl)):
-                        if np.isnan(n1[k]):
-                            if np.isnan(n1[k-1]):
-                                n1[k] = n1[k+1]
-                                n2[k] = n2[k+1]
-                                k1[k] = 0
-                                k2[k] = 0
-                            else:
-                                n1[k] = n1[k-1]
-                                n2[k] = n2[k-1]
-                                k1[k] = 0
-                                k2[k] = 0
-                    #n1 = np.nan_to_num(n1)
-                    #n2 = np.nan_to_num(n2)
-                    #k1 = np.nan_to_num(k1)
-                    #k2 = np.nan_to_num(k2)
-                    layer.n = np.reshape(np.mean(np.array([n1, n2]), axis=0), len(wvl)).T
-                    layer.k = np.reshape(np.mean(np.array([k1, k2]), axis=0), len(wvl)).T
-                    #print(layer.k)
-                else:
-                    n = []
-                    k = []
-                    for i in range(len(wvl)):
-                        n.append(np.interp(layer.xMole, xMoles, n_idx[i]))
-                        k.append(np.interp(layer.xMole, xMoles, k_idx[i]))
-                    layer.n = np.array(n)
-                    layer.k = np.array(k)
+            layers = [self.layersequence[index] for index in self.gradedLayers[i]]
+            n, k = gradedCRI(layers[0].criGrading, [layer.xMole for layer in layers], wvl, settings['grading advanced'], 
+                             gradedKeys[i])
+            for no, layer in enumerate(layers):
+                layer.n = n[no]
+                layer.k = k[no]
                 
         #get cri for roughness layers
         for index in roughLayers:
-            if index == 0:
-                prev_n = np.ones(len(wvl))
-                prev_k = np.zeros(len(wvl))
-            else:
-                prev_n = self.layersequence[index - 1].n
-                prev_k = self.layersequence[index - 1].k
-            if index == len(self.layersequence):
-                next_n = np.ones(len(wvl))
-                next_k = np.zeos(len(wvl))
-            else:
-                next_n = self.layersequence[index + 1].n
-                next_k = self.layersequence[index + 1].k
-                
-            layer = self.layersequence[index]
-            '''
-            Maxwell-Garnett (f_B is ratio , e.g. 0.5):
-            e - e_A        e_B - e_A
-            ________ = f_B __________ 
-            e + 2e_A       e_B + 2e_A
+            self.makeRoughnessCRI(index)
             
-                        2 f_B * (e_B - e_A) + e_B + 2 e_A
-            --> e = e_A _________________________________      (Wikipedia)
-                           2e_A + e_B + f_B (e_A - e_B)
+        # adaptive depth nodes from n, k on the wavelength grid
+        for element in self.layersequence:
+            if element.mesh['meshing'] == 3 and not '_graded' in element.name and not getattr(element, 'block', None):
+                self.adaptMesh(element)
             
-            
-            Bruggemann (f_A = 1-f_B is ratio , e.g. 0.5):
-                e_A - e        e_B - e
-            f_A ________ + f_B __________ = 0
-                e_A + 2e       e_B + 2e
-            
-            
-            -->  e = b +/- (b + (e_A*e_B)/2 ) ^0.5
-            
-                        (3f_B - 1) (e_B- e_A) + e_A
-                    b = ____________________________
-                                    4
-            
-            Mean:
-            
-            n = 0.5 (n_A + n_B)
-            k = 0.5 (k_A + k_B)
-            
-            '''
-            if 'EMA model' in settings:
-                EMAmodel = settings['EMA model']
-            else:
-                EMAmodel = 0 # old versions (< 0.5.0)
-            
-            if EMAmodel == 0: # Mean
-                layer.n = (prev_n + next_n) / 2
-                layer.k = (prev_k + next_k) / 2
-            else:
-                e_A =  (prev_n**2 - prev_k**2) + 1j * 2*prev_n*prev_k
-                e_B =  (next_n**2 - next_k**2) + 1j * 2*next_n*next_k
-                
-                if EMAmodel == 1: # Bruggemann
-                    b = ((3 * 0.5 - 1) * (e_B - e_A) + e_A) / 4.0
-                    e = b + (b + (e_A * e_B) / 2 )**0.5
-                else: # Maxwell-Garnett
-                    e = e_A * (2 * 0.5 * (e_B - e_A) + e_B + 2 * e_A) / (2 * e_A + e_B + 0.5 * (e_A - e_B))
-                
-                e1 = np.real(e)
-                e2 = np.imag(e)
-                layer.n = (0.5 * (e1 + (e1**2 + e2**2)**0.5))**0.5
-                layer.k = (0.5 * (-e1 + (e1**2 + e2**2)**0.5))**0.5
-            
-        
         # make complex refractive index and layer matrices
         for i, layer in enumerate(self.layersequence):
-            layer.cri = layer.n + 1j * layer.k
-            layer.alpha = 4*np.pi*layer.k/wvl #*1e-7
-            # make angle of lightwave in each layer
-            if i == 0:
-                cri1 = np.ones((len(wvl)), np.complex)
-                layer.theta = snell(cri1, layer.cri, self.theta0)
-            else:
-                layer.theta = snell(self.layersequence[i-1].cri, layer.cri, self.layersequence[i-1].theta)
-            #TODO: what about the last interface?
-            layer.xi = 2 * np.pi * layer.cri * cos(layer.theta) / wvl
-            # layer matrix according to Egn 6 Pettersson
-            layer.LayerMatrix = np.zeros((len(wvl), 2, 2), np.complex)
-            layer.LayerMatrixInc = np.zeros((len(wvl), 2, 2), np.complex)
-            
-            EXP = 1j * layer.xi * layer.thickness
-            
-            #if layer.thick:
-             #   EXP = EXP * 1000 # convert from mum to mm
-            # calculate electric field propagation matrix
-            layer.LayerMatrix[:, 0, 0] = np.exp(-EXP)
-            layer.LayerMatrix[:, 1, 1] = np.exp(EXP)
-            # calculate intensity propagation matrix
-            layer.LayerMatrixInc[:, 0, 0] = np.abs(np.exp(-EXP))**2
-            layer.LayerMatrixInc[:, 1, 1] = np.abs(np.exp(EXP))**2
-            
-            if layer.sroughHazeR > 0 or layer.sroughHazeT > 0 or self.HazeOn:
-                if layer.srough and settings['roughness Haze calc diffuse'][0]:
-                    self.HazeOn = True
+            if i not in resampled:
+                layer.cri = layer.n + 1j * layer.k
+                layer.alpha = 4*np.pi*layer.k/wvl #*1e-7
+        for i in range(len(self.layersequence)):
+            self.makeLayerMatrices(i)
+        self.checkHaze()
                  
         self.creationTime = time.time() - startCreationTime
+        self.meshPoints = sum([len(layer.x) for layer in self.layersequence]) # depth nodes of all layers
         layers = []
         for i in self.layersequence:
-            layers.append('\t\t' + '\t\t'.join([i.name, str(i.thickness) + ' nm'])) #, str(np.max(i.n)), str(np.min(i.n)), str(np.max(i.k)), str(np.min(i.k))
-            # write all nk data to files
-            fname = 'tmp_nk_{}.txt'.format(i.name)
-            try:
-                f = open(fname, 'w')
-                for idx, wvl in enumerate(self.wavelength):
-                    f.write('{}\t{}\t{}\n'.format(wvl, i.n[idx], i.k[idx]))
-                f.close()
-            except IOError as e:
-                raise WriteError("Could not write data to file {}: \n {}".format(fname, e.args[1]))
+            layers.append('\t\t' + '\t\t'.join([i.name, str(i.thickness) + ' nm', str(len(i.x)) + ' nodes'])) #, str(np.max(i.n)), str(np.min(i.n)), str(np.max(i.k)), str(np.min(i.k))
         
-        logging.info('\tfinal stack created:\n' + '\n'.join(layers))
+        logging.info('\tfinal stack created ({} depth nodes):\n'.format(self.meshPoints) + '\n'.join(layers))
         logging.info('... final stack creation time {:.3f}'.format(self.creationTime))
+        self.exportNK()
         
         
         #print(self.names)
 
-
+    def expandRepeatBlocks(self, stack):
+        '''
+        stack with its repeat blocks (layer.repeat) replaced by the layers of the periods to show (name_period<no>)
+        and one layer for each run of other periods (name_periods<first>-<last>): the period layers are kept in its block,
+        its own matrices are those of the first layer of the next period with zero thickness, the transfer matrix 
+        of the periods is part of its interface matrix (see Optics.periodMatrices), so it has no depth profile
+        '''
+        expanded = []
+        i = 0
+        while i < len(stack):
+            layer = stack[i]
+            repeat = getattr(layer, 'repeat', None) # None for layers of old stack files
+            if repeat is None or repeat['times'] <= 1:
+                expanded.append(layer)
+                i += 1
+                continue
+            layers = stack[i:i + repeat['layers']]
+            times = repeat['times']
+            for blockLayer in layers + stack[i + repeat['layers']:i + repeat['layers'] + 1]:
+                if blockLayer.srough or blockLayer.sroughThickness > 0:
+                    raise NotImplementedError('roughness of layer {} in or below a repeat block is not implemented'.format(blockLayer.name))
+            for blockLayer in layers:
+                if blockLayer.thick or blockLayer.criSource == 'graded' or (blockLayer is not layer and getattr(blockLayer, 'repeat', repeat)['times'] > 1):
+                    raise NotImplementedError('thick, graded or repeated layer {} in a repeat block is not implemented'.format(blockLayer.name))
+            logging.info('\trepeat {} layers from {} {} times...'.format(len(layers), layer.name, times))
+            block = copy.deepcopy(layers)
+            show = sorted(set([no for no in repeat['show'] if 0 <= no < times]))
+            first = 0
+            for no in show + [times]:
+                if no > first:
+                    periods = Layer('{}_periods{}-{}'.format(layer.name, first, no - 1))
+                    periods.parentName = layer.name
+                    periods.periods = list(range(first, no))
+                    periods.block = block
+                    periods.thickness = len(periods.periods) * sum([blockLayer.thickness for blockLayer in block])
+                    periods.x = np.array([0, periods.thickness])
+                    periods.fc = np.zeros(2)
+                    expanded.append(periods)
+                if no < times:
+                    for blockLayer in layers:
+                        periodLayer = copy.deepcopy(blockLayer)
+                        periodLayer.name = '{}_period{}'.format(blockLayer.name, no)
+                        periodLayer.parentName = blockLayer.name
+                        periodLayer.periods = [no]
+                        periodLayer.repeat = {'layers': 1, 'times': 1, 'show': []}
+                        expanded.append(periodLayer)
+                first = no + 1
+            i += len(layers)
+        return expanded
+        
+    def makeBlockCRI(self, layer):
+        '''
+        n and k of the layers of the block of collapsed periods (see expandRepeatBlocks), each loaded once for all periods,
+        the layer itself takes n and k of the first layer and the mean absorption coefficient of the period
+        '''
+        wvl = np.array(self.wavelength)
+        for blockLayer in layer.block:
+            if getattr(blockLayer, 'cri', None) is None:
+                self.getCRI(blockLayer)
+                blockLayer.n, blockLayer.k, blockLayer.cri, blockLayer.alpha = resampleCRI(blockLayer, wvl)
+        first = layer.block[0]
+        layer.n, layer.k, layer.cri = first.n, first.k, first.cri
+        thickness = sum([blockLayer.thickness for blockLayer in layer.block])
+        if thickness > 0:
+            layer.alpha = sum([blockLayer.alpha * blockLayer.thickness for blockLayer in layer.block]) / thickness
+        else:
+            layer.alpha = first.alpha
+        
+    def adaptMesh(self, layer):
+        '''
+        adaptive depth nodes (mesh mode 3) of a layer of the layer sequence from its n, k (see classes.layer.adaptiveNodes),
+        collection function and grading at the new nodes
+        '''
+        layer.makeXnodes(np.array(self.wavelength))
+        layer.makeXcollection()
+        layer.makeXgrading()
+        logging.info('\tadaptive depth mesh of {}: {} nodes (tolerance {})'.format(
+                        layer.name, len(layer.x), layer.mesh['tolerance'] if 'tolerance' in layer.mesh else 0.001))
+        
+    def update(self, stack, dirty):
+        '''
+        apply changed parameters of layers of stack (as used for creation) without creating the LayerStack again
+        dirty: dictionary {layer name: set of changed parameters 'thickness', 'roughness', 'collection', 'nk'}
+        returns the indices of the changed layer matrices and interface matrices (-1 is the first interface)
+        or None if the structure of the stack changes (graded layers, roughness layers), then a new LayerStack is required
+        '''
+        wvl = np.array(self.wavelength)
+        layers = dict([(layer.name, layer) for layer in stack])
+        changedLayers = set()
+        changedInterfaces = set()
+        firstNK = len(self.layersequence)
+        for name, parameters in dirty.items():
+            positions = [i for i, element in enumerate(self.layersequence) if element.name == name]
+            if name not in layers or not positions or layers[name].criSource == 'graded':
+                return None
+            layer = layers[name]
+            i = positions[-1]
+            element = self.layersequence[i]
+            rough = i > 0 and self.layersequence[i-1].name == name + '_rough'
+            below = i > 0 and getattr(self.layersequence[i-1], 'block', None) # roughness below repeat blocks is not implemented
+            if 'roughness' in parameters and (rough or below or (self.settings['roughness EMA model'] and layer.srough == True and layer.sroughThickness > 0)):
+                return None
+            
+            # keep original stack up to date (e.g. for restoring a stack from the result)
+            for j, original in enumerate(self.stack):
+                if original.name == name:
+                    k = self.stack_rough.index(original)
+                    self.stack[j] = self.stack_rough[k] = copy.deepcopy(layer)
+            
+            if 'thickness' in parameters:
+                element.thickness = layer.thickness
+                element.x = copy.deepcopy(layer.x)
+                element.fc = copy.deepcopy(layer.fc)
+                element.xMole = copy.deepcopy(layer.xMole)
+                if element.mesh['meshing'] == 3:
+                    self.adaptMesh(element)
+                self.thicknesses[i] = layer.thickness
+                changedLayers.add(i)
+            if 'collection' in parameters:
+                element.collection = copy.deepcopy(layer.collection)
+                element.fc = copy.deepcopy(layer.fc)
+                if element.mesh['meshing'] == 3:
+                    element.makeXcollection() # adaptive nodes of the layer sequence
+                if rough:
+                    self.layersequence[i-1].collection = element.collection
+                    self.layersequence[i-1].makeXcollection()
+            if 'roughness' in parameters:
+                element.srough = layer.srough
+                element.sroughThickness = layer.sroughThickness
+                element.sroughHazeR = layer.sroughHazeR
+                element.sroughHazeT = layer.sroughHazeT
+                changedInterfaces.add(i-1)
+            if 'nk' in parameters:
+                for attribute in ['criSource', 'criDBName', 'criFile', 'criConstant', 'dielectricFunction']:
+                    setattr(element, attribute, copy.deepcopy(getattr(layer, attribute)))
+                self.getCRI(element)
+                element.n, element.k, element.cri, element.alpha = resampleCRI(element, wvl)
+                if element.mesh['meshing'] == 3:
+                    self.adaptMesh(element)
+                firstNK = min(firstNK, i)
+                # roughness layers take the cri of the adjacent layers
+                for j in [i-1, i+1]:
+                    if 0 <= j < len(self.layersequence) and '_rough' in self.layersequence[j].name:
+                        roughLayer = self.layersequence[j]
+                        self.makeRoughnessCRI(j)
+                        roughLayer.cri = roughLayer.n + 1j * roughLayer.k
+                        roughLayer.alpha = 4*np.pi*roughLayer.k/wvl
+                        firstNK = min(firstNK, j)
+        
+        # angles of all following layers depend on the cri
+        if firstNK < len(self.layersequence):
+            changedLayers.update(range(firstNK, len(self.layersequence)))
+            changedInterfaces.update(range(firstNK - 1, len(self.layersequence)))
+        for i in sorted(changedLayers):
+            self.makeLayerMatrices(i)
+        self.checkHaze()
+        self.meshPoints = sum([len(element.x) for element in self.layersequence])
+        logging.info('\tupdated {} of stack {}: {} layer and {} interface matrices changed'.format(
+                        ', '.join(dirty), self.stackname, len(changedLayers), len(changedInterfaces)))
+        self.exportNK()
+        return changedLayers, changedInterfaces
+    
+    def exportNK(self):
+        '''
+        write wavelength, n and k of all layers into one file per run (nk_<stackname>_*.dat) if the directory
+        settings['export nk data'] is set, file names are unique for parallel processes
+        '''
+        directory = self.settings['export nk data'] if 'export nk data' in self.settings else ''
+        if not directory:
+            return
+        columns = [self.wavelength]
+        header = ['wavelength (nm)']
+        for layer in self.layersequence:
+            columns += [np.real(layer.n), np.real(layer.k)]
+            header += ['n ' + layer.name, 'k ' + layer.name]
+        fName = directory
+        try:
+            os.makedirs(directory, exist_ok = True)
+            prefix = 'nk_{}_'.format(''.join(c if c.isalnum() or c in '-_' else '_' for c in self.stackname))
+            handle, fName = tempfile.mkstemp(suffix = '.dat', prefix = prefix, dir = directory)
+            with os.fdopen(handle, 'w') as f:
+                np.savetxt(f, np.column_stack(columns), delimiter = '\t', header = '\t'.join(header), comments = '')
+        except IOError as e:
+            raise WriteError("Could not write data to file {}: \n {}".format(fName, e.args[1]))
+        logging.info('\tn, k data of stack {} written to {}'.format(self.stackname, fName))
+    
+    def makeRoughnessCRI(self, index):
+        '''
+        n and k of the roughness layer at index from the adjacent layers (effective medium)
+        '''
+        settings = self.settings
+        wvl = np.array(self.wavelength)
+        if index == 0:
+            prev_n = np.ones(len(wvl))
+            prev_k = np.zeros(len(wvl))
+        else:
+            prev_n = self.layersequence[index - 1].n
+            prev_k = self.layersequence[index - 1].k
+        if index == len(self.layersequence):
+            next_n = np.ones(len(wvl))
+            next_k = np.zeos(len(wvl))
+        else:
+            next_n = self.layersequence[index + 1].n
+            next_k = self.layersequence[index + 1].k
+            
+        layer = self.layersequence[index]
+        '''
+        Maxwell-Garnett (f_B is ratio , e.g. 0.5):
+        e - e_A        e_B - e_A
+        ________ = f_B __________ 
+        e + 2e_A       e_B + 2e_A
+        
+                    2 f_B * (e_B - e_A) + e_B + 2 e_A
+        --> e = e_A _________________________________      (Wikipedia)
+                       2e_A + e_B + f_B (e_A - e_B)
         
+        
+        Bruggemann (f_A = 1-f_B is ratio , e.g. 0.5):
+            e_A - e        e_B - e
+        f_A ________ + f_B __________ = 0
+            e_A + 2e       e_B + 2e
+        
+        
+        -->  e = b +/- (b + (e_A*e_B)/2 ) ^0.5
+        
+                    (3f_B - 1) (e_B- e_A) + e_A
+                b = ____________________________
+                                4
+        
+        Mean:
+        
+        n = 0.5 (n_A + n_B)
+        k = 0.5 (k_A + k_B)
+        
+        '''
+        if 'EMA model' in settings:
+            EMAmodel = settings['EMA model']
+        else:
+            EMAmodel = 0 # old versions (< 0.5.0)
+        
+        if EMAmodel == 0: # Mean
+            layer.n = (prev_n + next_n) / 2
+            layer.k = (prev_k + next_k) / 2
+        else:
+            e_A =  (prev_n**2 - prev_k**2) + 1j * 2*prev_n*prev_k
+            e_B =  (next_n**2 - next_k**2) + 1j * 2*next_n*next_k
+            
+            if EMAmodel == 1: # Bruggemann
+                b = ((3 * 0.5 - 1) * (e_B - e_A) + e_A) / 4.0
+                e = b + (b + (e_A * e_B) / 2 )**0.5
+            else: # Maxwell-Garnett
+                e = e_A * (2 * 0.5 * (e_B - e_A) + e_B + 2 * e_A) / (2 * e_A + e_B + 0.5 * (e_A - e_B))
+            
+            e1 = np.real(e)
+            e2 = np.imag(e)
+            layer.n = (0.5 * (e1 + (e1**2 + e2**2)**0.5))**0.5
+            layer.k = (0.5 * (-e1 + (e1**2 + e2**2)**0.5))**0.5
+        
+    def makeLayerMatrices(self, i):
+        '''
+        angle, wave vector and layer matrices of the layer at index i (the angle depends on the layer above)
+        an array theta0 of shape (angle, 1) gives all of them with a leading angle axis
+        '''
+        wvl = np.array(self.wavelength)
+        layer = self.layersequence[i]
+        # make angle of lightwave in each layer
+        if i == 0:
+            cri1 = np.ones((len(wvl)), np.complex)
+            layer.theta = snell(cri1, layer.cri, self.theta0)
+        else:
+            layer.theta = snell(self.layersequence[i-1].cri, layer.cri, self.layersequence[i-1].theta)
+        #TODO: what about the last interface?
+        layer.xi = 2 * np.pi * layer.cri * cos(layer.theta) / wvl
+        if getattr(layer, 'block', None):
+            # collapsed periods (see expandRepeatBlocks): matrices of the period layers, no propagation in the layer itself
+            previous = layer
+            for blockLayer in layer.block:
+                blockLayer.theta = snell(previous.cri, blockLayer.cri, previous.theta)
+                blockLayer.xi = 2 * np.pi * blockLayer.cri * cos(blockLayer.theta) / wvl
+                blockLayer.LayerMatrix, blockLayer.LayerMatrixInc = layerMatrices(blockLayer.xi, blockLayer.thickness)
+                previous = blockLayer
+            layer.xi = np.zeros(np.shape(layer.xi), np.complex)
+        layer.LayerMatrix, layer.LayerMatrixInc = layerMatrices(layer.xi, layer.thickness)
+            
+    def checkHaze(self):
+        '''
+        set HazeOn if diffused light has to be calculated for any layer
+        '''
+        self.HazeOn = False
+        for layer in self.layersequence:
+            if layer.sroughHazeR > 0 or layer.sroughHazeT > 0 or self.HazeOn:
+                if layer.srough and self.settings['roughness Haze calc diffuse'][0]:
+                    self.HazeOn = True
@@ -0,0 +1,485 @@
+'''
+loading of complex refractive index (cri) data of layers independent of the GUI
+'''
+
+import os
+import json
+import hashlib
+import logging
+from collections import OrderedDict
+import numpy as np
+
+from classes.errors import *
+
+def num(s):
+    try:
+        return int(s)
+    except ValueError:
+        try:
+            return float(s)
+        except ValueError:
+            raise LoadError('Can not convert string {} into number!'.format(s))
+
+def criLoadFile(filename):
+    """opens and read cri files
+    File structure:
+    column 1 -- wavelength (nm)
+    column 2 -- n
+    column 3 -- k
+    """
+    w = []
+    n = []
+    k = []
+    wvl_factor = 1
+    ln = 1
+    try:
+        with open(filename) as f:
+            for line in f:
+                if '[mum]' in line:
+                    wvl_factor = 1000
+                if line[0].isdigit():
+                    fields = line.split("\t")
+                    if len(fields) != 3:
+                        raise LoadError("Line {}:\nFile {} has wrong column format!\nShould be:\n[wvl]\t[n]\t[k]".format(ln, filename))
+                    w.append(num(fields[0]) * wvl_factor)
+                    n.append(num(fields[1]))
+                    k.append(num(fields[2]))
+                ln += 1
+        return w, n, k
+    except IOError as e:
+        raise LoadError("Could not read file {}: \n {}".format(filename, e.args[1]))
+
+def criLoadAlphaFile(filename):
+    """opens and read absorption coefficient files
+    File structure:
+    column 1 -- wavelength (nm)
+    column 2 -- alpha (1/m or 1/cm)
+    """
+    w_list = []
+    k_list = []
+    wvl_factor = 1
+    alpha_factor = 1
+    ln = 1
+    try:
+        with open(filename) as f:
+            for line in f:
+                if '[mum]' in line:
+                    wvl_factor = 1000
+                if 'cm^-1' in line or '1/cm' in line:
+                    alpha_factor = 1e-7 # --> nm^-1
+                else:# 'm^-1' in line or '1/m' in line: default
+                    alpha_factor = 1e-9 # --> nm^-1
+                if line[0].isdigit():
+                    fields = line.split("\t")
+                    if len(fields) != 2:
+                        raise LoadError("Line {}:\nFile {} has wrong column format!\nShould be:\n[wvl]\t[alpha]".format(ln, filename))
+                    w = num(fields[0]) * wvl_factor
+                    k = num(fields[1]) * alpha_factor * w / (4 * np.pi) # k = alpha*Lambda/4pi
+                    w_list.append(w)
+                    k_list.append(k)
+                ln += 1
+        return w_list, k_list
+    except IOError as e:
+        raise LoadError("Could not read file {}: \n {}".format(filename, e.args[1]))
+
+STOREFILE = 'materialDB.npy'
+INDEXFILE = 'materialDB.json'
+
+def compileMaterialDB(path):
+    '''
+    convert all cri files of the material database in path into one binary store:
+    STOREFILE - float64 array (3, N) with wavelength (nm), n and k of all materials
+    INDEXFILE - index of the materials with offset, length and mtime/size of the source file
+    returns the number of compiled materials
+    '''
+    index = {}
+    columns = []
+    offset = 0
+    for name, fName in sorted(loadMaterialDB(path).items()):
+        stat = os.stat(fName)
+        w, n, k = criLoadFile(fName)
+        columns.append(np.array([w, n, k], dtype = np.float64))
+        index[os.path.basename(fName)] = {'material': name, 'offset': offset, 'length': len(w), 
+                                          'mtime': stat.st_mtime_ns, 'size': stat.st_size}
+        offset += len(w)
+    data = np.concatenate(columns, axis = 1) if columns else np.zeros((3, 0))
+    # write to temporary files and replace, so running simulations never see half written stores
+    storeFile = os.path.join(path, STOREFILE)
+    indexFile = os.path.join(path, INDEXFILE)
+    try:
+        with open(storeFile + '.tmp{}'.format(os.getpid()), 'wb') as f:
+            np.save(f, data)
+        with open(indexFile + '.tmp{}'.format(os.getpid()), 'w') as f:
+            json.dump(index, f)
+        os.replace(storeFile + '.tmp{}'.format(os.getpid()), storeFile)
+        os.replace(indexFile + '.tmp{}'.format(os.getpid()), indexFile)
+    except OSError as e:
+        raise WriteError("Could not write compiled material database to {}: \n {}".format(path, e.args[1]))
+    logging.info('\tcompiled {} materials of {} into {}'.format(len(index), path, STOREFILE))
+    return len(index)
+
+def materialStoreIsStale(path):
+    '''
+    True if the compiled store of path is missing or does not match the cri files
+    '''
+    try:
+        with open(os.path.join(path, INDEXFILE)) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return True
+    files = loadMaterialDB(path).values()
+    if len(files) != len(index):
+        return True
+    for fName in files:
+        entry = index.get(os.path.basename(fName))
+        stat = os.stat(fName)
+        if entry is None or (entry['mtime'], entry['size']) != (stat.st_mtime_ns, stat.st_size):
+            return True
+    return False
+
+class MaterialStore:
+    '''
+    compiled material database of one directory, the data is memory mapped (read-only, no copy)
+    '''
+    def __init__(self, path):
+        indexFile = os.path.join(path, INDEXFILE)
+        self.state = os.stat(indexFile).st_mtime_ns
+        with open(indexFile) as f:
+            self.index = json.load(f)
+        self.data = np.load(os.path.join(path, STOREFILE), mmap_mode = 'r')
+        
+    def get(self, filename, state):
+        '''
+        wavelength, n, k of the cri file or None if it is not in the store or the file changed since compiling
+        '''
+        entry = self.index.get(os.path.basename(filename))
+        if entry is None or (entry['mtime'], entry['size']) != state:
+            return None
+        start = entry['offset']
+        end = start + entry['length']
+        return self.data[0, start:end], self.data[1, start:end], self.data[2, start:end]
+
+class MaterialCache:
+    '''
+    process wide cache of parsed cri files
+    the columns are stored as read-only float64 arrays and parsed again if mtime or size of the file changes
+    '''
+    def __init__(self):
+        self.entries = {}
+        self.stores = {}
+        self.hits = 0
+        self.misses = 0
+        
+    def store(self, path):
+        '''
+        compiled store of directory path (None if there is none)
+        '''
+        try:
+            state = os.stat(os.path.join(path, INDEXFILE)).st_mtime_ns
+        except OSError:
+            self.stores.pop(path, None)
+            return None
+        if path not in self.stores or self.stores[path].state != state:
+            try:
+                self.stores[path] = MaterialStore(path)
+            except (OSError, ValueError) as e:
+                logging.info('\tcould not open compiled material database in {}: {}'.format(path, e))
+                return None
+        return self.stores[path]
+        
+    def load(self, filename, parser):
+        try:
+            stat = os.stat(filename)
+        except OSError as e:
+            raise LoadError("Could not read file {}: \n {}".format(filename, e.args[1]))
+        key = (os.path.abspath(filename), parser.__name__)
+        state = (stat.st_mtime_ns, stat.st_size)
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] == state:
+            self.hits += 1
+            logging.info('\tmaterial cache hit for {} ({} hits, {} misses)'.format(filename, self.hits, self.misses))
+            return entry[1]
+        self.misses += 1
+        columns = None
+        if parser is criLoadFile:
+            store = self.store(os.path.dirname(key[0]))
+            if store is not None:
+                columns = store.get(filename, state)
+        if columns is not None:
+            source = 'compiled store'
+        else:
+            source = 'text file'
+            columns = []
+            for column in parser(filename):
+                column = np.array(column, dtype = np.float64)
+                column.setflags(write = False) # shared by all layers
+                columns.append(column)
+        self.entries[key] = (state, tuple(columns))
+        logging.info('\tmaterial cache miss for {}, loaded from {} ({} hits, {} misses)'.format(filename, source, self.hits, self.misses))
+        return self.entries[key][1]
+    
+    def identity(self, filename, parser):
+        '''
+        key of the data of filename parsed by parser, changes with the file (see ResampledCache)
+        '''
+        try:
+            stat = os.stat(filename)
+        except OSError as e:
+            raise LoadError("Could not read file {}: \n {}".format(filename, e.args[1]))
+        return (os.path.abspath(filename), parser.__name__, stat.st_mtime_ns, stat.st_size)
+        
+    def clear(self):
+        self.entries = {}
+        self.stores = {}
+        self.hits = 0
+        self.misses = 0
+
+materialCache = MaterialCache()
+
+RESAMPLEDCACHESIZE = 64 * 1024**2 # bytes
+
+def gridKey(wvl):
+    '''
+    key of a wavelength grid (hash of its values)
+    '''
+    wvl = np.ascontiguousarray(wvl, dtype = np.float64)
+    return (len(wvl), hashlib.sha1(wvl.tobytes()).hexdigest())
+
+class ResampledCache:
+    '''
+    process wide cache of n, k, cri and alpha interpolated to a wavelength grid
+    keyed by (criKey of the layer, grid key), the least recently used entries are removed if more than maxBytes are stored
+    '''
+    def __init__(self, maxBytes = RESAMPLEDCACHESIZE):
+        self.maxBytes = maxBytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+    
+    def put(self, key, entry):
+        for array in entry:
+            array.setflags(write = False) # shared by all layers
+        if key in self.entries:
+            self.bytes -= sum(array.nbytes for array in self.entries.pop(key))
+        self.entries[key] = entry
+        self.bytes += sum(array.nbytes for array in entry)
+        while self.bytes > self.maxBytes and len(self.entries) > 1:
+            oldKey, oldEntry = self.entries.popitem(last = False)
+            self.bytes -= sum(array.nbytes for array in oldEntry)
+            self.evictions += 1
+    
+    def clear(self):
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+resampledCache = ResampledCache()
+
+def resampleCRI(layer, wvl):
+    '''
+    n, k, cri and alpha of a layer (loaded by getCRI) on the wavelength grid wvl
+    cached if the layer has a criKey, otherwise only interpolated
+    '''
+    key = getattr(layer, 'criKey', None)
+    if key is not None:
+        key = (key, gridKey(wvl))
+        entry = resampledCache.get(key)
+        if entry is not None:
+            return entry
+    n = np.interp(wvl, layer.wavelength, layer.n)
+    k = np.interp(wvl, layer.wavelength, layer.k)
+    entry = (n, k, n + 1j * k, 4*np.pi*k/wvl)
+    if key is not None:
+        resampledCache.put(key, entry)
+        logging.info('\tresampled cri of {} cached ({} entries, {:.1f} MB, {} hits, {} misses, {} evicted)'.format(
+                        layer.name, len(resampledCache.entries), resampledCache.bytes / 1024**2, 
+                        resampledCache.hits, resampledCache.misses, resampledCache.evictions))
+    return entry
+
+def gradedCRI(criGrading, xMole, wvl, advanced, key = None):
+    '''
+    n and k (sublayers, wavelengths) of all sublayers of a graded layer with compositions xMole from the grading files 
+    (criGrading 'xMoles', 'Egs', 'n_idc', 'k_idc' as loaded by getCRI) in a few array operations:
+    xMole of a file: n, k of the file
+    advanced: mean of the two adjacent files shifted in energy by (Eg2 - Eg1) * xMole, where the shifted data 
+    does not cover the wavelength range n of the nearest covered wavelength and k = 0
+    otherwise: linear interpolation between the files for each wavelength
+    cached with a key of the grading files (criKey of the graded layer)
+    '''
+    wvl = np.asarray(wvl, dtype = np.float64)
+    xMole = np.atleast_1d(np.asarray(xMole, dtype = np.float64))
+    if key is not None:
+        key = ('graded', key, gridKey(xMole), gridKey(wvl), bool(advanced))
+        entry = resampledCache.get(key)
+        if entry is not None:
+            return entry
+    xMoles = np.array(criGrading['xMoles'], dtype = np.float64)
+    Egs = np.array(criGrading['Egs'], dtype = np.float64)
+    n_idx = np.array(criGrading['n_idc']).T # (wavelength, file)
+    k_idx = np.array(criGrading['k_idc']).T
+    sub = np.arange(len(xMole))[:, np.newaxis]
+    
+    if advanced:
+        # this method takes the two adjacent nk-files matching the required xMole
+        # and moves the curves according to the given Eg
+        below = xMoles[np.newaxis, :] < xMole[:, np.newaxis]
+        above = xMoles[np.newaxis, :] > xMole[:, np.newaxis]
+        outside = ~below.any(axis = 1) | ~above.any(axis = 1)
+        if np.any(outside & ~np.isin(xMole, xMoles)):
+            raise OutOfRangeError('xMole {} is outside the range of the grading files'.format(xMole[outside][0]))
+        idx1 = len(xMoles) - 1 - np.argmax(below[:, ::-1], axis = 1) # last file below
+        idx2 = np.argmax(above, axis = 1) # first file above
+        shift = ((Egs[idx2] - Egs[idx1]) * xMole)[:, np.newaxis]
+        # linear interpolation of the data on the energies eV + shift at the energies eV (NaN outside) as by interp1d
+        eV = 1239.941 / wvl
+        order = np.argsort(eV)
+        eVSorted = eV[order]
+        hi = np.clip(np.searchsorted(eVSorted, eV[np.newaxis, :] - shift), 1, len(eV) - 1)
+        lo = hi - 1
+        x_lo = eVSorted[lo] + shift
+        x_hi = eVSorted[hi] + shift
+        covered = (eV >= eVSorted[0] + shift) & (eV <= eVSorted[-1] + shift)
+        # NaN (not covered) --> nearest covered wavelength, first covered one in front of it
+        positions = np.where(covered, np.arange(len(wvl)), 0)
+        nearest = np.where(np.logical_or.accumulate(covered, axis = 1), np.maximum.accumulate(positions, axis = 1), 
+                           np.argmax(covered, axis = 1)[:, np.newaxis])
+        curves = []
+        for data, idx in [(n_idx, idx1), (n_idx, idx2), (k_idx, idx1), (k_idx, idx2)]:
+            y = data[order][:, idx].T # (sublayer, sorted energy)
+            y_lo = y[sub, lo]
+            y = (y[sub, hi] - y_lo) / (x_hi - x_lo) * (eV - x_lo) + y_lo
+            curves.append(y[sub, nearest])
+        n1, n2, k1, k2 = curves
+        n = (n1 + n2) / 2
+        k = np.where(covered, (k1 + k2) / 2, 0)
+    else:
+        j = np.clip(np.searchsorted(xMoles, xMole, side = 'right') - 1, 0, len(xMoles) - 2)
+        def interpolate(data):
+            values = (data[:, j + 1] - data[:, j]) / (xMoles[j + 1] - xMoles[j]) * (xMole - xMoles[j]) + data[:, j]
+            values = np.where(xMole <= xMoles[0], data[:, :1], values)
+            return np.where(xMole >= xMoles[-1], data[:, -1:], values).T
+        n = interpolate(n_idx)
+        k = interpolate(k_idx)
+    
+    # xMole of a grading file
+    for i, x in enumerate(xMole):
+        if x in xMoles:
+            n[i] = n_idx[:, np.nonzero(xMoles == x)[0][0]]
+            k[i] = k_idx[:, np.nonzero(xMoles == x)[0][0]]
+    entry = (np.ascontiguousarray(n), np.ascontiguousarray(k))
+    if key is not None:
+        resampledCache.put(key, entry)
+    return entry
+
+def loadMaterialDB(path):
+    '''
+    look for files in directory path
+    return a dictionary with Materialnames and corresponding absolute path
+    '''
+    included_extenstions = ['dat']
+    MaterialFiles = [fn for fn in os.listdir(path) if any([fn.endswith(ext) for ext in included_extenstions])]
+    Materials = [Mat.replace('.dat', '') for Mat in MaterialFiles]
+    criFilePaths = [os.path.join(path, i) for i in MaterialFiles]
+    return dict(zip(Materials, criFilePaths))
+
+def logWarning(message):
+    logging.warning('\t' + message)
+
+class CRILoader:
+    '''
+    callable which loads the cri data of a layer (getCRI callback of LayerStack)
+    materialDB: dictionary of material names and file paths (see loadMaterialDB)
+    warning: function called with a message if the wavelength range is not covered
+    '''
+    def __init__(self, materialDB, settings, warning = logWarning):
+        self.materialDB = materialDB
+        self.settings = settings
+        self.warning = warning
+
+    def __call__(self, layer):
+        '''
+        set wavelength, n and k of layer as loaded (not interpolated)
+        and layer.criKey which identifies this data for the ResampledCache (None if not cachable)
+        '''
+        fName = ''
+        wvl = self.settings['wavelength']
+        layer.criKey = None
+        if layer.criSource == 'from database':
+            if layer.criDBName not in self.materialDB:
+                raise LoadError("There is no material {} in the material database!".format(layer.criDBName))
+            fName = self.materialDB[layer.criDBName]
+        elif layer.criSource == 'from file':
+            fName = layer.criFile['path']
+            if layer.criFile['alpha']:
+                w, k = materialCache.load(fName, criLoadAlphaFile)
+                layer.criKey = (materialCache.identity(fName, criLoadAlphaFile), float(layer.criFile['n']))
+                layer.n = np.ones(len(w)) * layer.criFile['n']
+                layer.k = k
+                layer.wavelength = w
+                return
+        elif layer.criSource == 'constant':
+            n = layer.criConstant[0]
+            k = layer.criConstant[1]
+            layer.criKey = ('constant', float(n), float(k))
+            layer.wavelength = wvl
+            layer.n = np.ones(len(wvl)) * n
+            layer.k = np.ones(len(wvl)) * k
+            return
+        elif layer.criSource == 'dielectric function':
+            layer.n = layer.dielectricFunction['n'][::-1]
+            layer.k = layer.dielectricFunction['k'][::-1]
+            layer.wavelength =  layer.dielectricFunction['wvl'][::-1]
+            return
+
+        elif layer.criSource == 'graded':
+            layer.criGrading['xMoles'] = []
+            layer.criGrading['Egs'] = []
+            layer.criGrading['n_idc'] = []
+            layer.criGrading['k_idc'] = []
+            grid = gridKey(wvl)
+            for file in layer.criGrading['files']:
+                w, n, k = materialCache.load(file[2], criLoadFile)
+                if w[0] > wvl[0] or w[-1] < wvl[-1]:
+                    self.warning('The cri file of {} does no cover the specified wavelength range'.format(layer.name))
+                key = (materialCache.identity(file[2], criLoadFile), grid)
+                entry = resampledCache.get(key)
+                if entry is None:
+                    n = np.interp(wvl, w, n)
+                    k = np.interp(wvl, w, k)
+                    entry = (n, k, n + 1j * k, 4*np.pi*k/wvl) # same entry as resampleCRI of this file
+                    resampledCache.put(key, entry)
+                n, k = entry[:2]
+                layer.criGrading['xMoles'].append(file[0])
+                layer.criGrading['Egs'].append(file[1])
+                layer.criGrading['n_idc'].append(n)
+                layer.criGrading['k_idc'].append(k)
+            layer.criKey = tuple((materialCache.identity(file[2], criLoadFile), float(file[0]), float(file[1])) for file in layer.criGrading['files'])
+            # set first file values to defaults for plot when "show optical constants" is clicked
+            layer.wavelength = wvl
+            layer.n = layer.criGrading['n_idc'][0]
+            layer.k = layer.criGrading['k_idc'][0]
+            return
+
+        if fName:
+            w, n, k = materialCache.load(fName, criLoadFile)
+            layer.criKey = materialCache.identity(fName, criLoadFile)
+            if w[0] > wvl[0] or w[-1] < wvl[-1]:
+                    self.warning('The cri file of {} does no cover the specified wavelength range'.format(layer.name))
+            layer.wavelength = w
+            layer.n = n
+            layer.k = k
+        else:
+            raise LoadError("There is no cri file path for {} defined!".format(layer.name))
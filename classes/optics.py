@@ -3,15 +3,56 @@ Class for stack of layers as used for calculation
 '''
 
 import os
+import copy
+import time
+import functools
 import logging
 import numpy as np
 import scipy as sp
+from concurrent.futures import ThreadPoolExecutor
 from numpy import cos #, inf, zeros, array, exp, conj
-from collections import OrderedDict
+from collections import OrderedDict, namedtuple
 
 from scipy import integrate
 
 from classes.errors import *
+from classes.spectra import spectrumLibrary
+
+# entry of the interface table of Optics (see Optics.fresnel)
+Fresnel = namedtuple('Fresnel', ['r_jk', 't_jk', 'r_kj', 't_kj', 'R_jk', 'R_kj'])
+
+# calculation stages of Optics (see Optics.calculate and Optics.request): 
+# method, prerequisites (calculated before) and outputs (attributes or scalars)
+STAGES = OrderedDict([
+    ('matrices', ('updateMatrices', [], [])),
+    ('stack', ('calcStack', ['matrices'], ['RspectrumSystem', 'TspectrumSystem', 'AspectrumSystem', 
+                                           'absorbance (%)', 'reflectance (%)', 'transmittance (%)', 'Chi Square R',
+                                           'absorbance (mA/cm²)', 'reflectance (mA/cm²)', 'transmittance (mA/cm²)'])),
+    ('field intensity', ('calcFieldIntensity', ['stack'], ['Esquare', 'EsquareProfile'])),
+    ('absorption', ('calcAbsorption', ['field intensity'], ['integrAbsorption', 
+                                           'absorption layerwise (%) ', 'absorption layerwise (mA/cm²) '])),
+    ('QE', ('calcQE', ['absorption'], ['EQE', 'Chi Square EQE', 'collection layerwise (%) ', 'collection layerwise (mA/cm²) '])),
+    ('generation', ('calcGeneration', ['QE'], ['G_x', 'el_G_x', 'generatedCurrent', 'generated current (mA/cm²)'])),
+    ('ellipsometry', ('calcEllipsometry', ['matrices'], ['psi', 'delta'])),
+    ('Lambert-Beer', ('calcOptBeamTotal', [], ['absorbance LB (%)', 'absorbance LB (mA/cm²)', 
+                                           'absorption layerwise LB (%) ', 'absorption layerwise LB (mA/cm²) ',
+                                           'collection layerwise LB (%) ', 'collection layerwise LB (mA/cm²) '])),
+    ])
+
+def stage(name):
+    '''
+    decorator of the method of a calculation stage of Optics: the stage is done after each call (see Optics.calculate)
+    '''
+    def decorator(method):
+        @functools.wraps(method)
+        def run(self, *args, **kwargs):
+            result = method(self, *args, **kwargs)
+            self.stagesDone.add(name)
+            return result
+        return run
+    return decorator
+
+FIELDCHUNKSIZE = 4*1024**2 # bytes of one depth chunk (complex field of all wavelengths) if 2D data is not kept
 
 def snell(cri1, cri2, theta1):
     '''
@@ -27,7 +68,10 @@ def r_ij(polarization, rough, d_rough, wvl, cri_i, cri_j, th_i, th_j):
     cri_i, cri_j are (complex) refractive index for incident and final
     th_i, th_j are (complex) propegation angle for incident and final
     (in radians, where 0=normal). "th" stands for "theta".
+    a tuple of polarizations gives the coefficients of all of them (leading polarization axis)
     """
+    if isinstance(polarization, tuple):
+        return np.array([r_ij(pol, rough, d_rough, wvl, cri_i, cri_j, th_i, th_j) for pol in polarization])
     if polarization == 's':
         #return 2 * n_i * cos(th_i) / (n_i * cos(th_i) + n_f * cos(th_f))
         r_jk = ((cri_i * cos(th_i) - cri_j * cos(th_j)) /
@@ -47,6 +91,8 @@ def t_ij(polarization, rough, d_rough, wvl, cri_i, cri_j, th_i, th_j):
     transmission amplitude (frem Fresnel equations)
     d_rough gives the roughness height of the j-th interface
     """
+    if isinstance(polarization, tuple):
+        return np.array([t_ij(pol, rough, d_rough, wvl, cri_i, cri_j, th_i, th_j) for pol in polarization])
     if polarization == 's':
         t_jk = 2 * cri_i * cos(th_i) / (cri_i * cos(th_i) + cri_j * cos(th_j))
     elif polarization == 'p':
@@ -55,6 +101,150 @@ def t_ij(polarization, rough, d_rough, wvl, cri_i, cri_j, th_i, th_j):
             # r_jk = r_jk(0) * exp(-2(2piZ/lambda)²)
             t_jk = t_jk * np.exp(-0.5 * (2* np.pi * d_rough/wvl)**2 * (cri_j - cri_i)**2)
     return t_jk
+    
+def intensityMatrix(S):
+    '''
+    intensity matrix of a coherent part from its (wavelength, 2, 2) field system matrix
+    (or (polarization, wavelength, 2, 2) for both polarizations)
+    '''
+    S00 = S[..., 0, 0]
+    S01 = S[..., 0, 1]
+    S10 = S[..., 1, 0]
+    detS = np.linalg.det(S)
+    
+    partIntensity = np.zeros(S.shape, np.complex)
+    partIntensity[..., 0, 0] = np.abs(S00)**2
+    partIntensity[..., 0, 1] = - np.abs(S01)**2
+    partIntensity[..., 1, 0] = np.abs(S10)**2
+    partIntensity[..., 1, 1] = (np.abs(detS)**2 - np.abs(S01 * S10)**2) / np.abs(S00)**2
+    return partIntensity
+
+def interfaceMatrix(r_jk, t_jk, r_kj, t_kj, hazeR = 1., hazeT = 1., hazeRInc = 1., hazeTInc = 1., mixInc = 1.):
+    '''
+    coherent and incoherent interface matrix from the Fresnel coefficients of an interface (see Optics.interfaceMatrices)
+    '''
+    shape = np.shape(t_jk) + (2, 2) # (polarization, angle,) wavelength, 2, 2
+    InterfaceMatrix = np.zeros(shape, np.complex)
+    InterfaceMatrixInc = np.zeros(shape, np.complex)
+    
+    # coherent
+    InterfaceMatrix[..., 0, 0] = 1 / (hazeT * t_jk)
+    InterfaceMatrix[..., 0, 1] = (hazeR * r_jk) / (hazeT * t_jk)
+    InterfaceMatrix[..., 1, 0] = (hazeR * r_jk) / (hazeT * t_jk)
+    InterfaceMatrix[..., 1, 1] = (hazeT**2 + (hazeR**2 - hazeT**2) * r_jk**2) / (hazeT * t_jk)
+    
+    # incoherent
+    InterfaceMatrixInc[..., 0, 0] = 1 / np.abs(hazeTInc * t_jk)**2
+    InterfaceMatrixInc[..., 0, 1] = - np.abs(hazeRInc * r_jk)**2 / np.abs(hazeTInc * t_jk)**2
+    InterfaceMatrixInc[..., 1, 0] = np.abs(hazeRInc * r_jk)**2 / np.abs(hazeTInc * t_jk)**2
+    InterfaceMatrixInc[..., 1, 1] = (np.abs(hazeTInc**2 * t_jk * t_kj)**2 - np.abs(mixInc * r_jk * r_kj)**2) / np.abs(hazeTInc * t_jk)**2
+    return InterfaceMatrix, InterfaceMatrixInc
+
+def resultName(layer):
+    '''
+    name of the layer of the original stack whose results contain the results of layer
+    (sublayers of graded layers and periods of repeat blocks are summed up)
+    '''
+    if layer.criSource == 'graded' or getattr(layer, 'periods', None):
+        return layer.parentName
+    return layer.name
+
+def resultParts(layer, attribute):
+    '''
+    (name of the layer of the original stack, results) of a layer of the layer sequence for attribute 'absorption', 'collected', 
+    'absorptionLB' or 'collectedLB', collapsed periods of repeat blocks give the results of each layer of the block 
+    (see Optics.blockResults and Optics.blockLambertBeer)
+    '''
+    if getattr(layer, 'block', None):
+        blockResults = getattr(layer, 'block' + attribute[0].upper() + attribute[1:])
+        return [(blockLayer.name, results) for blockLayer, results in zip(layer.block, blockResults)]
+    return [(resultName(layer), getattr(layer, attribute))]
+
+def trapzWeights(x):
+    '''
+    weights w of the trapezoidal rule: integrate.trapz(y, x, axis = 0) == np.dot(w, y)
+    '''
+    weights = np.zeros(len(x))
+    weights[:-1] += np.diff(x) / 2
+    weights[1:] += np.diff(x) / 2
+    return weights
+
+def dFresnel(polarization, rough, d_rough, wvl, cri_i, cri_j, th_i, th_j, dcri_i, dcri_j):
+    '''
+    derivatives of r_ij and t_ij for the changes dcri_i and dcri_j of the (complex) refractive indices,
+    the angles change by Snell's law (cri*sin(theta) is constant)
+    '''
+    cos_i = cos(th_i)
+    cos_j = cos(th_j)
+    dcos_i = np.sin(th_i)**2 / (cri_i * cos_i) * dcri_i
+    dcos_j = np.sin(th_j)**2 / (cri_j * cos_j) * dcri_j
+    if polarization == 's':
+        a = cri_i * cos_i
+        b = cri_j * cos_j
+        da = dcri_i * cos_i + cri_i * dcos_i
+        db = dcri_j * cos_j + cri_j * dcos_j
+        r = (a - b) / (a + b)
+        t = 2 * a / (a + b)
+        dr = dt = 2 * (b * da - a * db) / (a + b)**2
+    elif polarization == 'p':
+        a = cri_j * cos_i
+        b = cri_i * cos_j
+        da = dcri_j * cos_i + cri_j * dcos_i
+        db = dcri_i * cos_j + cri_i * dcos_j
+        r = (a - b) / (a + b)
+        dr = 2 * (b * da - a * db) / (a + b)**2
+        e = cri_i * cos_i
+        de = dcri_i * cos_i + cri_i * dcos_i
+        t = 2 * e / (a + b)
+        dt = 2 * (de * (a + b) - e * (da + db)) / (a + b)**2
+    if rough:
+        factor = (2 * np.pi * d_rough / wvl)**2
+        g = np.exp(-2 * factor * cri_i**2)
+        dr = dr * g - r * g * 4 * factor * cri_i * dcri_i
+        g = np.exp(-0.5 * factor * (cri_j - cri_i)**2)
+        dt = dt * g - t * g * factor * (cri_j - cri_i) * (dcri_j - dcri_i)
+    return dr, dt
+
+def dProduct(A, dA, B, dB):
+    '''
+    derivative (parameter, wavelength, 2, 2) of the product of the (wavelength, 2, 2) matrices A and B
+    from their derivatives dA and dB (None if zero)
+    '''
+    if dA is None:
+        return None if dB is None else np.matmul(A, dB)
+    if dB is None:
+        return np.matmul(dA, B)
+    return np.matmul(dA, B) + np.matmul(A, dB)
+
+def dSqrt(A, dA):
+    '''
+    derivative of the elementwise square root of A (zero where A is zero)
+    '''
+    if dA is None:
+        return None
+    root = np.broadcast_to(np.sqrt(A), dA.shape)
+    return np.divide(dA, 2 * root, out = np.zeros(dA.shape, np.complex), where = root != 0)
+
+def dIntensityMatrix(S, dS):
+    '''
+    derivative of intensityMatrix(S) from the derivative dS (parameter, wavelength, 2, 2) of the field system matrix
+    '''
+    if dS is None:
+        return None
+    S00, S01, S10, S11 = S[:, 0, 0], S[:, 0, 1], S[:, 1, 0], S[:, 1, 1]
+    dS00, dS01, dS10, dS11 = dS[..., 0, 0], dS[..., 0, 1], dS[..., 1, 0], dS[..., 1, 1]
+    detS = S00 * S11 - S01 * S10
+    ddetS = dS00 * S11 + S00 * dS11 - dS01 * S10 - S01 * dS10
+    I00 = np.abs(S00)**2
+    I11 = (np.abs(detS)**2 - np.abs(S01 * S10)**2) / I00
+    dI00 = 2 * np.real(np.conj(S00) * dS00)
+    dPartIntensity = np.zeros(dS.shape, np.complex)
+    dPartIntensity[..., 0, 0] = dI00
+    dPartIntensity[..., 0, 1] = - 2 * np.real(np.conj(S01) * dS01)
+    dPartIntensity[..., 1, 0] = 2 * np.real(np.conj(S10) * dS10)
+    dPartIntensity[..., 1, 1] = (2 * np.real(np.conj(detS) * ddetS) - 2 * np.real(np.conj(S01 * S10) * (dS01 * S10 + S01 * dS10))
+                                    - I11 * dI00) / I00
+    return dPartIntensity
 
 class Optics:
     
@@ -150,9 +340,22 @@ class Optics:
         self.calculationOptions = { 'LBcorrection': settings['LB correct for Reflection']
                                     }
         self.rough = settings['roughness Fresnel model']
+        if 'vectorized engine' in settings:
+            self.vectorized = settings['vectorized engine']
+        else:
+            self.vectorized = True
+        if 'keep 2D data' in settings:
+            self.keep2D = settings['keep 2D data']
+        else:
+            self.keep2D = True
         self.makeSpectrum()
         
-        if settings['polarization']:
+        # 0 => s, 1 => p, 2 => unpolarized (s and p at once, all matrices with a leading polarization axis)
+        self.unpolarized = settings['polarization'] == 2
+        if self.unpolarized:
+            self.pol = ('s', 'p')
+            self.vectorized = True
+        elif settings['polarization']:
             self.pol = 'p'
         else:
             self.pol = 's'
@@ -163,16 +366,20 @@ class Optics:
         #self.A, self.R = self.calcSystem()
         
         self.LayerResults = {}
-        self.x = []
-        t = np.cumsum(self.layerstack.thicknesses)
-        
         for i, layer in enumerate(self.stack):
             self.LayerResults[layer.name] = self.stack[i]
-            if i == 0:
-                self.x.extend(self.LayerResults[layer.name].x)
-            else:
-                self.x.extend(self.LayerResults[layer.name].x + t[i-1])
-        self.x = np.array(self.x)
+        self.makeX()
+        # matrices to be calculated by the next calcStack (None = all)
+        self.dirtyInterfaces = None
+        self.dirtyLayers = None
+        # Fresnel coefficients per (interface, polarization, roughness), see fresnel
+        self.fresnelTable = {}
+        # calculation stages done since the last change of the stack (see calculate)
+        self.stagesDone = set()
+        if 'parallel stages' in settings:
+            self.threads = settings['parallel stages']
+        else:
+            self.threads = False
         
         
         self.references = references
@@ -181,6 +388,135 @@ class Optics:
         #self.calcAllMatrices()
         
         
+    def makeX(self):
+        '''
+        depth of all mesh points in the stack
+        '''
+        self.x = []
+        t = np.cumsum(self.layerstack.thicknesses)
+        for i, name in enumerate(self.names):
+            if i == 0:
+                self.x.extend(self.LayerResults[name].x)
+            else:
+                self.x.extend(self.LayerResults[name].x + t[i-1])
+        self.x = np.array(self.x)
+        
+    def update(self, stack, dirty):
+        '''
+        update after parameters of layers of stack changed (see LayerStack.update), 
+        only the changed layer and interface matrices and their products are calculated again by calcStack
+        returns False if a new LayerStack and Optics are required
+        '''
+        startUpdateTime = time.time()
+        changes = self.layerstack.update(stack, dirty)
+        if changes is None:
+            return False
+        changedLayers, changedInterfaces = changes
+        if self.dirtyLayers is not None:
+            self.dirtyLayers.update(changedLayers)
+        if self.dirtyInterfaces is not None:
+            self.dirtyInterfaces.update(changedInterfaces)
+        self.clearFresnel(changedInterfaces)
+        if all(kinds <= {'collection'} for kinds in dirty.values()):
+            self.invalidate('QE', 'Lambert-Beer')
+        else:
+            self.invalidate('matrices', 'Lambert-Beer')
+        self.HazeOn = self.layerstack.HazeOn
+        self.StackThickness = np.sum(self.thicknesses)
+        self.makeX()
+        self.scalars['creation time (s)'] = time.time() - startUpdateTime
+        return True
+        
+    @stage('matrices')
+    def updateMatrices(self):
+        '''
+        interface matrices and products of layer and interface matrix which changed since the last calculation
+        '''
+        self.setInterfaceMatrices(self.dirtyInterfaces)
+        if self.dirtyInterfaces is None or self.dirtyLayers is None:
+            self.setStepMatrices()
+        else:
+            self.setStepMatrices(self.dirtyLayers | set([i for i in self.dirtyInterfaces if i >= 0]))
+        self.dirtyInterfaces = set()
+        self.dirtyLayers = set()
+        
+    def invalidate(self, *stages):
+        '''
+        the stages and all stages which require them are calculated again when requested
+        '''
+        stages = set(stages)
+        for stage, (method, prerequisites, outputs) in STAGES.items():
+            if stages.intersection(prerequisites):
+                stages.add(stage)
+        self.stagesDone -= stages
+        
+    def calculate(self, *stages, threads = None):
+        '''
+        runs the stages (see STAGES) and their prerequisites which are not done yet, each stage once
+        threads: independent stages (e.g. ellipsometry and field intensity) run at the same time in threads,
+        default settings['parallel stages']
+        '''
+        todo = []
+        def add(stage):
+            if stage in self.stagesDone or stage in todo:
+                return
+            if stage not in STAGES:
+                raise NotImplementedError('unknown calculation stage {}'.format(stage))
+            for prerequisite in STAGES[stage][1]:
+                add(prerequisite)
+            todo.append(stage)
+        for stage in stages:
+            add(stage)
+        if threads is None:
+            threads = self.threads
+        if not threads or len(todo) < 2:
+            for stage in todo:
+                self.runStage(stage)
+            return
+        # each stage waits for its prerequisites, enough threads that all stages can wait at the same time
+        with ThreadPoolExecutor(max_workers = len(todo)) as pool:
+            futures = {}
+            for stage in todo:
+                waitFor = [futures[prerequisite] for prerequisite in STAGES[stage][1] if prerequisite in futures]
+                futures[stage] = pool.submit(self.runStage, stage, waitFor)
+            for stage in todo:
+                futures[stage].result()
+                
+    def runStage(self, stage, waitFor = ()):
+        '''
+        runs one stage after the futures of its prerequisites (see calculate) are finished
+        '''
+        for future in waitFor:
+            future.result()
+        getattr(self, STAGES[stage][0])()
+        
+    def request(self, *outputs, threads = None):
+        '''
+        values of the outputs (attribute names or scalars of STAGES, e.g. 'EQE', 'psi', 'generated current (mA/cm²)'), 
+        only the stages not done yet are calculated (see calculate)
+        returns the value of one output or a list of values
+        '''
+        stages = []
+        for output in outputs:
+            stage = [stage for stage, (method, prerequisites, stageOutputs) in STAGES.items() if output in stageOutputs]
+            if not stage:
+                raise NotImplementedError('no calculation stage for {}'.format(output))
+            stages.append(stage[0])
+        self.calculate(*stages, threads = threads)
+        values = [self.scalars[output] if output in self.scalars else getattr(self, output) for output in outputs]
+        return values[0] if len(values) == 1 else values
+        
+    def setStepMatrices(self, layers = None):
+        '''
+        product of layer matrix and following interface matrix (field and intensity) of the layers with indices in layers (default all)
+        '''
+        for i, name in enumerate(self.names):
+            if layers is not None and i not in layers:
+                continue
+            layer = self.LayerResults[name]
+            layer.StepMatrix = np.matmul(layer.LayerMatrix, layer.InterfaceMatrix)
+            layer.StepMatrixInc = np.matmul(layer.LayerMatrixInc, layer.InterfaceMatrixInc)
+        
     def addPlot(self, plotDict, category = 'spectra' , subcategory = 'total A,R,T'):
         if category == '2D':
             self.availablePlots[category].update(plotDict)
@@ -238,145 +574,382 @@ class Optics:
         logging.info('\t--> scaled light intensity is {:.4f} W/m^2'.format(self.Imax * intensity))
         
     def loadSpectrum(self):
-         # Constants
-        h = 6.62606957e-34 # Js Planck's constant
-#        he = 4.1356675e-15 # eVs
-        c = 2.99792458e8 #m/s speed of light
-        q = 1.602176e-19 #C electric chargeq 
         self.spectrumFile = self.settings['spectrum']
-        SpectrumFile = os.getcwd() + '\\spectra\\' + self.spectrumFile
-        logging.info('\tload spectrum file {}...'.format(SpectrumFile))
-        data = np.loadtxt(SpectrumFile, comments='>')
-        
-        self.Imax = np.sum(data[:, 1])
-        
-        logging.info('\tnormalize total spectrum [W/m^2s] to wavelength-resolved [W/m^2s nm] to allow interpolation...')
-        # norm the spectra (2nd column P * dlambda [W/m²s]) to P [W/m²s_nm] by Pdlambda/dlambda with dlambda as (lambda_x+1 - lambda_x-1)/2; first and last seperately
-        spec_norm = np.zeros(data.shape[0])
-        spec_norm[0] = data[0, 1] / (data[1, 0] - data[0, 0])
-        spec_norm[-1] = data[-1, 1] / (data[-1, 0] - data[-1-1, 0])
-        for i in range(1, data.shape[0]-1):
-            spec_norm[i] = data[i, 1] / ((data[i+1, 0] - data[i-1, 0]) / 2)
-            
-        self.AM15 = np.interp(self.wavelength, data[:, 0], spec_norm)
-        
-        logging.info('\tcalculate number of incoming photons per m^2s per wavelength = P / Eph...')
-        # number of photons per m²s per wavelength =  P / Eph [1/m²s]
-        N_ph_s_wl = self.wavelength * self.AM15 * 1e-9 / (h * c)
-        
-        # current J_wl = N_ph_s_wl * q --> J = sum(J_wl) A/m² = 0.1 mA/cm²
-        logging.info('\tcalculate maximum current Jmax = integr(q * N_ph)...')
-        self.spectrumCurrent = N_ph_s_wl * q * 0.1
-        self.Jmax = integrate.trapz(self.spectrumCurrent, x=self.wavelength, axis = 0)
+        # adaptive wavelengths (see classes.simulation.adaptiveWavelengths): spectrum averaged over the uniform grid
+        uniform = self.settings['wavelength uniform'] if 'wavelength uniform' in self.settings else None
+        spectrum = spectrumLibrary.get(self.spectrumFile, self.wavelength, uniform) # normalized to W/m²nm and interpolated
+        self.Imax = spectrum.Imax
+        self.AM15 = spectrum.power
+        self.spectrumCurrent = spectrum.current
+        self.Jmax = spectrum.Jmax
         logging.info('\t--> Jmax is {:.4f} mA/cm^2'.format(self.Jmax))
         
         self.scalars['Jmax (mA/cm²)'] = self.Jmax
         
     def calcAllMatrices(self):
-        self.setInterfaceMatrices()
+        self.updateMatrices()
         #self.setLayerPartialSystemMatrices()
         self.getSystemMatrix()
             
-    def setInterfaceMatrices(self):
+    def setInterfaceMatrices(self, interfaces = None):
         '''
         Interface matrix of interface between each layer with its following
         seperate if IF is coherent (field Fresnel-coefficient) or incoherent (intensity Fresnel-coefficient)
         both are calculated for all layers!!!
+        interfaces: indices of the interfaces to calculate (-1 first interface, i after layer i), default all
         '''
-        logging.info('\tcreate interface matrices for all layers...')
-        #first interface Air/layer1
-        cri_i = np.ones((len(self.wavelength)), np.complex)
-
-        t_jk = t_ij(self.pol, self.rough, self.LayerResults[self.names[0]].sroughThickness, self.wavelength, cri_i, self.LayerResults[self.names[0]].cri,
-                    self.layerstack.theta0, self.LayerResults[self.names[0]].theta)
-        r_jk = r_ij(self.pol, self.rough, self.LayerResults[self.names[0]].sroughThickness, self.wavelength, cri_i, self.LayerResults[self.names[0]].cri,
-                    self.layerstack.theta0, self.LayerResults[self.names[0]].theta)
-        t_kj = t_ij(self.pol, self.rough, self.LayerResults[self.names[0]].sroughThickness, self.wavelength, self.LayerResults[self.names[0]].cri, cri_i,
-                    self.LayerResults[self.names[0]].theta, self.layerstack.theta0)
-        r_kj = r_ij(self.pol, self.rough, self.LayerResults[self.names[0]].sroughThickness, self.wavelength, self.LayerResults[self.names[0]].cri, cri_i,
-                     self.LayerResults[self.names[0]].theta, self.layerstack.theta0)
-                    
-
-        self.firstInterfaceMatrix = np.zeros((len(self.wavelength), 2, 2), np.complex)
-        self.firstInterfaceMatrixInc = np.zeros((len(self.wavelength), 2, 2), np.complex)
+        logging.info('\tcreate interface matrices for {} layers...'.format('all' if interfaces is None else len(interfaces)))
+        self.clearFresnel(interfaces)
+        if interfaces is None or -1 in interfaces:
+            self.setFirstInterfaceMatrix()
+        for i in range(len(self.names)):
+            if interfaces is not None and i not in interfaces:
+                continue
+            layer1 = self.LayerResults[self.names[i]]
+            layer1.InterfaceMatrix, layer1.InterfaceMatrixInc = self.interfaceMatrices(i, self.pol)
+            
+    def setFirstInterfaceMatrix(self):
+        '''
+        interface matrix air/first layer (coherent and incoherent)
+        '''
+        self.firstInterfaceMatrix, self.firstInterfaceMatrixInc = self.interfaceMatrices(-1, self.pol)
         
-        if self.LayerResults[self.names[0]].srough:
-            hazeR = self.LayerResults[self.names[0]].sroughHazeR
-            hazeT = self.LayerResults[self.names[0]].sroughHazeT
+    def clearFresnel(self, interfaces = None):
+        '''
+        remove the Fresnel coefficients of the interfaces (indices as in setInterfaceMatrices, default all) from the interface table
+        '''
+        if interfaces is None:
+            self.fresnelTable = {}
         else:
-            hazeR = 0
-            hazeT = 0
-        hazeR = np.sqrt(1-hazeR)
-        hazeT = np.sqrt(1-hazeT)
+            for key in [key for key in list(self.fresnelTable) if key[0] in interfaces]:
+                del self.fresnelTable[key]
         
-        # coherent
-        self.firstInterfaceMatrix[:, 0, 0] = 1 / (hazeT * t_jk)
-        self.firstInterfaceMatrix[:, 0, 1] = (hazeR * r_jk) / (hazeT * t_jk)
-        self.firstInterfaceMatrix[:, 1, 0] = (hazeR * r_jk) / (hazeT * t_jk)
-        self.firstInterfaceMatrix[:, 1, 1] =  (hazeT**2 + (hazeR**2 - hazeT**2) * r_jk**2) / (hazeT * t_jk)
-        
-        # incoherent
-        self.firstInterfaceMatrixInc[:, 0, 0] = 1 / np.abs(t_jk)**2
-        self.firstInterfaceMatrixInc[:, 0, 1] = - np.abs(r_jk)**2 / np.abs(t_jk)**2
-        self.firstInterfaceMatrixInc[:, 1, 0] = np.abs(r_jk)**2 / np.abs(t_jk)**2
-        self.firstInterfaceMatrixInc[:, 1, 1] = (np.abs(t_jk * t_kj)**2 - np.abs(r_jk * r_kj)**2) / np.abs(t_jk)**2
-            
-        for i in range(len(self.names)):
+    def fresnel(self, i, pol, rough = True):
+        '''
+        Fresnel coefficients of interface i (-1 first interface, i after layer i) from the interface table:
+        r, t from above (jk) and below (kj) and the reflectances R = |r|², vectorized over (angle and) wavelength
+        calculated once per interface, polarization and roughness and shared by stack optics, ellipsometry, 
+        diffuse light and derivatives until the interface changes (see clearFresnel)
+        pol is 's', 'p' or ('s', 'p') for both at once (leading polarization axis)
+        rough: with the roughness Fresnel model (if switched on, never at the last interface)
+        '''
+        rough = bool(rough and self.rough) and i < len(self.names) - 1
+        key = (i, pol, rough)
+        if key in self.fresnelTable:
+            return self.fresnelTable[key]
+        if isinstance(pol, tuple):
+            coefficients = zip(*[self.fresnel(i, p, rough) for p in pol])
+            self.fresnelTable[key] = Fresnel(*[np.array(c) for c in coefficients])
+            return self.fresnelTable[key]
+        cri_i = np.ones((len(self.wavelength)), np.complex)
+        if i == -1:
+            #first interface Air/layer
+            layer = self.LayerResults[self.names[0]]
+            d_rough, cri_j, cri_k, th_j, th_k = layer.sroughThickness, cri_i, layer.cri, self.layerstack.theta0, layer.theta
+        elif i < len(self.names)-1:
             layer1 = self.LayerResults[self.names[i]]
-            if i < len(self.stack)-1:
-                layer2 = self.LayerResults[self.names[i+1]]
-                # for TE polarized waves
-                t_jk = t_ij(self.pol, self.rough, layer2.sroughThickness, self.wavelength, layer1.cri, layer2.cri, layer1.theta, layer2.theta)
-                r_jk = r_ij(self.pol, self.rough, layer2.sroughThickness, self.wavelength, layer1.cri, layer2.cri, layer1.theta, layer2.theta)
-                t_kj = t_ij(self.pol, self.rough, layer2.sroughThickness, self.wavelength, layer2.cri, layer1.cri, layer2.theta, layer1.theta)
-                r_kj = r_ij(self.pol, self.rough, layer2.sroughThickness, self.wavelength, layer2.cri, layer1.cri, layer2.theta, layer1.theta)
-                
-                layer1.InterfaceMatrix = np.zeros((len(self.wavelength), 2, 2), np.complex)
-                layer1.InterfaceMatrixInc = np.zeros((len(self.wavelength), 2, 2), np.complex)
-                
-                if layer2.srough:
-                    hazeR = layer2.sroughHazeR
-                    hazeT = layer2.sroughHazeT
-                else:
-                    hazeR = 0
-                    hazeT = 0
-                
-                hazeR = np.sqrt(1-hazeR)
-                hazeT = np.sqrt(1-hazeT)
-                #print(hazeR, hazeT)
-        
-                # coherent
-                layer1.InterfaceMatrix[:, 0, 0] = 1 / (hazeT * t_jk)
-                layer1.InterfaceMatrix[:, 0, 1] = (hazeR * r_jk) / (hazeT * t_jk)
-                layer1.InterfaceMatrix[:, 1, 0] = (hazeR * r_jk) / (hazeT * t_jk)
-                layer1.InterfaceMatrix[:, 1, 1] = (hazeT**2 + (hazeR**2 - hazeT**2) * r_jk**2) / (hazeT * t_jk)
-                
-                # incoherent
-                layer1.InterfaceMatrixInc[:, 0, 0] = 1 / np.abs(hazeT * t_jk)**2
-                layer1.InterfaceMatrixInc[:, 0, 1] = - np.abs(hazeR * r_jk)**2 / np.abs(hazeT * t_jk)**2
-                layer1.InterfaceMatrixInc[:, 1, 0] = np.abs(hazeR * r_jk)**2 / np.abs(hazeT * t_jk)**2
-                layer1.InterfaceMatrixInc[:, 1, 1] = (np.abs(hazeT**2 * t_jk * t_kj)**2 - np.abs((hazeR**2 - hazeT**2) * r_jk * r_kj)**2) / np.abs(hazeT * t_jk)**2                    
-            
+            layer2 = self.LayerResults[self.names[i+1]]
+            d_rough, cri_j, cri_k, th_j, th_k = layer2.sroughThickness, layer1.cri, layer2.cri, layer1.theta, layer2.theta
+        else:
+            #last interface layer1/Air
+            layer1 = self.LayerResults[self.names[i]]
+            self.theta_out = snell(layer1.cri, cri_i, layer1.theta)
+            d_rough, cri_j, cri_k, th_j, th_k = 0, layer1.cri, cri_i, layer1.theta, self.theta_out
+        if not rough:
+            d_rough = 0
+        wvl = self.wavelength
+        r_jk = r_ij(pol, rough, d_rough, wvl, cri_j, cri_k, th_j, th_k)
+        r_kj = r_ij(pol, rough, d_rough, wvl, cri_k, cri_j, th_k, th_j)
+        self.fresnelTable[key] = Fresnel(r_jk, t_ij(pol, rough, d_rough, wvl, cri_j, cri_k, th_j, th_k),
+                                         r_kj, t_ij(pol, rough, d_rough, wvl, cri_k, cri_j, th_k, th_j),
+                                         np.abs(r_jk)**2, np.abs(r_kj)**2)
+        return self.fresnelTable[key]
+        
+    def interfaceMatrices(self, i, pol):
+        '''
+        coherent and incoherent interface matrix of interface i (-1 first interface, i after layer i)
+        pol is 's', 'p' or ('s', 'p') for both at once (leading polarization axis in front of angle and wavelength)
+        '''
+        hazeR = hazeT = hazeRInc = hazeTInc = 1.
+        mixInc = 1. # factor of r_jk * r_kj in the incoherent matrix
+        if i == -1:
+            #first interface Air/layer
+            layer = self.LayerResults[self.names[0]]
+            if layer.srough:
+                hazeR = np.sqrt(1 - layer.sroughHazeR)
+                hazeT = np.sqrt(1 - layer.sroughHazeT)
+        elif i < len(self.stack)-1:
+            layer2 = self.LayerResults[self.names[i+1]]
+            if layer2.srough:
+                hazeR = np.sqrt(1 - layer2.sroughHazeR)
+                hazeT = np.sqrt(1 - layer2.sroughHazeT)
+            hazeRInc, hazeTInc = hazeR, hazeT
+            mixInc = hazeR**2 - hazeT**2
+        InterfaceMatrix, InterfaceMatrixInc = interfaceMatrix(*self.fresnel(i, pol)[:4], hazeR, hazeT, hazeRInc, hazeTInc, mixInc)
+        if i >= 0 and getattr(self.LayerResults[self.names[i]], 'block', None):
+            # collapsed periods of a repeat block in front of the interface
+            PeriodMatrix, PeriodMatrixInc = self.periodMatrices(self.LayerResults[self.names[i]], pol)
+            InterfaceMatrix = np.matmul(PeriodMatrix, InterfaceMatrix)
+            InterfaceMatrixInc = np.matmul(PeriodMatrixInc, InterfaceMatrixInc)
+        return InterfaceMatrix, InterfaceMatrixInc
+        
+    def periodMatrices(self, layer, pol):
+        '''
+        coherent and incoherent transfer matrix of the periods collapsed into layer (see LayerStack.expandRepeatBlocks):
+        layer and interface matrices of one period up to the first layer of the next period to the power of the number 
+        of periods by repeated squaring (about 2 log2(periods) matrix products instead of 2 for each layer of each period)
+        the layer itself is the first layer with zero thickness after the periods, which is exact for the coherent matrices
+        (the incoherent ones are only used for the complete incoherent system matrix)
+        '''
+        for j, (layer1, (IfMat, IfMatInc)) in enumerate(zip(layer.block, self.periodInterfaces(layer, pol))):
+            Step = np.matmul(layer1.LayerMatrix, IfMat)
+            StepInc = np.matmul(layer1.LayerMatrixInc, IfMatInc)
+            if j == 0:
+                Period, PeriodInc = Step, StepInc
             else:
-                #last interface layer1/Air
-                self.theta_out = snell(layer1.cri, cri_i, layer1.theta)
-                t_jk = t_ij(self.pol, 0, 0, self.wavelength, layer1.cri, cri_i, layer1.theta, self.theta_out)
-                r_jk = r_ij(self.pol, 0, 0, self.wavelength, layer1.cri, cri_i, layer1.theta, self.theta_out)
-                t_kj = t_ij(self.pol, 0, 0, self.wavelength, cri_i, layer1.cri, self.theta_out, layer1.theta)
-                r_kj = r_ij(self.pol, 0, 0, self.wavelength, cri_i, layer1.cri, self.theta_out, layer1.theta)
-                
-                layer1.InterfaceMatrix = np.zeros((len(self.wavelength), 2, 2), np.complex)
-                layer1.InterfaceMatrixInc = np.zeros((len(self.wavelength), 2, 2), np.complex)
-                # coherent
-                layer1.InterfaceMatrix[:, 0, 0] = layer1.InterfaceMatrix[:, 1, 1] = 1 / t_jk
-                layer1.InterfaceMatrix[:, 0, 1] = layer1.InterfaceMatrix[:, 1, 0] = r_jk / t_jk
-                # incoherent
-                layer1.InterfaceMatrixInc[:, 0, 0] = 1 / np.abs(t_jk)**2
-                layer1.InterfaceMatrixInc[:, 0, 1] = - np.abs(r_jk)**2 / np.abs(t_jk)**2
-                layer1.InterfaceMatrixInc[:, 1, 0] = np.abs(r_jk)**2 / np.abs(t_jk)**2
-                layer1.InterfaceMatrixInc[:, 1, 1] = (np.abs(t_jk * t_kj)**2 - np.abs(r_jk * r_kj)**2) / np.abs(t_jk)**2                    
+                Period, PeriodInc = np.matmul(Period, Step), np.matmul(PeriodInc, StepInc)
+        return np.linalg.matrix_power(Period, len(layer.periods)), np.linalg.matrix_power(PeriodInc, len(layer.periods))
+        
+    def periodInterfaces(self, layer, pol):
+        '''
+        coherent and incoherent interface matrices between the layers of one period of the block of layer 
+        (each layer to the following one, the last layer to the first layer of the next period)
+        '''
+        wvl = self.wavelength
+        block = layer.block
+        interfaces = []
+        for j, layer1 in enumerate(block):
+            layer2 = block[(j + 1) % len(block)]
+            coefficients = [function(pol, False, 0, wvl, cri_j, cri_k, th_j, th_k) 
+                                for cri_j, cri_k, th_j, th_k in [(layer1.cri, layer2.cri, layer1.theta, layer2.theta), 
+                                                                 (layer2.cri, layer1.cri, layer2.theta, layer1.theta)] 
+                                for function in [r_ij, t_ij]]
+            interfaces.append(interfaceMatrix(*coefficients))
+        return interfaces
+        
+    def blockAbsorption(self, layer):
+        '''
+        absorbed and collected intensity (block layers, (angle,) wavelength) of the layers of the collapsed periods of layer
+        (see LayerStack.expandRepeatBlocks): the depth integrals of alpha * n * abs(E)² (and times the collection function) 
+        at the depth nodes of each layer as for explicit period layers, summed up over all periods;
+        the amplitudes at the bottom of a layer are G v with v at the top of its period, so each integral is a quadratic form 
+        v^H Q v, v of the periods follow from the bottom of the periods upwards (v = c P^j y with the period matrix P, 
+        the growing direction as for the partial system matrices) and the sum over the periods 
+        (sum of P^H^j Q P^j) is built by repeated squaring as the period matrix
+        '''
+        layers = [self.LayerResults[key] for key in self.names]
+        i = layers.index(layer)
+        # amplitudes y below the periods up to a factor: the interface matrix without the periods times the following part
+        y = interfaceMatrix(*self.fresnel(i, self.pol)[:4])[0]
+        if i < len(layers) - 1 and not layers[i+1].thick:
+            y = np.matmul(y, np.matmul(layers[i+1].LayerMatrix, layers[i+1].PSO_Field))
+        elif i < len(layers) - 1:
+            start = i
+            while start > 0 and not layers[start-1].thick:
+                start -= 1
+            if start > 0:
+                # coherent part between incoherent layers (see getSystemMatrixVectorized)
+                y = np.matmul(y, np.matmul(np.sqrt(layers[i+1].LayerMatrixInc), np.sqrt(layers[i+1].PSO_Int)))
+        y = y[..., 0]
+        G = np.broadcast_to(np.eye(2, dtype = np.complex128), y.shape + (2, ))
+        P = G
+        forms = []
+        for blockLayer, (IfMat, IfMatInc) in zip(layer.block, self.periodInterfaces(layer, self.pol)):
+            G = np.matmul(np.linalg.inv(blockLayer.LayerMatrix), G)
+            # field at the depth nodes from the amplitudes at the bottom of the layer (see fieldIntensity)
+            EXP = 1j * blockLayer.xi[..., np.newaxis, :] * (blockLayer.thickness - blockLayer.x)[:, np.newaxis]
+            e = np.stack([np.exp(-EXP), np.exp(EXP)], axis = -1)
+            weights = trapzWeights(blockLayer.x)
+            for fc in [1, blockLayer.fc]:
+                W = np.einsum('m,...mwa,...mwb->...wab', weights * fc, np.conj(e), e)
+                Q = np.matmul(np.conj(np.swapaxes(G, -1, -2)), np.matmul(W, G))
+                forms.append(Q * (blockLayer.alpha * blockLayer.n)[..., np.newaxis, np.newaxis])
+            G = np.matmul(np.linalg.inv(IfMat), G)
+            P = np.matmul(P, np.matmul(blockLayer.LayerMatrix, IfMat))
+        forms = np.array(forms)
+        period = P
+        adjoint = lambda M: np.conj(np.swapaxes(M, -1, -2))
+        total = np.zeros(forms.shape, np.complex128)
+        power = np.broadcast_to(np.eye(2, dtype = np.complex128), P.shape)
+        periods = len(layer.periods)
+        while periods:
+            if periods & 1:
+                total = total + np.matmul(adjoint(power), np.matmul(forms, power))
+                power = np.matmul(P, power)
+            periods >>= 1
+            if periods:
+                forms = forms + np.matmul(adjoint(P), np.matmul(forms, P))
+                P = np.matmul(P, P)
+        # c from the amplitudes at the top of the first period v = P^periods c y (the ratio of the partial system matrices)
+        PSI = layer.PSI_Field
+        PSO = layer.PSO_Field
+        v = PSO[..., 0] / (PSI[..., 0, 0] * PSO[..., 0, 0] + PSI[..., 0, 1] * PSO[..., 1, 0])[..., np.newaxis]
+        top = np.matmul(power, y[..., np.newaxis])[..., 0]
+        c = np.sum(np.conj(top) * v, axis = -1) / np.sum(np.abs(top)**2, axis = -1)
+        # the sum over the periods from the bottom: P y up to P^periods y
+        y = np.matmul(period, y[..., np.newaxis])[..., 0]
+        values = np.real(np.einsum('...a,...ab,...b->...', np.conj(y), total, y)) * np.abs(c)**2
+        if self.unpolarized:
+            values = np.mean(values, axis = 1)
+        return values[0::2], values[1::2]
+        
+    def blockResults(self, layer):
+        '''
+        absorbed and collected intensity of a layer of collapsed periods (see blockAbsorption) for each layer of the block 
+        and spread evenly over the depth of the periods (depth nodes at the top and the bottom)
+        '''
+        layer.blockAbsorption, layer.blockCollected = self.blockAbsorption(layer)
+        layer.absorbedI = np.repeat(np.sum(layer.blockAbsorption, axis = 0)[np.newaxis] / layer.thickness, len(layer.x), axis = 0)
+        layer.collectedI = np.repeat(np.sum(layer.blockCollected, axis = 0)[np.newaxis] / layer.thickness, len(layer.x), axis = 0)
+            
+    def blockLambertBeer(self, layer, I):
+        '''
+        Lambert-Beer absorption and collection of the layers of the collapsed periods of layer for the intensity I at their top:
+        the depth integrals of each layer of the block as for explicit period layers, the intensity at the top of the periods 
+        falls by exp(-sum of alpha * d) per period (geometric series); 
+        returns the intensity at the top and the bottom of the periods, absorbed and collected intensity are spread evenly over their depth
+        '''
+        absorption = []
+        collection = []
+        transmission = np.ones(len(self.wavelength))
+        for blockLayer in layer.block:
+            Ivector = transmission * np.exp(-blockLayer.alpha * blockLayer.x[:, np.newaxis])
+            absorbedI = blockLayer.alpha * Ivector
+            absorption.append(integrate.trapz(absorbedI, x=blockLayer.x, axis=0))
+            collection.append(integrate.trapz(absorbedI * blockLayer.fc[:, np.newaxis], x=blockLayer.x, axis=0))
+            transmission = Ivector[-1]
+        periods = len(layer.periods)
+        decay = -np.log(transmission)
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            series = np.where(decay > 0, np.expm1(-periods * decay) / np.expm1(-decay), periods)
+        layer.blockAbsorptionLB = np.array(absorption) * I * series
+        layer.blockCollectedLB = np.array(collection) * I * series
+        layer.absorbedILB = np.repeat(np.sum(layer.blockAbsorptionLB, axis = 0)[np.newaxis] / layer.thickness, len(layer.x), axis = 0)
+        layer.collectedILB = np.repeat(np.sum(layer.blockCollectedLB, axis = 0)[np.newaxis] / layer.thickness, len(layer.x), axis = 0)
+        return np.array([I, I * transmission**periods])
             
     def getSystemMatrix(self):
+        '''
+        calculates system matrix and partial system matrices of all layers
+        either vectorized over all wavelengths at once or wavelength by wavelength
+        '''
+        if self.vectorized:
+            self.getSystemMatrixVectorized()
+        else:
+            self.getSystemMatrixLoop()
+            
+    def getSystemMatrixVectorized(self):
+        '''
+        same as getSystemMatrixLoop but all 2x2 matrix products are done 
+        for all wavelengths at once on the (wavelength, 2, 2) arrays
+        '''
+        logging.info('\tcreate partial system matrices for each layer (vectorized)...')
+        
+        layers = [self.LayerResults[name] for name in self.names]
+        thick = [layer.thick for layer in layers]
+        N = len(layers)
+        
+        shape = self.firstInterfaceMatrix.shape # (polarization, angle,) wavelength, 2, 2
+        for layer in layers:
+            layer.PSI_Field = np.zeros(shape, np.complex)
+            layer.PSO_Field = np.zeros(shape, np.complex)
+            layer.PSI_Int = np.zeros(shape, np.complex)
+            layer.PSO_Int = np.zeros(shape, np.complex)
+        
+        # calc a complete coherent and incoherent stack: 
+        SysMatCoh = self.firstInterfaceMatrix
+        SysMatInc = self.firstInterfaceMatrixInc
+        for layer in layers:
+            SysMatCoh = np.matmul(SysMatCoh, layer.StepMatrix)
+            SysMatInc = np.matmul(SysMatInc, layer.StepMatrixInc)
+        self.SystemFieldMatrix = SysMatCoh # complete coherent (no "thick") --> required for Ellipsometry
+        self.SystemIntMatrix = SysMatInc # complete incoherent (all "thick") 
+        
+        logging.info('\tcreate system matrix (vectorized)...')
+        
+        # E-field partial system matrices out of the coherent parts (later Intensity matrices added): 
+        # interface matrix times the product of the step matrices of the following coherent layers, 
+        # built up in one backward scan (suffix products) instead of one product for each layer
+        following = None
+        for i in reversed(range(N)):
+            layer = layers[i]
+            if thick[i]:
+                following = None
+                continue
+            if following is None:
+                layer.PSO_Field = layer.InterfaceMatrix.copy()
+                following = layer.StepMatrix
+            else:
+                layer.PSO_Field = np.matmul(layer.InterfaceMatrix, following)
+                following = np.matmul(layer.StepMatrix, following)
+        
+        # calc all coherent parts and make a List of them (forward scan, prefix products)
+        coherentParts = []
+        incoherentLayers = []
+        SysMat = self.firstInterfaceMatrix
+        for i, layer in enumerate(layers):
+            if not thick[i]:
+                if i == 0:
+                    SysMat = self.firstInterfaceMatrix
+                elif thick[i-1]:
+                    SysMat = layers[i-1].InterfaceMatrix
+                # create E-field partial system matrices for this coherent part (later Intensity matrices added)
+                layer.PSI_Field = SysMat.copy()
+                SysMat = np.matmul(SysMat, layer.StepMatrix)
+                if i == N-1:
+                    # last layer
+                    coherentParts.append(SysMat)
+            else:
+                incoherentLayers.append(i)
+                if i > 0 and not thick[i-1]:
+                    coherentParts.append(SysMat)
+        
+        #calc all interfaceIntensityMatrices of the coherent parts in the list
+        coherentPartsIntensity = [intensityMatrix(part) for part in coherentParts]
+        
+        if incoherentLayers:
+            currentCoherentPart = 0
+            if incoherentLayers[0] == 0:
+                SysMat = self.firstInterfaceMatrixInc
+            else:
+                SysMat = coherentPartsIntensity[0]
+                currentCoherentPart += 1
+            for incLayer in incoherentLayers:
+                layer = layers[incLayer]
+                if incLayer < N-1 and not thick[incLayer+1]:
+                    IfMat = coherentPartsIntensity[currentCoherentPart]
+                    currentCoherentPart += 1
+                else:
+                    IfMat = layer.InterfaceMatrixInc
+                # the following-layer product of the loop version only ever multiplies 
+                # the still empty PSO_Int of the last layer, so PSO_Int is the next interface
+                layer.PSI_Int = SysMat.copy()
+                layer.PSO_Int = IfMat.copy()
+                SysMat = np.matmul(SysMat, np.matmul(layer.LayerMatrixInc, IfMat))
+        else:
+            SysMat = coherentPartsIntensity[0]
+        self.SystemMatrix = SysMat.copy() # mixture of both - coherent and incoherent - as required
+        
+        self.WhatComesOut = np.abs(1 / self.SystemMatrix[..., 0, 0])
+        
+        # go through all coherent layers which follow an incoherent layer and add PSI and PSO from incoherent parts 
+        for k in range(1, N):
+            if thick[k] or not thick[k-1]:
+                continue
+            # Take PSI from previous incoherent layer and add LayerMatrix of it
+            PSI = np.sqrt(np.matmul(layers[k-1].PSI_Int, layers[k-1].LayerMatrixInc))
+            # loop through next coherent layers
+            coh = k
+            while coh < N and not thick[coh]:
+                layers[coh].PSI_Field = np.matmul(PSI, layers[coh].PSI_Field)
+                coh += 1
+            if coh < N:
+                LMat = np.sqrt(layers[coh].LayerMatrixInc)
+                IfMat = np.sqrt(layers[coh].PSO_Int)
+                for c in range(k, coh):
+                    layers[c].PSO_Field = np.matmul(np.matmul(layers[c].PSO_Field, LMat), IfMat)
+            
+    def getSystemMatrixLoop(self):
         '''
                m
             ------
@@ -428,6 +1001,21 @@ class Optics:
             self.SystemFieldMatrix[wvl] = SysMatCoh         # complete coherent (no "thick")
             self.SystemIntMatrix[wvl] = SysMatInc  # complete incoherent (all "thick") 
            
+            # partial system matrices out of the coherent parts by one backward scan (see getSystemMatrixVectorized)
+            following = None
+            for name in reversed(self.names):
+                if self.LayerResults[name].thick:
+                    following = None
+                    continue
+                IfMat = self.LayerResults[name].InterfaceMatrix[wvl]
+                StepMat = np.dot(self.LayerResults[name].LayerMatrix[wvl], IfMat)
+                if following is None:
+                    self.LayerResults[name].PSO_Field[wvl] = IfMat
+                    following = StepMat
+                else:
+                    self.LayerResults[name].PSO_Field[wvl] = np.dot(IfMat, following)
+                    following = np.dot(StepMat, following)
+           
             # calc all coherent parts and make a List of them
             coherentParts = []
             incoherentLayers = []
@@ -441,16 +1029,6 @@ class Optics:
                         SysMat = self.LayerResults[self.names[i-1]].InterfaceMatrix[wvl]
                     # create E-field partial system matrices for this coherent part (later Intensity matrices added)
                     self.LayerResults[name].PSI_Field[wvl] = SysMat
-                    self.LayerResults[name].PSO_Field[wvl] = IfMat
-                    # go through next coherent layers to get partial system matrix out for this coherent part
-                    for j in range(i+1, len(self.names)):
-                        if not self.LayerResults[self.names[j]].thick:
-                            LMatPart = self.LayerResults[self.names[j]].LayerMatrix[wvl]
-                            IfMatPart = self.LayerResults[self.names[j]].InterfaceMatrix[wvl]
-                            self.LayerResults[name].PSO_Field[wvl] =  np.dot(self.LayerResults[name].PSO_Field[wvl], np.dot(LMatPart, IfMatPart))
-                        else:
-                            break
-                            
                     SysMat = np.dot(SysMat, np.dot(LMat, IfMat))
                     if i == len(self.names)-1:
                         # last layer
@@ -502,22 +1080,11 @@ class Optics:
                     else: # last layer
                         IfMat = IfMatInc
                         
-                    # go through next intensity (parts) layers
+                    # the product with the following intensity (parts) layers was only ever applied to the 
+                    # still empty PSO_Int of the last layer (quadratic in the number of layers, no effect): 
+                    # PSO_Int is the next interface (or coherent part) as in getSystemMatrixVectorized
                     self.LayerResults[self.names[incLayer]].PSI_Int[wvl] = SysMat
                     self.LayerResults[self.names[incLayer]].PSO_Int[wvl] = IfMat
-                    for j in range(i+1, len(incoherentLayers)):
-                        LMatPart = self.LayerResults[self.names[j]].LayerMatrixInc[wvl]
-                        if j < len(incoherentLayers)-1:
-                            if self.LayerResults[self.names[j+1]].thick:
-                                IfMatPart = self.LayerResults[self.names[j]].InterfaceMatrixInc[wvl]
-                            #elif startswithcoherent:
-                            #    IfMatPart = coherentPartsIntensity[i+j+1]
-                            else:
-                
-                                IfMatPart = coherentPartsIntensity[currentCoherentPart] #i+j
-                        else:
-                            IfMatPart = self.LayerResults[name].InterfaceMatrixInc[wvl]
-                        self.LayerResults[name].PSO_Int[wvl] =  np.dot(self.LayerResults[name].PSO_Int[wvl], np.dot(LMatPart, IfMatPart))
                     SysMat = np.dot(SysMat, np.dot(LMatInc, IfMat))
             else:
                 SysMat = coherentPartsIntensity[0]
@@ -555,6 +1122,35 @@ class Optics:
         
             
     def calcDiffuseLight(self):
+        '''
+        diffuse light of all layers (see diffuseLight), for unpolarized light the mean of s and p
+        '''
+        logging.info('\tcalculate diffusive light...')
+        if any(getattr(self.LayerResults[key], 'block', None) for key in self.names):
+            raise NotImplementedError('diffuse light (haze) through collapsed periods of repeat blocks is not implemented')
+        if self.unpolarized:
+            R, T, I = [], [], []
+            for index, pol in enumerate(self.pol):
+                self.diffuseLight(pol, index)
+                R.append(self.RspectrumDiffuse)
+                T.append(self.TspectrumDiffuse)
+                I.append([self.LayerResults[key].I_diffuse for key in self.names])
+            self.RspectrumDiffuse = np.mean(R, axis = 0)
+            self.TspectrumDiffuse = np.mean(T, axis = 0)
+            for key, Is, Ip in zip(self.names, *I):
+                self.LayerResults[key].I_diffuse = (Is + Ip) / 2
+        else:
+            self.diffuseLight(self.pol)
+        
+        # create final result   
+        self.I_diffuse = []
+        self.I_diffuse_x = []
+        
+        for key in self.names:
+            self.I_diffuse.extend(self.LayerResults[key].I_diffuse)
+            self.I_diffuse_x.extend(integrate.trapz(self.I_diffuse, x=self.wavelength, axis = 1))
+    
+    def diffuseLight(self, pol, index = None):
         '''
         go through all layers and get the diffuse parts 
         of forward and backwards moving waves 
@@ -574,8 +1170,9 @@ class Optics:
             |<-- I_bw(x0)      I_bw(xend)-->|
         
         see Petterson et al. JAP 86
+        
+        pol is the polarization and index its position in the partial system matrices (None for a single polarization)
         '''
-        logging.info('\tcalculate diffusive light...')
         wvl = self.wavelength
         
         for k, key in enumerate(self.names):
@@ -587,6 +1184,9 @@ class Optics:
                 # get previous layer for I_spec_fw at left side of Top-Interface 
                 PSI_Field = np.sqrt(self.LayerResults[key].PSI_Int)
                 PSO_Field = np.sqrt(self.LayerResults[key].PSO_Int)
+            if index is not None:
+                PSI_Field = PSI_Field[index]
+                PSO_Field = PSO_Field[index]
             
             xi = self.LayerResults[key].xi
             t = self.LayerResults[key].thickness
@@ -626,22 +1226,10 @@ class Optics:
                 H_T01 = 0
                 
             #print('H_T_{} = {}'.format(key, H_T01))
-            if k == 0:
-                cri0 = 1 + 0j
-                theta0 = self.layerstack.theta0
-            else:
-                cri0 = self.LayerResults[self.names[k-1]].cri
-                theta0 = self.LayerResults[self.names[k-1]].theta
-            cri1 = self.LayerResults[key].cri 
-            theta1 = self.LayerResults[key].theta
             if k == len(self.names)-1: # last layer
-                cri2 = 1 + 0j
-                theta2 = self.theta_out
                 H_R12 = 0
                 H_T12 = 0
             else:
-                cri2 = self.LayerResults[self.names[k+1]].cri
-                theta2 = self.LayerResults[self.names[k+1]].theta
                 if self.LayerResults[self.names[k+1]].srough:
                     H_R12 = self.LayerResults[self.names[k+1]].sroughHazeR
                     H_T12 = self.LayerResults[self.names[k+1]].sroughHazeT
@@ -649,12 +1237,10 @@ class Optics:
                     H_R12 = 0
                     H_T12 = 0
                 
-            R_01 = np.abs(r_ij(self.pol, 0, 0, wvl, cri0, cri1, theta0, theta1))**2
+            R_01, R_10 = self.fresnel(k-1, pol, rough = False)[4:]
             T_01 = 1 - R_01
-            R_10 = np.abs(r_ij(self.pol, 0, 0, wvl, cri1, cri0, theta1, theta0))**2
-            R_21 = np.abs(r_ij(self.pol, 0, 0, wvl, cri2, cri1, theta2, theta1))**2
+            R_12, R_21 = self.fresnel(k, pol, rough = False)[4:]
             T_21 = 1 - R_21
-            R_12 = np.abs(r_ij(self.pol, 0, 0, wvl, cri1, cri2, theta1, theta2))**2
             
             self.LayerResults[key].I_fw_diff_r = H_R01 * R_10 * self.LayerResults[key].I_bw_start
             
@@ -679,7 +1265,15 @@ class Optics:
                 self.LayerResults[key].I_bw_diff_t = H_T12 * T_21 * self.LayerResults[self.names[k+1]].I_bw_start
                 
             
-        #fgfdg
+        if 'diffuse light raytracer' in self.settings and self.settings['diffuse light raytracer']:
+            self.raytraceDiffuseLight(pol)
+        else:
+            self.solveDiffuseLight(pol)
+        
+        for key in self.names:
+            self.LayerResults[key].I_diffuse = self.LayerResults[key].I_fw_diff_vector - self.LayerResults[key].I_bw_diff_vector 
+    
+    def raytraceDiffuseLight(self, pol):
         '''
         calculates the total and local intensity of diffuse light by raytracing
         I_fw[layer] 
@@ -687,7 +1281,10 @@ class Optics:
         
         I_bw[0] is total reflection
         I_fw[end + 1] is total transmission
+        
+        bounce by bounce until the maximum number of iterations or the minimum intensity of settings['roughness Haze calc diffuse']
         '''
+        wvl = self.wavelength
         #self.RspectrumDiffuse = np.zeros(len(wvl)) --> defined already
         self.TspectrumDiffuse = np.zeros(len(wvl))
         
@@ -747,26 +1344,9 @@ class Optics:
                                   |--> I_fw_diff_r     I_bw_diff_r <--|
                 '''
                 
-                if n == 0:
-                    cri0 = 1 + 0j
-                    theta0 = self.layerstack.theta0
-                else:
-                    cri0 = self.LayerResults[self.names[n-1]].cri
-                    theta0 = self.LayerResults[self.names[n-1]].theta
-                
-                cri1 = self.LayerResults[key].cri 
-                theta1 = self.LayerResults[key].theta
-                
-                if n == len(self.names)-1:
-                    cri2 = 1 + 0j
-                    theta2 = self.theta_out
-                else:
-                    cri2 = self.LayerResults[self.names[n+1]].cri
-                    theta2 = self.LayerResults[self.names[n+1]].theta
-                    
-                R_12 = np.abs(r_ij(self.pol, 0, 0, wvl, cri1, cri2, theta1, theta2))**2
+                R_12 = self.fresnel(n, pol, rough = False).R_jk
                 T_12 = 1 - R_12
-                R_10 = np.abs(r_ij(self.pol, 0, 0, wvl, cri1, cri0, theta1, theta0))**2
+                R_10 = self.fresnel(n-1, pol, rough = False).R_kj
                 T_10 = 1 - R_10
                 
                 I_fw_end_r = I_fw_end * R_12
@@ -792,17 +1372,52 @@ class Optics:
             if Imax > max_stack:
                 Imax = max_stack
             i += 1
+            
+    def solveDiffuseLight(self, pol):
+        '''
+        total and local intensity of diffuse light as sum of all bounces of raytraceDiffuseLight (its limit)
+        from one linear system per wavelength for the forward intensity F at the start and the backward intensity B 
+        at the end of each layer n (starting values F0, B0 from the specular light):
+            F_n = F0_n + R_10,n a_bw,n B_n + T_12,n-1 a_fw,n-1 F_n-1
+            B_n = B0_n + R_12,n a_fw,n F_n + T_10,n+1 a_bw,n+1 B_n+1
+        with the Fresnel reflection and transmission R, T at both sides of a layer and its attenuation a (Lambert-Beer)
+        the depth profiles are built once from F and B
+        '''
+        wvl = self.wavelength
+        layers = [self.LayerResults[key] for key in self.names]
+        N = len(layers)
+        R_10 = []
+        R_12 = []
+        a_fw = []
+        a_bw = []
+        for n, layer in enumerate(layers):
+            R_12.append(self.fresnel(n, pol, rough = False).R_jk)
+            R_10.append(self.fresnel(n-1, pol, rough = False).R_kj)
+            a_fw.append(np.exp(-layer.alpha * layer.x[-1]))
+            a_bw.append(np.exp(-layer.alpha * (layer.thickness - layer.x[0])))
+        
+        # unknowns F_0...F_N-1, B_0...B_N-1 for all wavelengths
+        M = np.zeros((len(wvl), 2*N, 2*N))
+        M[:, range(2*N), range(2*N)] = 1
+        start = np.zeros((len(wvl), 2*N))
+        for n, layer in enumerate(layers):
+            M[:, n, N+n] = - R_10[n] * a_bw[n]
+            M[:, N+n, n] = - R_12[n] * a_fw[n]
+            if n > 0:
+                M[:, n, n-1] = - (1 - R_12[n-1]) * a_fw[n-1]
+            if n < N-1:
+                M[:, N+n, N+n+1] = - (1 - R_10[n+1]) * a_bw[n+1]
+            start[:, n] = layer.I_fw_diff_t + layer.I_fw_diff_r
+            start[:, N+n] = layer.I_bw_diff_t + layer.I_bw_diff_r
+        solution = np.linalg.solve(M, start[:, :, np.newaxis])[:, :, 0]
+        
+        for n, layer in enumerate(layers):
+            x = layer.x[:, np.newaxis]
+            layer.I_fw_diff_vector = solution[:, n] * np.exp(-layer.alpha * x)
+            layer.I_bw_diff_vector = solution[:, N+n] * np.exp(-layer.alpha * (layer.thickness - x))
+        self.RspectrumDiffuse = self.RspectrumDiffuse + (1 - R_10[0]) * a_bw[0] * solution[:, N]
+        self.TspectrumDiffuse = (1 - R_12[N-1]) * a_fw[N-1] * solution[:, N-1]
         
-        # create final result   
-        self.I_diffuse = []
-        self.I_diffuse_x = []
-        
-        for key in self.names:
-            self.LayerResults[key].I_diffuse = self.LayerResults[key].I_fw_diff_vector - self.LayerResults[key].I_bw_diff_vector 
-            self.I_diffuse.extend(self.LayerResults[key].I_diffuse)
-            self.I_diffuse_x.extend(integrate.trapz(self.I_diffuse, x=wvl, axis = 1))
-           
-    
     def setLayerPartialSystemMatrices(self):
         '''
         partial system transfer matrix for field from top to layer j:
@@ -822,132 +1437,164 @@ class Optics:
             v =j+1 
             
         for thick layers: Sin and Sout are Intensity matrices    
+        
+        all wavelengths at once, Sin by a forward (prefix) and Sout by a backward (suffix) scan over the layers
         '''
-        for j, key in enumerate(self.names):
-            self.LayerResults[key].PartSysMatIn = np.zeros((len(self.wavelength), 2, 2), np.complex)
-            self.LayerResults[key].PartSysMatOut = np.zeros((len(self.wavelength), 2, 2), np.complex)
-            
-            for wvl in range(len(self.wavelength)):
-                # first interface
-                PSI = self.firstInterfaceMatrix[wvl]
-                PSO = self.LayerResults[key].InterfaceMatrix[wvl]
-                    
-                # top to layer (Sin):
-                if j > 0:
-                    for l in range(j):    # range(j) = 1,...,j-1
-                        IfMatI = self.LayerResults[self.names[l]].InterfaceMatrix[wvl]
-                        LMatI = self.LayerResults[self.names[l]].LayerMatrix[wvl]
-                        PSI = np.dot(PSI, np.dot(LMatI, IfMatI))
-                self.LayerResults[key].PartSysMatIn[wvl] = PSI
-                    
-                # layer to bottom (Sout):
-                if j < len(self.names):
-                    for m in range(j+1, len(self.names)): # j+1,...,last layer
-                        IfMatO = self.LayerResults[self.names[m]].InterfaceMatrix[wvl]
-                        LMatO = self.LayerResults[self.names[m]].LayerMatrix[wvl]
-                        PSO = np.dot(PSO, np.dot(LMatO, IfMatO))
-                self.LayerResults[key].PartSysMatOut[wvl] = PSO
+        layers = [self.LayerResults[key] for key in self.names]
+        # top to layer (Sin):
+        PSI = self.firstInterfaceMatrix
+        for layer in layers:
+            layer.PartSysMatIn = PSI
+            PSI = np.matmul(PSI, layer.StepMatrix)
+        # layer to bottom (Sout):
+        following = None
+        for layer in reversed(layers):
+            if following is None:
+                layer.PartSysMatOut = layer.InterfaceMatrix.copy()
+                following = layer.StepMatrix
+            else:
+                layer.PartSysMatOut = np.matmul(layer.InterfaceMatrix, following)
+                following = np.matmul(layer.StepMatrix, following)
     
     
+    @stage('ellipsometry')
     def calcEllipsometry(self):
+        '''
+        ellipsometric angles psi and Delta (see ellipsometricAngles)
+        '''
         logging.info('\tcalculate ellipsometric angles...')
-        rs = np.zeros((len(self.wavelength)), np.complex)
-        rp = np.zeros((len(self.wavelength)), np.complex)
-        
-        # calc 's' polarization
-        self.pol = 's'
-        self.setInterfaceMatrices()
-        self.getSystemMatrix()
-            
-        for wvl in range(len(self.wavelength)):
-            S21 = self.SystemFieldMatrix[wvl, 1, 0]
-            S11 = self.SystemFieldMatrix[wvl, 0, 0]
-            rs[wvl] = S21/S11
-           
-        # calc 'p' polarization
-        self.pol = 'p' 
-        self.setInterfaceMatrices()
-        self.getSystemMatrix()
-            
-        for wvl in range(len(self.wavelength)):
-            S21 = self.SystemFieldMatrix[wvl, 1, 0]
-            S11 = self.SystemFieldMatrix[wvl, 0, 0]
-            rp[wvl] = S21/S11
-        
-        degree = np.pi/180
-        self.psi = np.arctan(abs(rp/rs))/degree
-        self.delta = np.angle(-rp/rs)/degree
+        self.psi, self.delta = self.ellipsometricAngles()
         
         self.addPlot({'psi': self.psi}, 'spectra','Ellipsometry')
         self.addPlot({'Delta': self.delta}, 'spectra','Ellipsometry')
-        
-        if self.settings['polarization']:
-            self.pol = 'p'
-        else:
-            self.pol = 's'
             
         logging.info('\tcalculation of ellipsometric angles finished.')
+        
+    def ellipsometricAngles(self):
+        '''
+        psi and Delta (degree) from the complete coherent system matrices of s and p polarization (one pass for both)
+        the layer matrices are shared with the stack optics, whose matrices and polarization are not changed
+        '''
+        if self.unpolarized:
+            # step matrices of s and p are already there
+            self.updateMatrices()
+            SysMat = self.firstInterfaceMatrix
+            for name in self.names:
+                SysMat = np.matmul(SysMat, self.LayerResults[name].StepMatrix)
+        else:
+            self.updateMatrices()
+            SysMat = self.interfaceMatrices(-1, ('s', 'p'))[0]
+            for i, name in enumerate(self.names):
+                SysMat = np.matmul(SysMat, np.matmul(self.LayerResults[name].LayerMatrix, self.interfaceMatrices(i, ('s', 'p'))[0]))
+        rs, rp = SysMat[..., 1, 0] / SysMat[..., 0, 0]
+        
+        degree = np.pi/180
+        return np.arctan(abs(rp/rs))/degree, np.angle(-rp/rs)/degree
+        
+    def angleSweep(self, angles, layerwise = True):
+        '''
+        reflection, transmission, absorption, psi, Delta and layerwise absorption (layers of the original stack, 
+        graded layers and repeat blocks summed up, only if layerwise) for all angles of incidence (degree) as (angle, wavelength) arrays
+        the angles are a leading axis of angles, layer and interface matrices, so all of them are calculated in one vectorized pass,
+        the optics of the stack (settings['angle']) are not changed
+        '''
+        if self.HazeOn:
+            raise NotImplementedError('angle sweeps with diffuse light (haze) are not implemented')
+        logging.info('\tcalculate {} angles of incidence...'.format(len(angles)))
+        # shallow copies of optics, layer stack and layers with their own angles and matrices
+        sweep = copy.copy(self)
+        sweep.vectorized = True
+        sweep.layerstack = copy.copy(self.layerstack)
+        sweep.layerstack.theta0 = np.radians(np.asarray(angles, float))[:, np.newaxis]
+        sweep.stack = sweep.layerstack.layersequence = [copy.copy(layer) for layer in self.stack]
+        for layer in sweep.stack:
+            if getattr(layer, 'block', None):
+                layer.block = [copy.copy(blockLayer) for blockLayer in layer.block]
+        sweep.LayerResults = dict([(layer.name, layer) for layer in sweep.stack])
+        for i in range(len(sweep.stack)):
+            sweep.layerstack.makeLayerMatrices(i)
+        sweep.dirtyInterfaces = None
+        sweep.dirtyLayers = None
+        sweep.fresnelTable = {}
+        sweep.stagesDone = set()
+        sweep.updateMatrices()
+        sweep.getSystemMatrixVectorized()
+        
+        results = OrderedDict()
+        results['R'] = np.abs(sweep.SystemMatrix[..., 1, 0] / sweep.SystemMatrix[..., 0, 0])
+        results['T'] = np.abs(1 / sweep.SystemMatrix[..., 0, 0])
+        if self.unpolarized:
+            results['R'] = np.mean(results['R'], axis = 0)
+            results['T'] = np.mean(results['T'], axis = 0)
+        results['A'] = 1 - (results['T'] + results['R'])
+        results['psi'], results['Delta'] = sweep.ellipsometricAngles()
+        if not layerwise:
+            return results
+        
+        absorption = OrderedDict([(layer.name, 0) for layer in self.layerstack.stack_rough])
+        rows = max(1, FIELDCHUNKSIZE // (16 * len(self.wavelength) * len(angles)))
+        for layer in sweep.stack:
+            if getattr(layer, 'block', None):
+                for name, blockAbsorption in zip([blockLayer.name for blockLayer in layer.block], sweep.blockAbsorption(layer)[0]):
+                    absorption[name] = absorption[name] + blockAbsorption
+                continue
+            weights = trapzWeights(layer.x)
+            layerAbsorption = 0
+            for start in range(0, len(layer.x), rows):
+                chunk = slice(start, start + rows)
+                Esquare = sweep.fieldIntensity(layer, layer.x[chunk])[1]
+                layerAbsorption = layerAbsorption + np.tensordot(weights[chunk], Esquare, axes = ([0], [-2]))
+            name = resultName(layer)
+            absorption[name] = absorption[name] + np.real(layer.alpha * layerAbsorption)
+        results['absorption'] = absorption
+        logging.info('\tcalculation of {} angles of incidence finished.'.format(len(angles)))
+        return results
 
+    @stage('stack')
     def calcStack(self):
         '''
         calculates Stack total absorption, reflection, and transmission
         here you can calc the values (plots and scalars for mixed system or seperate complete coherent or incoherent
         commment out what is not needed
         '''
-        self.setInterfaceMatrices()
+        self.updateMatrices()
         self.getSystemMatrix()
             
         if self.HazeOn:
             self.calcDiffuseLight()
         
         logging.info('\tcalculate stack optics...')
-        # combined coh and incoherent
-        self.RspectrumSystem = np.zeros((len(self.wavelength), 1))
-        self.TspectrumSystem = np.zeros((len(self.wavelength), 1))
-        self.AspectrumSystem = np.zeros((len(self.wavelength), 1))
+        # combined coh and incoherent, unpolarized light as mean of s and p
+        S10System = self.SystemMatrix[..., 1, 0]
+        S00System = self.SystemMatrix[..., 0, 0]
+        self.RspectrumSystem = np.abs(S10System / S00System)
+        self.TspectrumSystem = np.abs(1 / S00System)
+        if self.unpolarized:
+            self.RspectrumSystem = np.mean(self.RspectrumSystem, axis = 0)
+            self.TspectrumSystem = np.mean(self.TspectrumSystem, axis = 0)
         
         # clac complete coherent stack
-#        self.AspectrumField = np.zeros((len(self.wavelength), 1))
-#        self.RspectrumField = np.zeros((len(self.wavelength), 1))
-#        self.TspectrumField = np.zeros((len(self.wavelength), 1))
+#        S10 = self.SystemFieldMatrix[..., 1, 0]
+#        S00 = self.SystemFieldMatrix[..., 0, 0]
+#        self.RspectrumField = np.abs(S10/S00)**2
+#        self.TspectrumField = np.abs(1/S00)**2
+#        self.AspectrumField = 1 - (self.TspectrumField + self.RspectrumField)
         
         # clac complete incoh stack
-#        self.RspectrumInt = np.zeros((len(self.wavelength), 1))
-#        self.TspectrumInt = np.zeros((len(self.wavelength), 1))
-#        self.AspectrumInt = np.zeros((len(self.wavelength), 1))
-        
-        for wvl in range(len(self.wavelength)):
-            S10System = self.SystemMatrix[wvl, 1, 0]
-            S00System = self.SystemMatrix[wvl, 0, 0]
-            self.RspectrumSystem[wvl] = np.abs(S10System / S00System)
-            self.TspectrumSystem[wvl] = np.abs(1 / S00System)
-            self.AspectrumSystem[wvl] = 1 - (self.TspectrumSystem[wvl] + self.RspectrumSystem[wvl])
-            
-#            S10 = self.SystemFieldMatrix[wvl, 1, 0]
-#            S00 = self.SystemFieldMatrix[wvl, 0, 0]
-#            self.RspectrumField[wvl] = np.abs(S10/S00)**2
-#            self.TspectrumField[wvl] = np.abs(1/S00)**2
-#            self.AspectrumField[wvl] = 1 - (self.Tspectrum[wvl] + self.Rspectrum[wvl])
-#            
-#            S10Int = self.SystemIntMatrix[wvl, 1, 0]
-#            S00Int = self.SystemIntMatrix[wvl, 0, 0]
-#            self.RspectrumInt[wvl] = np.abs(S10Int / S00Int)
-#            self.TspectrumInt[wvl] = np.abs(1 / S00Int)
-#            self.AspectrumInt[wvl] = 1 - (self.TspectrumInt[wvl] + self.RspectrumInt[wvl])
-            
+#        S10Int = self.SystemIntMatrix[..., 1, 0]
+#        S00Int = self.SystemIntMatrix[..., 0, 0]
+#        self.RspectrumInt = np.abs(S10Int / S00Int)
+#        self.TspectrumInt = np.abs(1 / S00Int)
+#        self.AspectrumInt = 1 - (self.TspectrumInt + self.RspectrumInt)
         
         if self.HazeOn:
             # here add diffuse part of light Rtot = Rspec + Rdiff; Ttot = Tspec + Tdiff
-            self.RspectrumSystem = self.RspectrumSystem[:, 0] + self.RspectrumDiffuse
-            self.TspectrumSystem = self.TspectrumSystem[:, 0] + self.TspectrumDiffuse
-            self.AspectrumSystem = 1 - (self.TspectrumSystem + self.RspectrumSystem)
+            self.RspectrumSystem = self.RspectrumSystem + self.RspectrumDiffuse
+            self.TspectrumSystem = self.TspectrumSystem + self.TspectrumDiffuse
             self.addPlot({'absorption diffuse': 1 - (self.TspectrumDiffuse + self.RspectrumDiffuse)})
             self.addPlot({'reflection diffuse': self.RspectrumDiffuse})
             self.addPlot({'transmission diffuse': self.TspectrumDiffuse})
-        else:
-            self.RspectrumSystem = self.RspectrumSystem[:, 0]
-            self.TspectrumSystem = self.TspectrumSystem[:, 0]
-            self.AspectrumSystem = self.AspectrumSystem[:, 0]
+        self.AspectrumSystem = 1 - (self.TspectrumSystem + self.RspectrumSystem)
             
             
         lengthWvl = self.wavelength[-1] - self.wavelength[0]
@@ -1001,30 +1648,47 @@ class Optics:
 #        self.scalars['reflectance coh(%)'] = RnumField[0] * 100
 #        self.scalars['transmittance coh(%)'] = TnumField[0] * 100
         
+    def fieldIntensity(self, layer, x):
+        '''
+        E-field (None for thick layers) and field intensity n*abs(E)² of layer at the depths x (rows) for all wavelengths (columns)
+        for unpolarized light the E-field has a leading polarization axis (s, p) and the intensity is their mean,
+        for several angles of incidence (angleSweep) both have a leading angle axis
+        '''
+        xi = layer.xi[..., np.newaxis, :] # depth axis in front of the wavelength
+        t = layer.thickness
+        EXP1 = 1j * xi * (t - x[:, np.newaxis])
+        EXP2 = 1j * xi * t
+        n = layer.n
+        
+        if not layer.thick:
+            PSI_Field = layer.PSI_Field[..., np.newaxis, :, :, :]
+            PSO_Field = layer.PSO_Field[..., np.newaxis, :, :, :]
+            E_Field = (PSO_Field[..., 0, 0] * np.exp(-EXP1) + PSO_Field[..., 1, 0] * np.exp(EXP1)) / (PSI_Field[..., 0, 0] * PSO_Field[..., 0, 0] * np.exp(-EXP2)+ PSI_Field[..., 0, 1] * PSO_Field[..., 1, 0] * np.exp(EXP2))
+            Esquare = n * np.abs(E_Field)**2
+        else:
+            # eqn. 18-20 Jung et al. JAP 50 (2011)
+            E_Field = None
+            PSI_Int = layer.PSI_Int[..., np.newaxis, :, :, :]
+            PSO_Int = layer.PSO_Int[..., np.newaxis, :, :, :]
+            Esquare = n * (PSO_Int[..., 0, 0] * np.abs(np.exp(-EXP1))**2 + PSO_Int[..., 1, 0] * np.abs(np.exp(EXP1))**2) / (PSI_Int[..., 0, 0] * PSO_Int[..., 0, 0] * np.abs(np.exp(-EXP2))**2+ PSI_Int[..., 0, 1] * PSO_Int[..., 1, 0] * np.abs(np.exp(EXP2))**2)
+        if self.unpolarized:
+            # intensity of unpolarized light, the E-field is kept for s and p
+            Esquare = np.mean(Esquare, axis = 0)
+        return E_Field, Esquare
+        
+    @stage('field intensity')
     def calcFieldIntensity(self):
+        if not self.keep2D:
+            self.streamFieldIntensity()
+            return
         logging.info('\tcalculate local field intensity...')
         Esquare = []
         EsquareDiffuse = []
         EsquareSpecular = []
         for key in self.names:
-            xi = self.LayerResults[key].xi
-            t = self.LayerResults[key].thickness
-            x = self.LayerResults[key].x
-            EXP1 = 1j * xi * (t - x[:, np.newaxis])
-            EXP2 = 1j * xi * t
-            n = self.LayerResults[key].n
-            
-            if not self.LayerResults[key].thick:
-                PSI_Field = self.LayerResults[key].PSI_Field
-                PSO_Field = self.LayerResults[key].PSO_Field
-                self.LayerResults[key].E_Field = (PSO_Field[:, 0, 0] * np.exp(-EXP1) + PSO_Field[:, 1, 0] * np.exp(EXP1)) / (PSI_Field[:, 0, 0] * PSO_Field[:, 0, 0] * np.exp(-EXP2)+ PSI_Field[:, 0, 1] * PSO_Field[:, 1, 0] * np.exp(EXP2))
-                self.LayerResults[key].Esquare = n * np.abs(self.LayerResults[key].E_Field)**2 
-                
-            else:
-                # eqn. 18-20 Jung et al. JAP 50 (2011)
-                PSI_Int = self.LayerResults[key].PSI_Int
-                PSO_Int = self.LayerResults[key].PSO_Int
-                self.LayerResults[key].Esquare = n * (PSO_Int[:, 0, 0] * np.abs(np.exp(-EXP1))**2 + PSO_Int[:, 1, 0] * np.abs(np.exp(EXP1))**2) / (PSI_Int[:, 0, 0] * PSO_Int[:, 0, 0] * np.abs(np.exp(-EXP2))**2+ PSI_Int[:, 0, 1] * PSO_Int[:, 1, 0] * np.abs(np.exp(EXP2))**2)
+            E_Field, self.LayerResults[key].Esquare = self.fieldIntensity(self.LayerResults[key], self.LayerResults[key].x)
+            if E_Field is not None:
+                self.LayerResults[key].E_Field = E_Field
             
             if self.HazeOn:
                 self.LayerResults[key].EsquareSpecular = self.LayerResults[key].Esquare
@@ -1051,6 +1715,69 @@ class Optics:
             
         logging.info('\tcalculation of field intensity finished.')
         
+    def streamFieldIntensity(self):
+        '''
+        field intensity evaluated in depth chunks of FIELDCHUNKSIZE if settings['keep 2D data'] is False:
+        the chunks are reduced directly to the depth profiles (integrated over wavelength) and to absorption and 
+        collection of each layer (integrated over depth), the (x, wavelength) maps are not stored and not plotted in 2D
+        '''
+        logging.info('\tcalculate local field intensity in depth chunks...')
+        h = 6.62606957e-34 # Js Planck's constant
+        c = 2.99792458e8 #m/s speed of light
+        wvl = self.wavelength
+        rows = max(2, FIELDCHUNKSIZE // (16 * len(wvl)))
+        norm = wvl[-1] - wvl[0]
+        profiles = {'passing light': [], 'passing light diffuse': [], 'passing light specular': [], 
+                    'absorbed light': [], 'G_x': [], 'el_G_x': []}
+        weights = trapzWeights(self.x) # depth of the whole stack as for the generated current
+        offset = 0
+        for key in self.names:
+            layer = self.LayerResults[key]
+            x = layer.x
+            layer.absorption = 0
+            layer.collected = 0
+            layer.collectedDepth = 0
+            layer.G_x = []
+            layer.el_G_x = []
+            if getattr(layer, 'block', None):
+                self.blockResults(layer)
+            # chunks overlap by one depth so that the trapezoidal integrals over depth add up
+            for start in range(0, max(len(x) - 1, 1), rows - 1):
+                chunk = slice(start, min(start + rows, len(x)))
+                new = 0 if start == 0 else 1 # first row of further chunks is already in the profiles
+                E_Field, Esquare = self.fieldIntensity(layer, x[chunk])
+                if self.HazeOn:
+                    profiles['passing light diffuse'].extend(integrate.trapz(layer.I_diffuse[chunk][new:], x=wvl, axis=1) / norm)
+                    profiles['passing light specular'].extend(integrate.trapz(Esquare[new:], x=wvl, axis=1) / norm)
+                    Esquare = Esquare + layer.I_diffuse[chunk]
+                profiles['passing light'].extend(integrate.trapz(np.abs(Esquare[new:]), x=wvl, axis=1) / norm)
+                if getattr(layer, 'block', None):
+                    absorbedI = layer.absorbedI[chunk]
+                    collectedI = layer.collectedI[chunk]
+                else:
+                    absorbedI = layer.alpha * Esquare
+                    collectedI = absorbedI * layer.fc[chunk, np.newaxis]
+                layer.absorption = layer.absorption + integrate.trapz(absorbedI, x=x[chunk], axis=0)
+                layer.collected = layer.collected + integrate.trapz(collectedI, x=x[chunk], axis=0)
+                layer.collectedDepth = layer.collectedDepth + np.dot(weights[offset + chunk.start + new:offset + chunk.stop], collectedI[new:])
+                profiles['absorbed light'].extend(integrate.trapz(absorbedI[new:], x=wvl, axis=1))
+                layer.G_x.extend(integrate.trapz(self.spectrum * absorbedI[new:] * wvl * 1e-13 / (h * c), x=wvl, axis = 1))
+                layer.el_G_x.extend(integrate.trapz(self.spectrum * collectedI[new:] * wvl * 1e-13 / (h * c), x=wvl, axis = 1))
+            layer.G_x = np.array(layer.G_x)
+            layer.el_G_x = np.array(layer.el_G_x)
+            offset += len(x)
+        
+        self.EsquareProfile = np.array(profiles['passing light'])
+        self.streamedAbsorbedIntensity = profiles['absorbed light']
+        self.addPlot({'passing light' : self.EsquareProfile}, 'profiles', 'E-field intensity')
+        if self.HazeOn:
+            self.EsquareProfileDiffuse = np.array(profiles['passing light diffuse'])
+            self.EsquareProfileSpecular = np.array(profiles['passing light specular'])
+            self.addPlot({'passing light diffuse' : self.EsquareProfileDiffuse}, 'profiles', 'E-field intensity')
+            self.addPlot({'passing light specular' : self.EsquareProfileSpecular}, 'profiles', 'E-field intensity')
+        logging.info('\tcalculation of field intensity in {} rows per chunk finished.'.format(rows))
+        
+    @stage('absorption')
     def calcAbsorption(self):
         '''
         abs(E-field)^2
@@ -1064,21 +1791,23 @@ class Optics:
         
         for key in self.names:
             x = self.LayerResults[key].x
-            #TODO: Is this the correct formula (compare with LB)
-            self.LayerResults[key].absorbedI =  self.LayerResults[key].alpha * self.LayerResults[key].Esquare # * self.LayerResults[key].n --> already applied
-            self.LayerResults[key].absorption = integrate.trapz(self.LayerResults[key].absorbedI, x=x, axis=0) # 
+            if self.keep2D:
+                if getattr(self.LayerResults[key], 'block', None):
+                    self.blockResults(self.LayerResults[key])
+                else:
+                    #TODO: Is this the correct formula (compare with LB)
+                    self.LayerResults[key].absorbedI =  self.LayerResults[key].alpha * self.LayerResults[key].Esquare # * self.LayerResults[key].n --> already applied
+                self.LayerResults[key].absorption = integrate.trapz(self.LayerResults[key].absorbedI, x=x, axis=0) # 
+                self.absorbedIntensity.extend(integrate.trapz(self.LayerResults[key].absorbedI, x=self.wavelength, axis=1))
             self.integrAbsorption[key] = integrate.trapz(self.LayerResults[key].absorption, x=wvl, axis=0)
-            # fill dict with curves while sum up if sublayer is part of graded layer
-            if self.LayerResults[key].criSource == 'graded':
-                name = self.LayerResults[key].parentName
+            # fill dict with curves while sum up if sublayer is part of graded layer or repeat block
+            for name, absorption in resultParts(self.LayerResults[key], 'absorption'):
                 if name not in absorptionCurves.keys():
-                    absorptionCurves[name] = self.LayerResults[key].absorption
+                    absorptionCurves[name] = absorption
                 else:
-                    absorptionCurves[name] = absorptionCurves[name] + self.LayerResults[key].absorption
-            else:
-                absorptionCurves[key] = self.LayerResults[key].absorption
-                
-            self.absorbedIntensity.extend(integrate.trapz(self.LayerResults[key].absorbedI, x=self.wavelength, axis=1))
+                    absorptionCurves[name] = absorptionCurves[name] + absorption
+        if not self.keep2D:
+            self.absorbedIntensity = self.streamedAbsorbedIntensity # already integrated in streamFieldIntensity
                 
         # new loop because all values of integrAbsorption are required
         # calculate scalar values and sum up if layers are graded
@@ -1089,21 +1818,25 @@ class Optics:
             #self.LayerResults[key].absAbsorption = self.LayerResults[key].relAbsorption * self.Jmax
             self.LayerResults[key].absAbsorption = integrate.trapz(self.LayerResults[key].absorption * self.spectrumCurrent, x=wvl, axis=0)
             
-            if self.LayerResults[key].criSource == 'graded':
-                name = self.LayerResults[key].parentName
+            for name, absorption in resultParts(self.LayerResults[key], 'absorption'):
+                part = integrate.trapz(absorption, x=wvl, axis=0) / np.sum(list(self.integrAbsorption.values())) * self.scalars['absorbance (%)']
+                current = integrate.trapz(absorption * self.spectrumCurrent, x=wvl, axis=0)
                 if name not in relAbsorption.keys():
-                    relAbsorption[name] = self.LayerResults[key].relAbsorption * 100
-                    absAbsorption[name] = self.LayerResults[key].absAbsorption
+                    relAbsorption[name] = part
+                    absAbsorption[name] = current
                 else:
-                    relAbsorption[name] = relAbsorption[name] + self.LayerResults[key].relAbsorption * 100
-                    absAbsorption[name] = absAbsorption[name] + self.LayerResults[key].absAbsorption
-            else:
-                relAbsorption[key] = self.LayerResults[key].relAbsorption * 100
-                absAbsorption[key] = self.LayerResults[key].absAbsorption     
+                    relAbsorption[name] = relAbsorption[name] + part
+                    absAbsorption[name] = absAbsorption[name] + current
                 
         # take original stack without roughness layer
+        self.scalars['absorption layerwise (%) '] = []
+        self.scalars['absorption layerwise (mA/cm²) '] = []
         for layer in self.layerstack.stack_rough:
             name = layer.name
+            # layers without results in the layer sequence
+            absorptionCurves.setdefault(name, np.zeros(len(wvl)))
+            for results in [relAbsorption, absAbsorption]:
+                results.setdefault(name, 0)
             self.scalars['absorption layerwise (%) '].append(relAbsorption[name])
             self.scalars['absorption layerwise (mA/cm²) '].append(absAbsorption[name])
             
@@ -1122,18 +1855,17 @@ class Optics:
         
         for key in self.names:
             x = self.LayerResults[key].x
-            self.LayerResults[key].collectedI = self.LayerResults[key].absorbedI * self.LayerResults[key].fc[:, np.newaxis]
-            self.LayerResults[key].collected = integrate.trapz(self.LayerResults[key].collectedI, x=x, axis=0) # 
+            if self.keep2D:
+                if not getattr(self.LayerResults[key], 'block', None): # collapsed periods: see blockResults
+                    self.LayerResults[key].collectedI = self.LayerResults[key].absorbedI * self.LayerResults[key].fc[:, np.newaxis]
+                self.LayerResults[key].collected = integrate.trapz(self.LayerResults[key].collectedI, x=x, axis=0) # 
             integrCollection[key] = integrate.trapz(self.LayerResults[key].collected, x=wvl, axis=0) 
-            # fill dict with curves while sum up if sublayer is part of graded layer
-            if self.LayerResults[key].criSource == 'graded':
-                name = self.LayerResults[key].parentName
+            # fill dict with curves while sum up if sublayer is part of graded layer or repeat block
+            for name, collected in resultParts(self.LayerResults[key], 'collected'):
                 if name not in collectedCurves.keys():
-                    collectedCurves[name] = self.LayerResults[key].collected
+                    collectedCurves[name] = collected
                 else:
-                    collectedCurves[name] = collectedCurves[name] + self.LayerResults[key].collected
-            else:
-                collectedCurves[key] = self.LayerResults[key].collected
+                    collectedCurves[name] = collectedCurves[name] + collected
             # make full fc profile
             self.fc.extend(self.LayerResults[key].fc)
         
@@ -1145,21 +1877,25 @@ class Optics:
             self.LayerResults[key].relCollection = integrCollection[key] / np.sum(list(self.integrAbsorption.values())) * self.scalars['absorbance (%)']/100
             #self.LayerResults[key].absCollection = self.LayerResults[key].relCollection * self.Jmax
             self.LayerResults[key].absCollection = integrate.trapz(self.LayerResults[key].collected * self.spectrumCurrent, x=wvl, axis=0) 
-            if self.LayerResults[key].criSource == 'graded':
-                name = self.LayerResults[key].parentName
+            for name, collected in resultParts(self.LayerResults[key], 'collected'):
+                part = integrate.trapz(collected, x=wvl, axis=0) / np.sum(list(self.integrAbsorption.values())) * self.scalars['absorbance (%)']
+                current = integrate.trapz(collected * self.spectrumCurrent, x=wvl, axis=0)
                 if name not in relCollection.keys():
-                    relCollection[name] = self.LayerResults[key].relCollection * 100
-                    absCollection[name] = self.LayerResults[key].absCollection
+                    relCollection[name] = part
+                    absCollection[name] = current
                 else:
-                    relCollection[name] = relCollection[name] + self.LayerResults[key].relCollection * 100
-                    absCollection[name] = absCollection[name] + self.LayerResults[key].absCollection
-            else:
-                relCollection[key] = self.LayerResults[key].relCollection * 100
-                absCollection[key] = self.LayerResults[key].absCollection
+                    relCollection[name] = relCollection[name] + part
+                    absCollection[name] = absCollection[name] + current
                 
             # take original stack
+        self.scalars['collection layerwise (%) '] = []
+        self.scalars['collection layerwise (mA/cm²) '] = []
         for layer in self.layerstack.stack_rough:
             name = layer.name
+            # layers without results in the layer sequence
+            collectedCurves.setdefault(name, np.zeros(len(wvl)))
+            for results in [relCollection, absCollection]:
+                results.setdefault(name, 0)
             self.scalars['collection layerwise (%) '].append(relCollection[name])
             self.scalars['collection layerwise (mA/cm²) '].append(absCollection[name])
             
@@ -1168,6 +1904,40 @@ class Optics:
         self.addPlot({'complete stack': self.fc}, 'profiles', 'collection function')
         logging.info('\tcalculation of layerwise collection finished.')
         
+    def updateCollection(self, stack, names):
+        '''
+        collection and QE after the collection functions of the layers names of stack changed (e.g. diffusion length fit): 
+        the absorbed intensity of the last calcAbsorption (absorbedI) is reused, no optics are calculated again
+        returns False if this is not possible (no absorption with 2D data or the layer structure changed)
+        '''
+        if not self.keep2D or not all(hasattr(self.LayerResults[key], 'absorbedI') for key in self.names):
+            return False
+        if not self.update(stack, dict([(name, {'collection'}) for name in names])):
+            return False
+        self.calculate('QE')
+        return True
+        
+    def collectionCandidates(self, name, parameter, values):
+        '''
+        EQE (len(values), wavelengths) for several values of one parameter of the diffusion length model 
+        ('diffLength', 'SCRwidth' or 'recVel') of layer name (and its roughness layer) at once, 
+        the absorbed intensity of the last calcAbsorption and the collection of all other layers are reused
+        '''
+        if name not in self.names or self.LayerResults[name].collection['source'] != 'from diffusion length':
+            raise NotImplementedError('layer {} has no collection from diffusion length'.format(name))
+        values = np.asarray(values, dtype = float).reshape(-1, 1)
+        EQE = np.zeros((len(values), len(self.wavelength)))
+        for key in self.names:
+            layer = self.LayerResults[key]
+            if key in [name, name + '_rough']:
+                # trapz(absorbedI * fc, x, axis = 0) for all collection functions as one matrix product
+                fcs = layer.diffusionCollection(**{parameter: values})
+                EQE = EQE + np.abs(np.dot(fcs * trapzWeights(layer.x), layer.absorbedI))
+            else:
+                EQE = EQE + np.abs(layer.collected)
+        return EQE
+        
+    @stage('QE')
     def calcQE(self):
         self.calcCollection()
         logging.info('\tcalculate quantum efficiency...')
@@ -1189,6 +1959,310 @@ class Optics:
         
         logging.info('\tcalculation of quantum efficiency finished.')
         
+    def interfaceDerivatives(self, i, dcri_i, dcri_j):
+        '''
+        derivatives of the interface matrices (coherent and incoherent) below layer i (-1 first interface) 
+        for the changes dcri_i and dcri_j of the refractive indices of the layers above and below
+        '''
+        N = len(self.names)
+        cri_air = np.ones((len(self.wavelength)), np.complex)
+        layer2 = None
+        if i == -1:
+            layer2 = self.LayerResults[self.names[0]]
+            cri_i, cri_j, th_i, th_j = cri_air, layer2.cri, self.layerstack.theta0, layer2.theta
+            rough, d_rough = self.rough, layer2.sroughThickness
+        elif i < N - 1:
+            layer1 = self.LayerResults[self.names[i]]
+            layer2 = self.LayerResults[self.names[i+1]]
+            cri_i, cri_j, th_i, th_j = layer1.cri, layer2.cri, layer1.theta, layer2.theta
+            rough, d_rough = self.rough, layer2.sroughThickness
+        else:
+            layer1 = self.LayerResults[self.names[i]]
+            cri_i, cri_j, th_i, th_j = layer1.cri, cri_air, layer1.theta, self.theta_out
+            rough, d_rough = 0, 0
+        hazeR = hazeT = 1.0
+        if layer2 is not None and layer2.srough:
+            hazeR = np.sqrt(1 - layer2.sroughHazeR)
+            hazeT = np.sqrt(1 - layer2.sroughHazeT)
+        # the incoherent matrices of the first and the last interface have no haze (see setInterfaceMatrices)
+        if 0 <= i < N - 1:
+            incR, incT, incRR = hazeR, hazeT, hazeR**2 - hazeT**2
+        else:
+            incR, incT, incRR = 1.0, 1.0, 1.0
+        
+        r_jk, t_jk, r_kj, t_kj = self.fresnel(i, self.pol)[:4]
+        dr_jk, dt_jk = dFresnel(self.pol, rough, d_rough, self.wavelength, cri_i, cri_j, th_i, th_j, dcri_i, dcri_j)
+        dr_kj, dt_kj = dFresnel(self.pol, rough, d_rough, self.wavelength, cri_j, cri_i, th_j, th_i, dcri_j, dcri_i)
+        
+        dInterfaceMatrix = np.zeros((len(self.wavelength), 2, 2), np.complex)
+        dInterfaceMatrixInc = np.zeros((len(self.wavelength), 2, 2), np.complex)
+        # coherent
+        dInterfaceMatrix[:, 0, 0] = - dt_jk / (hazeT * t_jk**2)
+        dInterfaceMatrix[:, 0, 1] = hazeR * (dr_jk * t_jk - r_jk * dt_jk) / (hazeT * t_jk**2)
+        dInterfaceMatrix[:, 1, 0] = dInterfaceMatrix[:, 0, 1]
+        dInterfaceMatrix[:, 1, 1] = (2 * (hazeR**2 - hazeT**2) * r_jk * dr_jk * t_jk 
+                                        - (hazeT**2 + (hazeR**2 - hazeT**2) * r_jk**2) * dt_jk) / (hazeT * t_jk**2)
+        # incoherent: d(B/A) = (dB * A - B * dA) / A**2
+        A = np.abs(incT * t_jk)**2
+        dA = 2 * incT**2 * np.real(np.conj(t_jk) * dt_jk)
+        B = np.abs(incR * r_jk)**2
+        dB = 2 * incR**2 * np.real(np.conj(r_jk) * dr_jk)
+        C = np.abs(incT**2 * t_jk * t_kj)**2 - np.abs(incRR * r_jk * r_kj)**2
+        dC = 2 * incT**4 * np.real(np.conj(t_jk * t_kj) * (dt_jk * t_kj + t_jk * dt_kj)) \
+                - 2 * incRR**2 * np.real(np.conj(r_jk * r_kj) * (dr_jk * r_kj + r_jk * dr_kj))
+        dInterfaceMatrixInc[:, 0, 0] = - dA / A**2
+        dInterfaceMatrixInc[:, 0, 1] = - (dB * A - B * dA) / A**2
+        dInterfaceMatrixInc[:, 1, 0] = (dB * A - B * dA) / A**2
+        dInterfaceMatrixInc[:, 1, 1] = (dC * A - C * dA) / A**2
+        return dInterfaceMatrix, dInterfaceMatrixInc
+        
+    def polarized(self, j):
+        '''
+        shallow copy of the optics of unpolarized light for polarization j ('s' 0, 'p' 1): interface and step matrices 
+        of this polarization, all other matrices and results are shared (e.g. for the derivatives of s and p)
+        '''
+        optics = copy.copy(self)
+        optics.unpolarized = False
+        optics.pol = self.pol[j]
+        optics.firstInterfaceMatrix = self.firstInterfaceMatrix[j]
+        optics.firstInterfaceMatrixInc = self.firstInterfaceMatrixInc[j]
+        optics.LayerResults = {}
+        for name, layer in self.LayerResults.items():
+            layer = copy.copy(layer)
+            for attribute in ['InterfaceMatrix', 'InterfaceMatrixInc', 'StepMatrix', 'StepMatrixInc']:
+                setattr(layer, attribute, getattr(layer, attribute)[j])
+            optics.LayerResults[name] = layer
+        return optics
+        
+    def calcDerivatives(self, parameters, EQE = False):
+        '''
+        derivatives of RspectrumSystem, TspectrumSystem and (if EQE) EQE of the last calcStack with respect to 
+        parameters: list of (layer name, 'thickness', 'n' or 'k'), n and k only of layers with constant n,k
+        the layer and interface matrices are differentiated analytically and their derivatives are multiplied 
+        through the same partial system matrices as in getSystemMatrixVectorized (product rule);
+        for EQE the mesh points of a layer move with its thickness (as for a fixed number of mesh points)
+        unpolarized light: mean of the derivatives of s and p polarization (see polarized)
+        returns a dictionary 'R', 'T' (and 'EQE') of (len(parameters), wavelengths) arrays
+        raises NotImplementedError for diffuse light (haze), graded layers, collapsed periods of repeat blocks 
+        and n,k next to roughness layers (EMA model)
+        '''
+        if self.HazeOn:
+            raise NotImplementedError('derivatives with diffuse light (haze) are not implemented')
+        if self.unpolarized:
+            self.calculate('QE' if EQE else 'stack')
+            parts = [self.polarized(j).calcDerivatives(parameters, EQE) for j in range(len(self.pol))]
+            return OrderedDict([(key, np.mean([part[key] for part in parts], axis = 0)) for key in parts[0]])
+        if any(getattr(self.LayerResults[name], 'block', None) for name in self.names):
+            raise NotImplementedError('derivatives with collapsed periods of repeat blocks are not implemented')
+        self.calculate('QE' if EQE else 'stack')
+        logging.info('\tcalculate derivatives of {} parameters...'.format(len(parameters)))
+        wvl = self.wavelength
+        layers = [self.LayerResults[name] for name in self.names]
+        thick = [layer.thick for layer in layers]
+        N = len(layers)
+        P = len(parameters)
+        dThickness = np.zeros((P, N))
+        dcri = np.zeros((P, N), np.complex)
+        for p, (name, kind) in enumerate(parameters):
+            if name not in self.names or layers[self.names.index(name)].criSource == 'graded':
+                raise NotImplementedError('derivatives of layer {} are not implemented'.format(name))
+            i = self.names.index(name)
+            if kind == 'thickness':
+                dThickness[p, i] = 1
+            elif kind in ['n', 'k']:
+                if layers[i].criSource != 'constant' or any('_rough' in self.names[j] for j in [i-1, i+1] if 0 <= j < N):
+                    raise NotImplementedError('derivative of {} of layer {} is not implemented'.format(kind, name))
+                dcri[p, i] = 1 if kind == 'n' else 1j
+            else:
+                raise NotImplementedError('derivative with respect to {} is not implemented'.format(kind))
+        
+        # derivatives of the layer matrices: d(EXP) with d(xi) = 2pi * dcri / (wvl * cos(theta)) by Snell's law
+        dXi = {}
+        dLayer = {}
+        dLayerInc = {}
+        for i, layer in enumerate(layers):
+            if not (dThickness[:, i].any() or dcri[:, i].any()):
+                continue
+            dXi[i] = np.outer(dcri[:, i], 2 * np.pi / (wvl * cos(layer.theta)))
+            dEXP = 1j * (np.outer(dThickness[:, i], layer.xi) + dXi[i] * layer.thickness)
+            dLayer[i] = np.zeros((P, len(wvl), 2, 2), np.complex)
+            dLayer[i][:, :, 0, 0] = - dEXP * layer.LayerMatrix[:, 0, 0]
+            dLayer[i][:, :, 1, 1] = dEXP * layer.LayerMatrix[:, 1, 1]
+            dLayerInc[i] = np.zeros((P, len(wvl), 2, 2), np.complex)
+            dLayerInc[i][:, :, 0, 0] = - 2 * np.real(dEXP) * layer.LayerMatrixInc[:, 0, 0]
+            dLayerInc[i][:, :, 1, 1] = 2 * np.real(dEXP) * layer.LayerMatrixInc[:, 1, 1]
+        # derivatives of the interface matrices (-1 first interface)
+        dInterface = {}
+        dInterfaceInc = {}
+        for i in range(-1, N):
+            above = dcri[:, i] if i >= 0 else np.zeros(P)
+            below = dcri[:, i+1] if i < N - 1 else np.zeros(P)
+            if not (above.any() or below.any()):
+                continue
+            dInterface[i] = np.zeros((P, len(wvl), 2, 2), np.complex)
+            dInterfaceInc[i] = np.zeros((P, len(wvl), 2, 2), np.complex)
+            for p in range(P):
+                if above[p] or below[p]:
+                    dInterface[i][p], dInterfaceInc[i][p] = self.interfaceDerivatives(i, above[p], below[p])
+        dStep = {}
+        dStepInc = {}
+        for i, layer in enumerate(layers):
+            dStep[i] = dProduct(layer.LayerMatrix, dLayer.get(i), layer.InterfaceMatrix, dInterface.get(i))
+            dStepInc[i] = dProduct(layer.LayerMatrixInc, dLayerInc.get(i), layer.InterfaceMatrixInc, dInterfaceInc.get(i))
+        
+        # partial system matrices and their derivatives as in getSystemMatrixVectorized
+        PSI = {}
+        PSO = {}
+        coherentParts = []
+        incoherentLayers = []
+        SysMat, dSysMat = self.firstInterfaceMatrix, dInterface.get(-1)
+        for i, layer in enumerate(layers):
+            if not thick[i]:
+                if i == 0:
+                    SysMat, dSysMat = self.firstInterfaceMatrix, dInterface.get(-1)
+                elif thick[i-1]:
+                    SysMat, dSysMat = layers[i-1].InterfaceMatrix, dInterface.get(i-1)
+                PSI[i] = (SysMat, dSysMat)
+                Out, dOut = layer.InterfaceMatrix, dInterface.get(i)
+                for j in range(i+1, N):
+                    if thick[j]:
+                        break
+                    Out, dOut = np.matmul(Out, layers[j].StepMatrix), dProduct(Out, dOut, layers[j].StepMatrix, dStep[j])
+                PSO[i] = (Out, dOut)
+                SysMat, dSysMat = np.matmul(SysMat, layer.StepMatrix), dProduct(SysMat, dSysMat, layer.StepMatrix, dStep[i])
+                if i == N-1:
+                    coherentParts.append((SysMat, dSysMat))
+            else:
+                incoherentLayers.append(i)
+                if i > 0 and not thick[i-1]:
+                    coherentParts.append((SysMat, dSysMat))
+        coherentPartsIntensity = [(intensityMatrix(part), dIntensityMatrix(part, dPart)) for part, dPart in coherentParts]
+        
+        if incoherentLayers:
+            currentCoherentPart = 0
+            if incoherentLayers[0] == 0:
+                SysMat, dSysMat = self.firstInterfaceMatrixInc, dInterfaceInc.get(-1)
+            else:
+                SysMat, dSysMat = coherentPartsIntensity[0]
+                currentCoherentPart += 1
+            for incLayer in incoherentLayers:
+                layer = layers[incLayer]
+                if incLayer < N-1 and not thick[incLayer+1]:
+                    IfMat, dIfMat = coherentPartsIntensity[currentCoherentPart]
+                    currentCoherentPart += 1
+                else:
+                    IfMat, dIfMat = layer.InterfaceMatrixInc, dInterfaceInc.get(incLayer)
+                PSI[incLayer] = (SysMat, dSysMat)
+                PSO[incLayer] = (IfMat, dIfMat)
+                Step = np.matmul(layer.LayerMatrixInc, IfMat)
+                dStepPart = dProduct(layer.LayerMatrixInc, dLayerInc.get(incLayer), IfMat, dIfMat)
+                SysMat, dSysMat = np.matmul(SysMat, Step), dProduct(SysMat, dSysMat, Step, dStepPart)
+        else:
+            SysMat, dSysMat = coherentPartsIntensity[0]
+        if dSysMat is None:
+            dSysMat = np.zeros((P, len(wvl), 2, 2), np.complex)
+        
+        # R = abs(S10 / S00), T = abs(1 / S00)
+        S00 = SysMat[:, 0, 0]
+        ratio = SysMat[:, 1, 0] / S00
+        dRatio = (dSysMat[:, :, 1, 0] * S00 - SysMat[:, 1, 0] * dSysMat[:, :, 0, 0]) / S00**2
+        derivatives = OrderedDict()
+        derivatives['R'] = np.divide(np.real(np.conj(ratio) * dRatio), np.abs(ratio), 
+                                        out = np.zeros((P, len(wvl))), where = np.abs(ratio) != 0)
+        derivatives['T'] = np.real(np.conj(1 / S00) * (- dSysMat[:, :, 0, 0] / S00**2)) / np.abs(1 / S00)
+        if not EQE:
+            return derivatives
+        
+        # PSI and PSO of coherent layers which follow an incoherent layer
+        for k in range(1, N):
+            if thick[k] or not thick[k-1]:
+                continue
+            Int, dInt = PSI[k-1]
+            Int, dInt = np.matmul(Int, layers[k-1].LayerMatrixInc), dProduct(Int, dInt, layers[k-1].LayerMatrixInc, dLayerInc.get(k-1))
+            Root, dRoot = np.sqrt(Int), dSqrt(Int, dInt)
+            coh = k
+            while coh < N and not thick[coh]:
+                In, dIn = PSI[coh]
+                PSI[coh] = (np.matmul(Root, In), dProduct(Root, dRoot, In, dIn))
+                coh += 1
+            if coh < N:
+                LMat, dLMat = np.sqrt(layers[coh].LayerMatrixInc), dSqrt(layers[coh].LayerMatrixInc, dLayerInc.get(coh))
+                IfMat, dIfMat = np.sqrt(PSO[coh][0]), dSqrt(*PSO[coh])
+                for c in range(k, coh):
+                    Out, dOut = PSO[c]
+                    Out, dOut = np.matmul(Out, LMat), dProduct(Out, dOut, LMat, dLMat)
+                    PSO[c] = (np.matmul(Out, IfMat), dProduct(Out, dOut, IfMat, dIfMat))
+        
+        # EQE = sum of abs(trapz(alpha * n * abs(E)**2 * fc, x)) of all layers (see fieldIntensity)
+        # the sums over the depth do not depend on the parameter and are calculated once per layer
+        zero = np.zeros((P, len(wvl), 2, 2), np.complex)
+        dEQE = np.zeros((P, len(wvl)))
+        for i, layer in enumerate(layers):
+            In, dIn = PSI[i]
+            Out, dOut = PSO[i]
+            dIn = zero if dIn is None else dIn
+            dOut = zero if dOut is None else dOut
+            t = layer.thickness
+            x = layer.x
+            weights = trapzWeights(x) * layer.fc
+            # the mesh moves with the thickness: d(t - x) = (t - x) * dt / t 
+            scale = dThickness[:, i] / t if np.all(t > 0) else np.zeros(P)
+            U = t - x[:, np.newaxis]
+            EXP1 = 1j * layer.xi * U
+            EXP2 = 1j * layer.xi * t
+            # d(EXP1) = 1j * dU * U and d(EXP2) = 1j * (dxi * t + xi * dt) 
+            dU = (dXi[i] if i in dXi else np.zeros((P, len(wvl)))) + np.outer(scale, layer.xi)
+            dEXP2 = 1j * (dU * t + np.outer(dThickness[:, i] - scale * t, layer.xi))
+            if not thick[i]:
+                Down = Out[:, 0, 0] * np.exp(-EXP1)
+                Up = Out[:, 1, 0] * np.exp(EXP1)
+                DenDown = In[:, 0, 0] * Out[:, 0, 0] * np.exp(-EXP2)
+                DenUp = In[:, 0, 1] * Out[:, 1, 0] * np.exp(EXP2)
+                Den = DenDown + DenUp
+                Field = (Down + Up) / Den
+                Ratio = np.dot(weights, np.abs(Field)**2)
+                # d(abs(E)**2) = 2 * Re(conj(E) * (dNum - E * dDen) / Den)
+                sumDown = np.dot(weights, np.conj(Field) * np.exp(-EXP1))
+                sumUp = np.dot(weights, np.conj(Field) * np.exp(EXP1))
+                sumEXP = np.dot(weights, np.conj(Field) * (Up - Down) * U)
+                dNum = dOut[:, :, 0, 0] * sumDown + dOut[:, :, 1, 0] * sumUp + 1j * dU * sumEXP
+                dDen = (dIn[:, :, 0, 0] * Out[:, 0, 0] + In[:, 0, 0] * dOut[:, :, 0, 0]) * np.exp(-EXP2) \
+                        + (dIn[:, :, 0, 1] * Out[:, 1, 0] + In[:, 0, 1] * dOut[:, :, 1, 0]) * np.exp(EXP2) \
+                        + (DenUp - DenDown) * dEXP2
+                dRatio = 2 * np.real((dNum - Ratio * dDen) / Den)
+                if dThickness[:, i].any():
+                    dCollection = np.dot(trapzWeights(x) * layer.collectionDerivative(), np.abs(Field)**2)
+            else:
+                Down = np.abs(np.exp(-EXP1))**2
+                Up = np.abs(np.exp(EXP1))**2
+                DenDown = In[:, 0, 0] * Out[:, 0, 0] * np.abs(np.exp(-EXP2))**2
+                DenUp = In[:, 0, 1] * Out[:, 1, 0] * np.abs(np.exp(EXP2))**2
+                Den = DenDown + DenUp
+                Intensity = (Out[:, 0, 0] * Down + Out[:, 1, 0] * Up) / Den
+                Ratio = np.dot(weights, Intensity)
+                # d(abs(exp(+-EXP))**2) = +-2 * Re(dEXP) * abs(exp(+-EXP))**2 with Re(dEXP1) = -Im(dU) * U
+                sumDown = np.dot(weights, Down)
+                sumUp = np.dot(weights, Up)
+                sumEXP = np.dot(weights, (Out[:, 0, 0] * Down - Out[:, 1, 0] * Up) * U)
+                dNum = dOut[:, :, 0, 0] * sumDown + dOut[:, :, 1, 0] * sumUp + 2 * np.imag(dU) * sumEXP
+                dDen = (dIn[:, :, 0, 0] * Out[:, 0, 0] + In[:, 0, 0] * dOut[:, :, 0, 0]) * np.abs(np.exp(-EXP2))**2 \
+                        + (dIn[:, :, 0, 1] * Out[:, 1, 0] + In[:, 0, 1] * dOut[:, :, 1, 0]) * np.abs(np.exp(EXP2))**2 \
+                        + 2 * np.real(dEXP2) * (DenUp - DenDown)
+                dRatio = (dNum - Ratio * dDen) / Den
+                if dThickness[:, i].any():
+                    dCollection = np.dot(trapzWeights(x) * layer.collectionDerivative(), Intensity)
+            # collected = alpha * n * Ratio with alpha = 4pi k / wvl, the weights scale with the thickness
+            collected = layer.alpha * layer.n * Ratio
+            dCollected = (np.real(dcri[:, i, np.newaxis]) * layer.alpha + np.imag(dcri[:, i, np.newaxis]) * 4 * np.pi / wvl * layer.n) * Ratio \
+                            + layer.alpha * layer.n * dRatio + collected * scale[:, np.newaxis]
+            if dThickness[:, i].any():
+                dCollected = dCollected + layer.alpha * layer.n * dCollection * dThickness[:, i, np.newaxis]
+            dEQE += np.divide(np.real(np.conj(collected) * dCollected), np.abs(collected), 
+                                out = np.zeros((P, len(wvl))), where = np.abs(collected) != 0)
+        derivatives['EQE'] = dEQE
+        return derivatives
+        
+    @stage('generation')
     def calcGeneration(self):
         '''
         calculated generation rate per
@@ -1208,6 +2282,8 @@ class Optics:
         wvl = self.wavelength
 
         for key in self.names:
+            if not self.keep2D:
+                continue # G_x and el_G_x integrated in streamFieldIntensity
             #Energy dissipation W/m²-nm-nm at each position and wavelength (JAP Vol    % 86 p.487 Eq 22)
             self.LayerResults[key].Q = self.spectrum * self.LayerResults[key].absorbedI
             # generation rate per second-cm²-nm-nm at each position and wavelength
@@ -1226,13 +2302,15 @@ class Optics:
         self.el_G_x = []
         
         for i, key in enumerate(self.names):
-            self.G_wl_x.extend(self.LayerResults[key].G_wl_x * 1e7) # 1/cm^2-s-nm-nm --> 1/cm^3-s-nm
-            self.el_G_wl_x.extend(self.LayerResults[key].el_G_wl_x * 1e7) # 1/cm^2-s-nm-nm --> 1/cm^3-s-nm
+            if self.keep2D:
+                self.G_wl_x.extend(self.LayerResults[key].G_wl_x * 1e7) # 1/cm^2-s-nm-nm --> 1/cm^3-s-nm
+                self.el_G_wl_x.extend(self.LayerResults[key].el_G_wl_x * 1e7) # 1/cm^2-s-nm-nm --> 1/cm^3-s-nm
             self.G_x.extend(self.LayerResults[key].G_x * 1e7) # 1/cm^2-s-nm --> 1/cm^3-s
             self.el_G_x.extend(self.LayerResults[key].el_G_x * 1e7) # 1/cm^2-s-nm --> 1/cm^3-s
         
-        self.addPlot({'electrical collection' : np.array(self.G_wl_x)}, '2D')
-        self.addPlot({'optical generation' : np.array(self.el_G_wl_x)}, '2D')
+        if self.keep2D:
+            self.addPlot({'electrical collection' : np.array(self.G_wl_x)}, '2D')
+            self.addPlot({'optical generation' : np.array(self.el_G_wl_x)}, '2D')
         self.addPlot({'optical generation (1/cm³s)': self.G_x}, 'profiles', 'generation')
         self.addPlot({'electrical collection (1/cm³s)': self.el_G_x}, 'profiles', 'generation')
         
@@ -1241,6 +2319,73 @@ class Optics:
         self.scalars['generated current (mA/cm²)'] = self.generatedCurrent
         logging.info('\tcalculation of generation profile finished.')
         
+    def collectionDepthIntegral(self):
+        '''
+        collected intensity (calcQE) integrated over the depth of the whole stack for each wavelength
+        '''
+        weights = trapzWeights(self.x)
+        total = 0
+        offset = 0
+        for key in self.names:
+            layer = self.LayerResults[key]
+            if self.keep2D:
+                total = total + np.dot(weights[offset:offset + len(layer.x)], layer.collectedI)
+            else:
+                total = total + layer.collectedDepth
+            offset += len(layer.x)
+        return total
+        
+    def evaluateSpectra(self, spectra):
+        '''
+        scalars (W/m², mA/cm²) for other spectra and intensities from the optics already calculated without calculating the optics again:
+        A, R, T require calcStack, layerwise absorption calcAbsorption, layerwise collection and generated current calcQE
+        spectra: list of spectrum file names (intensity of settings) or (file name, intensity in %)
+        returns one OrderedDict of scalars for each spectrum
+        '''
+        h = 6.62606957e-34 # Js Planck's constant
+        c = 2.99792458e8 #m/s speed of light
+        q = 1.602176e-19 #C electric chargeq 
+        wvl = self.wavelength
+        powers = []
+        currents = []
+        results = []
+        for spectrum in spectra:
+            if isinstance(spectrum, str):
+                name, intensity = spectrum, self.settings['intensity']
+            else:
+                name, intensity = spectrum
+            curves = spectrumLibrary.get(name, wvl, self.settings['wavelength uniform'] if 'wavelength uniform' in self.settings else None)
+            powers.append(curves.power * intensity / 100)
+            currents.append(curves.current)
+            results.append(OrderedDict([('spectrum', name), 
+                                        ('illum. intensity (W/m²)', curves.Imax * intensity / 100), 
+                                        ('Jmax (mA/cm²)', curves.Jmax)]))
+        powers = np.array(powers)
+        currents = np.array(currents)
+        values = OrderedDict()
+        if hasattr(self, 'AspectrumSystem'):
+            values['absorbance (mA/cm²)'] = integrate.trapz(self.AspectrumSystem * currents, x = wvl, axis=1)
+            values['reflectance (mA/cm²)'] = integrate.trapz(self.RspectrumSystem * currents, x = wvl, axis=1)
+            values['transmittance (mA/cm²)'] = integrate.trapz(self.TspectrumSystem * currents, x = wvl, axis=1)
+        # layerwise values, sublayers of graded layers and periods of repeat blocks summed up
+        for key, attribute, needed in [('absorption layerwise (mA/cm²) ', 'absorption', 'absorbedIntensity'), 
+                                        ('collection layerwise (mA/cm²) ', 'collected', 'EQE')]:
+            if not hasattr(self, needed):
+                continue
+            layerwise = OrderedDict([(layer.name, 0) for layer in self.layerstack.stack_rough])
+            for name in self.names:
+                for parent, curves in resultParts(self.LayerResults[name], attribute):
+                    layerwise[parent] = layerwise[parent] + integrate.trapz(curves * currents, x = wvl, axis=1)
+            values[key] = np.array(list(layerwise.values())).T
+        if hasattr(self, 'EQE'):
+            collected = self.collectionDepthIntegral()
+            values['generated current (mA/cm²)'] = integrate.trapz(powers * collected * wvl * 1e-13 / (h * c), x = wvl, axis = 1) * q * 1000
+        for key, value in values.items():
+            for i, result in enumerate(results):
+                result[key] = list(value[i]) if np.ndim(value) > 1 else value[i]
+        return results
+        
+    @stage('Lambert-Beer')
     def calcOptBeamTotal(self):
         logging.info('\tcalculate Lambert-Beer optics...')
         h = 6.62606957e-34 # Js Planck's constant
@@ -1261,15 +2406,18 @@ class Optics:
             I = I * (1 - self.R_reference)
 
         for key in self.names:
-            alpha = self.LayerResults[key].alpha
             x = self.LayerResults[key].x
-            EXP = x[:, np.newaxis]
-            Ivector = I*np.exp(-alpha*EXP)
+            if getattr(self.LayerResults[key], 'block', None):
+                Ivector = self.blockLambertBeer(self.LayerResults[key], I)
+            else:
+                alpha = self.LayerResults[key].alpha
+                EXP = x[:, np.newaxis]
+                Ivector = I*np.exp(-alpha*EXP)
+                self.LayerResults[key].absorbedILB = self.LayerResults[key].alpha * Ivector #self.LayerResults[key].n
+                self.LayerResults[key].collectedILB = self.LayerResults[key].absorbedILB * self.LayerResults[key].fc[:, np.newaxis]
             I_end = Ivector[-1]
             
-            self.LayerResults[key].absorbedILB = self.LayerResults[key].alpha * Ivector #self.LayerResults[key].n
             self.LayerResults[key].absorptionLB = integrate.trapz(self.LayerResults[key].absorbedILB, x=x, axis=0) # 
-            self.LayerResults[key].collectedILB = self.LayerResults[key].absorbedILB * self.LayerResults[key].fc[:, np.newaxis]
             self.LayerResults[key].collectedLB = integrate.trapz(self.LayerResults[key].collectedILB, x=x, axis=0) # 
             
             # for scalars
@@ -1314,34 +2462,40 @@ class Optics:
             self.LayerResults[key].relCollectionLB = integrCollection[key] / np.sum(list(integrAbsorption.values())) * self.scalars['absorbance LB (%)']/100
             #self.LayerResults[key].absCollectionLB = self.LayerResults[key].relCollectionLB * self.Jmax
             self.LayerResults[key].absCollectionLB = integrate.trapz(self.LayerResults[key].collectedLB * self.spectrumCurrent, x = wvl, axis=0)
-            # fill dicts with curves while sum up if sublayer is part of graded layer
-            if self.LayerResults[key].criSource == 'graded':
-                name = self.LayerResults[key].parentName
+            # fill dicts with curves while sum up if sublayer is part of graded layer or repeat block
+            for name, absorption in resultParts(self.LayerResults[key], 'absorptionLB'):
+                part = integrate.trapz(absorption, x=wvl, axis=0) / np.sum(list(integrAbsorption.values())) * self.scalars['absorbance LB (%)']
+                current = integrate.trapz(absorption * self.spectrumCurrent, x = wvl, axis=0)
                 if name not in absorptionCurves.keys():
-                    absorptionCurves[name] = self.LayerResults[key].absorptionLB
-                    collectedCurves[name] = self.LayerResults[key].collectedLB
-                    relAbsorption[name] = self.LayerResults[key].relAbsorptionLB * 100
-                    absAbsorption[name] = self.LayerResults[key].absAbsorptionLB
-                    relCollection[name] = self.LayerResults[key].relCollectionLB * 100
-                    absCollection[name] = self.LayerResults[key].absCollectionLB
+                    absorptionCurves[name] = absorption
+                    relAbsorption[name] = part
+                    absAbsorption[name] = current
                 else:
-                    absorptionCurves[name] = absorptionCurves[name] + self.LayerResults[key].absorptionLB
-                    collectedCurves[name] = collectedCurves[name] + self.LayerResults[key].collectedLB
-                    relAbsorption[name] = relAbsorption[name] + self.LayerResults[key].relAbsorptionLB * 100
-                    absAbsorption[name] = absAbsorption[name] + self.LayerResults[key].absAbsorptionLB
-                    relCollection[name] = relCollection[name] + self.LayerResults[key].relCollectionLB * 100
-                    absCollection[name] = absCollection[name] + self.LayerResults[key].absCollectionLB
-            else:
-                absorptionCurves[key] = self.LayerResults[key].absorptionLB
-                collectedCurves[key] = self.LayerResults[key].collectedLB
-                relAbsorption[key] = self.LayerResults[key].relAbsorptionLB * 100
-                absAbsorption[key] = self.LayerResults[key].absAbsorptionLB
-                relCollection[key] = self.LayerResults[key].relCollectionLB * 100
-                absCollection[key] = self.LayerResults[key].absCollectionLB
+                    absorptionCurves[name] = absorptionCurves[name] + absorption
+                    relAbsorption[name] = relAbsorption[name] + part
+                    absAbsorption[name] = absAbsorption[name] + current
+            for name, collected in resultParts(self.LayerResults[key], 'collectedLB'):
+                part = integrate.trapz(collected, x=wvl, axis=0) / np.sum(list(integrAbsorption.values())) * self.scalars['absorbance LB (%)']
+                current = integrate.trapz(collected * self.spectrumCurrent, x = wvl, axis=0)
+                if name not in collectedCurves.keys():
+                    collectedCurves[name] = collected
+                    relCollection[name] = part
+                    absCollection[name] = current
+                else:
+                    collectedCurves[name] = collectedCurves[name] + collected
+                    relCollection[name] = relCollection[name] + part
+                    absCollection[name] = absCollection[name] + current
             
         # take original stack and create layerwise plots
+        for key in ['absorption layerwise LB (%) ', 'absorption layerwise LB (mA/cm²) ', 'collection layerwise LB (%) ', 'collection layerwise LB (mA/cm²) ']:
+            self.scalars[key] = []
         for layer in self.layerstack.stack_rough:
             name = layer.name
+            # layers without results in the layer sequence
+            for curves in [absorptionCurves, collectedCurves]:
+                curves.setdefault(name, np.zeros(len(wvl)))
+            for results in [relAbsorption, absAbsorption, relCollection, absCollection]:
+                results.setdefault(name, 0)
             self.scalars['absorption layerwise LB (%) '].append(relAbsorption[name])
             self.scalars['absorption layerwise LB (mA/cm²) '].append(absAbsorption[name])
             self.scalars['collection layerwise LB (%) '].append(relCollection[name])
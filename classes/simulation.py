@@ -0,0 +1,184 @@
+'''
+simulation pipeline (LayerStack + Optics) and stack files independent of the GUI
+'''
+
+import copy
+import time
+import pickle
+import logging
+import numpy as np
+from scipy import integrate
+
+from classes.errors import *
+from classes.layerstack import LayerStack
+from classes.optics import Optics
+from classes.spectra import spectrumLibrary
+
+def unpickleType(module, name, args):
+    '''
+    replaces Qt types (layer color QColor) in stack files by the tuple of their arguments
+    '''
+    return args
+
+class StackUnpickler(pickle.Unpickler):
+    '''
+    Unpickler for .mop stack files which does not import PyQt
+    '''
+    def find_class(self, module, name):
+        if name == '_unpickle_type' and module in ['sip', 'PyQt5.sip']:
+            return unpickleType
+        return super().find_class(module, name)
+
+def loadStack(fName):
+    '''
+    read a stack file (.mop) without GUI
+    returns name, settings, defaults, references and list of layers
+    '''
+    try:
+        with open(fName, 'rb') as file:
+            u = StackUnpickler(file)
+            fileVersion = u.load()
+            name = u.load()
+            settings = u.load()
+            defaults = u.load()
+            references = u.load()
+            lenStack = u.load()
+            stack = [u.load() for i in range(lenStack)]
+    except (IOError, pickle.UnpicklingError, EOFError) as e:
+        raise LoadError('Could not load stack file {}: \n {}'.format(fName, e))
+    logging.info('\tloaded stack {} from {} (file version {})'.format(name, fName, fileVersion))
+    return name, settings, defaults, references, stack
+
+# calculation stages of Optics (see classes.optics.STAGES) by index of defaults['calculations']
+CALCULATIONS = ['stack', 'field intensity', 'absorption', 'QE', 'generation', 'ellipsometry', 'Lambert-Beer']
+
+COARSE = 8 # adaptive wavelengths start from every COARSE-th wavelength of settings['wavelength']
+
+def adaptiveWavelengths(stackname, stack, settings, references, getCRI, tolerance, QE = False):
+    '''
+    non-uniform wavelength grid (subset of settings['wavelength']) for a relative error tolerance of the means (%) and 
+    photon currents (mA/cm²) of R, T, A (and EQE if QE, e.g. generated current) with R, T, A, EQE linear between the 
+    wavelengths: starting from every COARSE-th wavelength, intervals whose trapezoidal error (from the second differences, 
+    relative to the range and to Jmax with the mean photon current of the interval) exceeds their part of the tolerance 
+    are halved and only the new wavelengths are calculated, until no interval is refined or means and currents 
+    change by less than the tolerance
+    returns the grid and the number of calculated wavelengths
+    '''
+    wvl = np.asarray(settings['wavelength'], dtype = np.float64)
+    outputs = ['RspectrumSystem', 'TspectrumSystem', 'AspectrumSystem'] + (['EQE'] if QE else [])
+    spectrum = spectrumLibrary.get(settings['spectrum'], wvl).current
+    Jmax = integrate.trapz(spectrum, x = wvl)
+    cumulative = np.concatenate([[0], np.cumsum(np.diff(wvl) * (spectrum[1:] + spectrum[:-1]) / 2)])
+    values = np.full((len(outputs), len(wvl)), np.nan)
+    indices = np.unique(np.append(np.arange(0, len(wvl), COARSE), len(wvl) - 1))
+    new = indices
+    previous = None
+    while True:
+        if len(new) == 1:
+            new = np.union1d(new, [new[0] - 1 if new[0] > 0 else new[0] + 1]) # the stages need two wavelengths
+        optics = Optics(stackname, LayerStack(stackname, copy.deepcopy(stack), dict(settings, wavelength = wvl[new]), getCRI), 
+                        references, settings)
+        values[:, new] = np.real(optics.request(*outputs))
+        grid = wvl[indices]
+        current = values[:, indices]
+        integrals = np.array([integrate.trapz(np.interp(wvl, grid, value) * spectrum, x = wvl) / Jmax for value in current])
+        integrals = np.append(integrals, integrate.trapz(current, x = grid, axis = 1) / (grid[-1] - grid[0]))
+        if previous is not None and np.all(np.abs(integrals - previous) <= tolerance):
+            break
+        previous = integrals
+        # trapezoidal error h³ |f''| / 12 of each interval relative to the range or to Jmax (mean photon current), 
+        # second differences at its ends
+        h = np.diff(grid)
+        slopes = np.diff(current, axis = 1) / h
+        second = np.zeros(current.shape)
+        second[:, 1:-1] = 2 * np.abs(np.diff(slopes, axis = 1)) / (h[1:] + h[:-1])
+        weight = np.maximum(np.diff(cumulative[indices]) / h / Jmax, 1 / (grid[-1] - grid[0]))
+        error = h**3 / 12 * np.max(np.maximum(second[:, 1:], second[:, :-1]), axis = 0) * weight
+        refine = (error > tolerance * h / (grid[-1] - grid[0])) & (np.diff(indices) > 1)
+        if not np.any(refine):
+            break
+        new = (indices[:-1][refine] + indices[1:][refine]) // 2
+        indices = np.union1d(indices, new)
+    calculated = int(np.sum(~np.isnan(values[0])))
+    logging.info('\tadaptive wavelengths: {} of {} wavelengths (tolerance {}), {} calculated'.format(
+                    len(indices), len(wvl), tolerance, calculated))
+    return wvl[indices], calculated
+
+def simulate(stackname, stack, settings, references, calculations, getCRI, progress = None):
+    '''
+    create LayerStack and Optics and run the calculations
+    calculations: list of indices as in defaults['calculations']
+        0 stack optics, 1 field intensity, 2 absorption, 3 QE,
+        4 generation, 5 ellipsometry, 6 Lambert-Beer
+        prerequisites of a calculation are calculated as well (see Optics.calculate)
+    progress: function called with the progress in %
+    with settings['wavelength tolerance'] > 0 the calculations use a non-uniform grid (see adaptiveWavelengths)
+    '''
+    tolerance = settings['wavelength tolerance'] if 'wavelength tolerance' in settings else 0
+    if tolerance > 0:
+        grid = adaptiveWavelengths(stackname, stack, settings, references, getCRI, tolerance, 
+                                   any([no in calculations for no in [3, 4]]))[0]
+        settings = dict(settings, wavelength = grid, **{'wavelength uniform': settings['wavelength']})
+        if progress is not None:
+            progress(5)
+    input = LayerStack(stackname, stack, settings, getCRI)
+
+    startCalcTime = time.time()
+
+    logging.info('\ncalculate optics...\n')
+
+    currentOptics = Optics(stackname, input, references, settings)
+    currentOptics.createReferenceCurves()
+    if progress is not None:
+        progress(10)
+
+    length = len(calculations)
+
+    # ------------ What to calculate? --------
+    stages = [CALCULATIONS[no] for no in sorted(calculations)]
+    if currentOptics.threads:
+        # independent stages at the same time
+        currentOptics.calculate(*stages)
+    else:
+        for no in sorted(calculations):
+            currentOptics.calculate(CALCULATIONS[no])
+            if progress is not None and no < 5:
+                progress((100 * (no + 1) / length) - 10)
+
+    endCalcTime = time.time()
+    currentOptics.scalars['calc. time (s)'] = endCalcTime - startCalcTime
+
+    logging.info('\n... optics calculated in {:.4f} s.\n'.format(currentOptics.scalars['calc. time (s)']))
+    return currentOptics
+
+GRADIENTMETHODS = ['CG', 'BFGS', 'L-BFGS-B', 'TNC', 'SLSQP'] # methods of scipy.optimize.minimize which use jac
+DERIVATIVES = {'R reference': 'R', 'T reference': 'T', 'EQE reference': 'EQE'} # references with derivatives (Optics.calcDerivatives)
+# output of Optics (see Optics.request) compared with each reference
+REFERENCEMODELS = {'R reference': 'RspectrumSystem', 'T reference': 'TspectrumSystem', 'EQE reference': 'EQE', 
+                   'psi reference': 'psi', 'delta reference': 'delta'}
+
+def chiSquareGradient(optics, parameters, references):
+    '''
+    gradient of the chi square sum(((model - reference) / reference)**2) of the references {'R reference': data, ...} 
+    with respect to parameters (list of (layer name, 'thickness', 'n' or 'k')) from the analytic derivatives of optics
+    raises NotImplementedError if there are no derivatives for a reference or a parameter
+    '''
+    for key in references:
+        if key not in DERIVATIVES:
+            raise NotImplementedError('no derivatives of {}'.format(key))
+    derivatives = optics.calcDerivatives(parameters, 'EQE reference' in references)
+    models = dict([(key, optics.request(REFERENCEMODELS[key])) for key in references])
+    gradient = np.zeros(len(parameters))
+    for key, data in references.items():
+        gradient += np.dot(derivatives[DERIVATIVES[key]], 2 * (models[key] - data) / data**2)
+    return gradient
+
+def updateOptics(optics, stackname, stack, settings, references, getCRI, dirty):
+    '''
+    Optics of stack after the parameters in dirty ({layer name: set of 'thickness', 'roughness', 'collection', 'nk'}) changed, 
+    e.g. in each iteration of a fit: optics is updated incrementally (see Optics.update) 
+    or a new LayerStack and Optics are created if this is not possible or optics is None
+    '''
+    if optics is not None and optics.update(stack, dirty):
+        return optics
+    return Optics(stackname, LayerStack(stackname, stack, settings, getCRI), references, settings)
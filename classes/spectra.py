@@ -0,0 +1,135 @@
+'''
+library of illumination spectra (files in spectra/) independent of the GUI
+each file is read and normalized once per process, the spectra interpolated to a wavelength grid are cached
+'''
+
+import os
+import logging
+from collections import namedtuple
+import numpy as np
+from scipy import integrate
+
+from classes.errors import *
+from classes.materials import gridKey
+
+h = 6.62606957e-34 # Js Planck's constant
+c = 2.99792458e8 #m/s speed of light
+q = 1.602176e-19 #C electric charge
+
+SPECTRADIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'spectra')
+
+# spectrum on a wavelength grid:
+# power - W/m²nm, current - mA/cm²nm (photon current), Jmax - mA/cm², Imax - W/m² of the file
+Spectrum = namedtuple('Spectrum', ['name', 'power', 'current', 'Jmax', 'Imax'])
+
+def findSpectrumFile(name):
+    '''
+    path of spectrum file name: in spectra of the working directory, in spectra of OptiSim or as given (other directories)
+    '''
+    for fName in [os.path.join(os.getcwd(), 'spectra', name), os.path.join(SPECTRADIR, name), name]:
+        if os.path.isfile(fName):
+            return fName
+    raise LoadError('Could not find spectrum file {}'.format(name))
+
+def normalizeSpectrum(data):
+    '''
+    norm the spectra (2nd column P * dlambda [W/m²s]) to P [W/m²s_nm] by Pdlambda/dlambda
+    with dlambda as (lambda_x+1 - lambda_x-1)/2; first and last seperately
+    '''
+    spec_norm = np.zeros(data.shape[0])
+    spec_norm[0] = data[0, 1] / (data[1, 0] - data[0, 0])
+    spec_norm[-1] = data[-1, 1] / (data[-1, 0] - data[-1-1, 0])
+    spec_norm[1:-1] = data[1:-1, 1] / ((data[2:, 0] - data[:-2, 0]) / 2)
+    return spec_norm
+
+def cellAverage(wavelength, uniform, values):
+    '''
+    values on the grid wavelength (subset of the grid uniform) whose trapezoidal integral with a function linear 
+    between the wavelengths equals the trapezoidal integral of the function with values on uniform
+    (weights of the hat functions of wavelength divided by the trapezoidal weights)
+    '''
+    def trapezoidal(x):
+        weights = np.zeros(len(x))
+        weights[:-1] += np.diff(x) / 2
+        weights[1:] += np.diff(x) / 2
+        return weights
+    j = np.clip(np.searchsorted(wavelength, uniform, side = 'right') - 1, 0, len(wavelength) - 2)
+    t = (uniform - wavelength[j]) / (wavelength[j+1] - wavelength[j])
+    values = values * trapezoidal(uniform)
+    weights = np.bincount(j, (1 - t) * values, len(wavelength)) + np.bincount(j + 1, t * values, len(wavelength))
+    return weights / trapezoidal(wavelength)
+
+class SpectrumLibrary:
+    '''
+    process wide cache of spectrum files (normalized, reloaded if mtime or size change)
+    and of the spectra interpolated to wavelength grids
+    '''
+    def __init__(self):
+        self.files = {}
+        self.grids = {}
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, name):
+        '''
+        wavelengths, normalized power (W/m²nm) and total power Imax (W/m²) of spectrum file name
+        '''
+        fName = os.path.abspath(findSpectrumFile(name))
+        stat = os.stat(fName)
+        state = (stat.st_mtime_ns, stat.st_size)
+        entry = self.files.get(fName)
+        if entry is not None and entry[0] == state:
+            return entry[1]
+        logging.info('\tload spectrum file {}...'.format(fName))
+        try:
+            data = np.loadtxt(fName, comments='>', encoding='latin1') # some headers contain µ
+        except (IOError, ValueError) as e:
+            raise LoadError('Could not read spectrum file {}: \n {}'.format(fName, e))
+        wavelength = np.array(data[:, 0])
+        power = normalizeSpectrum(data)
+        for array in [wavelength, power]:
+            array.setflags(write = False)
+        self.files[fName] = (state, (fName, wavelength, power, np.sum(data[:, 1])))
+        return self.files[fName][1]
+
+    def get(self, name, wavelength, uniform = None):
+        '''
+        Spectrum of file name interpolated to wavelength, the arrays are read-only and shared
+        uniform: grid of which wavelength is a subset (adaptive wavelengths), power and current are averaged over uniform
+        (see cellAverage), integrals over wavelength equal those over uniform for spectra linear between the wavelengths
+        '''
+        fName, wvl, power, Imax = self.load(name)
+        key = (fName, self.files[fName][0], gridKey(wavelength), None if uniform is None else gridKey(uniform))
+        if key in self.grids:
+            self.hits += 1
+            return self.grids[key]
+        if uniform is not None:
+            spectrum = self.get(name, uniform)
+            power = cellAverage(wavelength, uniform, spectrum.power)
+            current = cellAverage(wavelength, uniform, spectrum.current)
+        else:
+            power = np.interp(wavelength, wvl, power)
+            # number of photons per m²s per wavelength =  P / Eph [1/m²s]
+            N_ph_s_wl = wavelength * power * 1e-9 / (h * c)
+            # current J_wl = N_ph_s_wl * q --> J = sum(J_wl) A/m² = 0.1 mA/cm²
+            current = N_ph_s_wl * q * 0.1
+        self.misses += 1
+        for array in [power, current]:
+            array.setflags(write = False)
+        self.grids[key] = Spectrum(name, power, current, integrate.trapz(current, x=wavelength, axis = 0), Imax)
+        logging.info('\tspectrum {} interpolated to {} wavelengths ({} hits, {} misses)'.format(name, len(wavelength), self.hits, self.misses))
+        return self.grids[key]
+
+    def available(self, directory = SPECTRADIR):
+        '''
+        names of the spectrum files in directory
+        '''
+        return sorted(name for name in os.listdir(directory) if name.endswith('.dat'))
+
+    def clear(self):
+        self.files = {}
+        self.grids = {}
+        self.hits = 0
+        self.misses = 0
+
+spectrumLibrary = SpectrumLibrary()
@@ -0,0 +1,276 @@
+'''
+OptiSim without GUI
+
+usage as module:
+    import optisim
+    name, settings, defaults, references, stack = optisim.loadStack('stacks/StartStack.mop')
+    optics = optisim.run(stack, settings, calculations = [0, 1, 2, 3])
+    print(optics.scalars)
+
+usage from command line:
+    python optisim.py stacks/StartStack.mop -c 0 1 2 3 -o results
+    python optisim.py stacks/StartStack.mop --vary CIS_Richter thickness 1000 100 2000 --vary excitation "angle of incidence" 0 10 60 --sweep grid --table batch.dat
+    python optisim.py stacks/StartStack.mop --angles 0 5 80 -o results
+    python optisim.py stacks/StartStack.mop --repeat nZnO_Richter_V2 1 5 0 -c 0 1 2 3
+'''
+
+import time
+startImport = time.perf_counter()
+
+import os
+import sys
+import logging
+import argparse
+
+import numpy as np
+
+from classes.errors import *
+from classes.materials import CRILoader, loadMaterialDB, compileMaterialDB
+from classes.simulation import loadStack, simulate
+from classes.batch import makeBatchJobs, runBatch, ResultTable
+
+importTime = time.perf_counter() - startImport
+
+__version__ = "0.6.0"
+
+DEFAULTMATERIALDB = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'materialDB')
+
+def noReferences():
+    '''
+    reference dictionary without any reference curves
+    '''
+    return dict([(name, ['', 0]) for name in ['R reference', 'T reference', 'EQE reference', 'psi reference', 'delta reference']])
+
+def prepare(settings, references, calculations, materialDB):
+    '''
+    copy of settings with the simulation wavelengths, all references, calculations and the material database 
+    as dictionary (see run), the settings of the caller are not changed
+    '''
+    settings = dict(settings)
+    references = dict(noReferences(), **(references or {}))
+    if calculations is None:
+        calculations = [0]
+    if 'wavelength' not in settings:
+        wavelengthRange = settings['wavelengthRange']
+        settings['wavelength'] = np.arange(wavelengthRange[0], wavelengthRange[1] + wavelengthRange[2], wavelengthRange[2])
+    if materialDB is None:
+        materialDB = settings['MaterialDBPath']
+        if not os.path.isdir(materialDB):
+            materialDB = DEFAULTMATERIALDB
+    if not isinstance(materialDB, dict):
+        materialDB = loadMaterialDB(materialDB)
+    return settings, references, calculations, materialDB
+
+def run(stack, settings, references = None, calculations = None, materialDB = None, name = 'stack'):
+    '''
+    simulate the optics of a stack (list of Layer) without GUI and return the Optics object
+    references: dictionary of reference curves {name: [path, show]} as in the stack files
+    calculations: indices of calculations (see classes.simulation.simulate), default only stack optics
+    materialDB: path or dictionary {material: file} of the material database,
+                default settings['MaterialDBPath'] or the materialDB folder of OptiSim
+    '''
+    settings, references, calculations, materialDB = prepare(settings, references, calculations, materialDB)
+    return simulate(name, stack, settings, references, calculations, CRILoader(materialDB, settings))
+
+def sweep(stack, settings, batchVariables, mode = 'grid', samples = 10, references = None, calculations = None, 
+          materialDB = None, name = 'stack', workers = 0, seed = None, progress = None):
+    '''
+    batch simulation of a stack without GUI, returns a ResultTable (parameters and scalars of all jobs,
+    failed jobs are logged and have no row)
+    batchVariables: list of [category (0 layer, 1 stack), layer name or 'excitation', parameter, [start, step, stop]]
+    mode: 'sequential', 'grid' or 'latin hypercube' (with samples points)
+    workers: number of processes, 0 = number of cores
+    progress: function called with number of finished and total jobs
+    '''
+    settings, references, calculations, materialDB = prepare(settings, references, calculations, materialDB)
+    jobs = makeBatchJobs(name, stack, settings, batchVariables, mode, samples, seed)
+    table = ResultTable(jobs)
+    for done, (i, result) in enumerate(runBatch(jobs, references, calculations, materialDB, workers, True), 1):
+        if result is not None:
+            table.add(i, result)
+        if progress is not None:
+            progress(done, len(jobs))
+    return table
+
+def writeResults(optics, directory):
+    '''
+    write scalars and all spectra and profiles of an Optics object as tab separated files into directory
+    '''
+    try:
+        os.makedirs(directory, exist_ok = True)
+        with open(os.path.join(directory, 'scalars.dat'), 'w', encoding = 'utf-8') as f:
+            for key, value in optics.scalars.items():
+                if isinstance(value, list):
+                    value = '\t'.join(map(str, value))
+                f.write('{}\t{}\n'.format(key.strip(), value))
+        for category, xLabel, xValues in [('spectra', 'wavelength (nm)', optics.wavelength), ('profiles', 'x (nm)', optics.x)]:
+            for subcategory, curves in optics.availablePlots[category].items():
+                fName = '{}_{}.dat'.format(category, subcategory.replace(' ', '_').replace(',', ''))
+                with open(os.path.join(directory, fName), 'w', encoding = 'utf-8') as f:
+                    f.write(xLabel + '\t' + '\t'.join(curves.keys()) + '\n')
+                    for i in range(len(xValues)):
+                        f.write('\t'.join([str(xValues[i])] + [str(np.real(curve[i])) for curve in curves.values()]) + '\n')
+    except IOError as e:
+        raise WriteError("Could not write results to {}: \n {}".format(directory, e.args[1]))
+
+def writeAngleSweep(results, wavelength, angles, directory):
+    '''
+    write the (angle, wavelength) maps of Optics.angleSweep as tab separated files into directory
+    (one row per angle of incidence, one column per wavelength)
+    '''
+    maps = [(key, value) for key, value in results.items() if key != 'absorption']
+    maps.extend([('absorption_' + name, value) for name, value in results['absorption'].items()])
+    try:
+        os.makedirs(directory, exist_ok = True)
+        for key, values in maps:
+            with open(os.path.join(directory, 'angles_{}.dat'.format(key.replace(' ', '_'))), 'w', encoding = 'utf-8') as f:
+                f.write('angle (°) / wavelength (nm)\t' + '\t'.join(map(str, wavelength)) + '\n')
+                for angle, row in zip(angles, values):
+                    f.write('\t'.join([str(angle)] + [str(value) for value in row]) + '\n')
+    except IOError as e:
+        raise WriteError("Could not write angle sweep to {}: \n {}".format(directory, e.args[1]))
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'OptiSim {} - optical simulation of thin film stacks without GUI'.format(__version__))
+    parser.add_argument('stackfile', nargs = '?', help = 'stack file (.mop)')
+    parser.add_argument('-c', '--calculations', type = int, nargs = '+',
+                        help = '0 stack optics, 1 field intensity, 2 absorption, 3 QE, 4 generation, 5 ellipsometry, 6 Lambert-Beer (default: as saved in stack file)')
+    parser.add_argument('-o', '--output', help = 'directory for result files (default: scalars printed only)')
+    parser.add_argument('-m', '--materialDB', help = 'directory of the material database')
+    parser.add_argument('--compile', action = 'store_true', help = 'compile the material database into a binary store for fast loading')
+    parser.add_argument('--no-references', action = 'store_true', help = 'ignore reference curves of the stack file')
+    parser.add_argument('--vary', nargs = 5, action = 'append', metavar = ('LAYER', 'PARAMETER', 'START', 'STEP', 'STOP'),
+                        help = 'batch variable, LAYER is a layer name or excitation (PARAMETER angle of incidence)')
+    parser.add_argument('--sweep', choices = ['sequential', 'grid', 'lhs'], default = 'grid', help = 'combination of batch variables (lhs = latin hypercube)')
+    parser.add_argument('--samples', type = int, default = 10, help = 'number of latin hypercube samples')
+    parser.add_argument('--seed', type = int, help = 'random seed of latin hypercube')
+    parser.add_argument('--workers', type = int, default = 0, help = 'number of processes (default: number of cores)')
+    parser.add_argument('--table', default = 'batch.dat', help = 'file for the batch result table (default: batch.dat)')
+    parser.add_argument('--spectra', nargs = '+', metavar = 'SPECTRUM', 
+                        help = 'also report the mA/cm² scalars for these spectrum files without new simulation (FILE or FILE@INTENSITY in %%)')
+    parser.add_argument('--log', help = 'write log to this file')
+    parser.add_argument('--keep-2d', action = 'store_true', help = 'keep (x, wavelength) maps of field intensity and generation (more memory)')
+    parser.add_argument('--export-nk', metavar = 'DIRECTORY', help = 'write n, k of all layers of each simulation into one file per run')
+    parser.add_argument('--angles', nargs = 3, type = float, metavar = ('START', 'STEP', 'STOP'),
+                        help = 'write A/R/T, psi/Delta and layerwise absorption for these angles of incidence (one vectorized calculation) to the output directory')
+    parser.add_argument('--repeat', nargs = '+', action = 'append', metavar = 'ARG',
+                        help = 'repeat block LAYER LAYERS TIMES [PERIOD ...]: LAYER and the following layers (LAYERS in total) repeated TIMES times, '
+                               'depth profiles only of the listed periods (0 = top period), TIMES 1 removes a block of the stack file')
+    parser.add_argument('--polarization', choices = ['s', 'p', 'unpolarized'], help = 'polarization of the light (default: as in the stack file)')
+    parser.add_argument('--grading-tolerance', type = float, metavar = 'XMOLE',
+                        help = 'merge mesh points of graded layers into one sublayer while their composition differs by at most XMOLE (default: one sublayer per 5 mesh points)')
+    parser.add_argument('--mesh-tolerance', type = float, metavar = 'ERROR',
+                        help = 'adaptive depth nodes of all layers from their n, k for a relative integration error ERROR of the absorption')
+    parser.add_argument('--wavelength-tolerance', type = float, metavar = 'ERROR',
+                        help = 'non-uniform wavelength grid for a relative error ERROR of the integrated currents (default: all wavelengths)')
+    parser.add_argument('--threads', action = 'store_true', help = 'independent calculations (e.g. ellipsometry and field intensity) at the same time in threads')
+    parser.add_argument('--timing', action = 'store_true', help = 'report import time and run overhead')
+    args = parser.parse_args(argv)
+
+    if args.log:
+        logging.basicConfig(format='', filename = args.log, filemode = 'w', level = logging.INFO)
+
+    if args.compile:
+        try:
+            number = compileMaterialDB(args.materialDB or DEFAULTMATERIALDB)
+        except (LoadError, WriteError) as e:
+            print(e.msg, file = sys.stderr)
+            return 1
+        print('compiled {} materials'.format(number))
+    if not args.stackfile:
+        if not args.compile:
+            parser.error('a stack file is required')
+        return 0
+
+    try:
+        name, settings, defaults, references, stack = loadStack(args.stackfile)
+        calculations = args.calculations if args.calculations is not None else defaults['calculations']
+        if not args.keep_2d:
+            settings['keep 2D data'] = False # field intensity in depth chunks, results have no 2D maps
+        if args.export_nk:
+            settings['export nk data'] = args.export_nk
+        for repeat in args.repeat or []:
+            names = [layer.name for layer in stack]
+            if len(repeat) < 3 or repeat[0] not in names:
+                parser.error('--repeat needs a layer of the stack, the number of layers and the number of periods')
+            try:
+                layers, times, show = int(repeat[1]), int(repeat[2]), [int(no) for no in repeat[3:]]
+            except ValueError:
+                parser.error('--repeat needs integer numbers of layers, periods and shown periods')
+            stack[names.index(repeat[0])].repeat = {'layers': layers, 'times': times, 'show': show}
+        if args.polarization:
+            settings['polarization'] = ['s', 'p', 'unpolarized'].index(args.polarization)
+        if args.threads:
+            settings['parallel stages'] = True
+        if args.grading_tolerance is not None:
+            settings['grading tolerance'] = args.grading_tolerance
+        if args.wavelength_tolerance is not None:
+            settings['wavelength tolerance'] = args.wavelength_tolerance
+        if args.mesh_tolerance is not None:
+            for layer in stack:
+                layer.mesh['meshing'] = 3
+                layer.mesh['tolerance'] = args.mesh_tolerance
+        if args.no_references:
+            references = noReferences()
+        else:
+            for key, path in references.items():
+                if path[0] and not os.path.isfile(path[0]):
+                    logging.warning('\treference {} not found: {}'.format(key, path[0]))
+                    references[key] = ['', 0]
+        if args.vary:
+            batchVariables = []
+            for layer, parameter, start, step, stop in args.vary:
+                category = 1 if layer == 'excitation' else 0
+                batchVariables.append([category, layer, parameter, [float(start), float(step), float(stop)]])
+            mode = 'latin hypercube' if args.sweep == 'lhs' else args.sweep
+            progress = lambda done, total: print('\r{} / {}'.format(done, total), end = '', file = sys.stderr)
+            table = sweep(stack, settings, batchVariables, mode, args.samples, references, calculations, 
+                          args.materialDB, name, args.workers, args.seed, progress)
+            print('', file = sys.stderr)
+            if mode == 'latin hypercube' and len(table.jobs) < args.samples:
+                print('only {} of {} latin hypercube samples are different stacks'.format(len(table.jobs), args.samples), file = sys.stderr)
+            table.write(args.table)
+            print('{} results written to {}'.format(table.rows, args.table))
+            if table.rows < len(table.jobs):
+                print('{} of {} jobs failed (see log)'.format(len(table.jobs) - table.rows, len(table.jobs)), file = sys.stderr)
+            return 0
+        startRun = time.perf_counter()
+        optics = run(stack, settings, references, calculations, args.materialDB, name)
+        runTime = time.perf_counter() - startRun
+        if args.output:
+            writeResults(optics, args.output)
+        if args.angles:
+            start, step, stop = args.angles
+            angles = np.arange(start, stop + step / 2, step)
+            writeAngleSweep(optics.angleSweep(angles), optics.wavelength, angles, args.output or os.getcwd())
+    except (LoadError, WriteError, OutOfRangeError, NotImplementedError) as e:
+        print(e.msg, file = sys.stderr)
+        return 1
+
+    for key in defaults['scalars']:
+        print('{}\t{}'.format(key.strip(), optics.scalars[key]))
+    if args.mesh_tolerance is not None:
+        print('depth nodes\t{}'.format(optics.layerstack.meshPoints))
+    if args.wavelength_tolerance is not None:
+        print('wavelengths\t{}'.format(len(optics.wavelength)))
+    if args.spectra:
+        spectra = []
+        for spectrum in args.spectra:
+            name, sep, intensity = spectrum.rpartition('@')
+            spectra.append((name, float(intensity)) if sep else spectrum)
+        try:
+            results = optics.evaluateSpectra(spectra)
+        except LoadError as e:
+            print(e.msg, file = sys.stderr)
+            return 1
+        for result in results:
+            print('\n' + '\n'.join('{}\t{}'.format(key.strip(), value) for key, value in result.items()))
+    if args.timing:
+        calcTime = optics.scalars['creation time (s)'] + optics.scalars['calc. time (s)']
+        print('import time (s)\t{:.4f}'.format(importTime))
+        print('run time (s)\t{:.4f}'.format(runTime))
+        print('run overhead (s)\t{:.4f}'.format(runTime - calcTime))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
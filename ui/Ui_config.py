@@ -79,6 +79,10 @@ class Ui_Dialog(object):
         self.polTMRB.setChecked(False)
         self.polTMRB.setObjectName("polTMRB")
         self.horizontalLayout_7.addWidget(self.polTMRB)
+        self.polUnpolRB = QtWidgets.QRadioButton(self.groupBox_5)
+        self.polUnpolRB.setChecked(False)
+        self.polUnpolRB.setObjectName("polUnpolRB")
+        self.horizontalLayout_7.addWidget(self.polUnpolRB)
         self.verticalLayout_3.addLayout(self.horizontalLayout_7)
         self.horizontalLayout_10 = QtWidgets.QHBoxLayout()
         self.horizontalLayout_10.setObjectName("horizontalLayout_10")
@@ -137,8 +141,11 @@ class Ui_Dialog(object):
         self.label_3 = QtWidgets.QLabel(self.groupBox)
         self.label_3.setObjectName("label_3")
         self.gridLayout_2.addWidget(self.label_3, 2, 0, 1, 1)
+        self.label_20 = QtWidgets.QLabel(self.groupBox)
+        self.label_20.setObjectName("label_20")
+        self.gridLayout_2.addWidget(self.label_20, 3, 0, 1, 1)
         spacerItem1 = QtWidgets.QSpacerItem(20, 40, QtWidgets.QSizePolicy.Minimum, QtWidgets.QSizePolicy.Expanding)
-        self.gridLayout_2.addItem(spacerItem1, 3, 0, 1, 1)
+        self.gridLayout_2.addItem(spacerItem1, 4, 0, 1, 1)
         self.startSB = QtWidgets.QSpinBox(self.groupBox)
         sizePolicy = QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Minimum, QtWidgets.QSizePolicy.Fixed)
         sizePolicy.setHorizontalStretch(0)
@@ -162,6 +169,13 @@ class Ui_Dialog(object):
         self.stepSB.setMaximum(999)
         self.stepSB.setObjectName("stepSB")
         self.gridLayout_2.addWidget(self.stepSB, 2, 1, 1, 1)
+        self.wavelengthToleranceSB = QtWidgets.QDoubleSpinBox(self.groupBox)
+        self.wavelengthToleranceSB.setMinimumSize(QtCore.QSize(80, 0))
+        self.wavelengthToleranceSB.setDecimals(5)
+        self.wavelengthToleranceSB.setMaximum(0.1)
+        self.wavelengthToleranceSB.setSingleStep(0.001)
+        self.wavelengthToleranceSB.setObjectName("wavelengthToleranceSB")
+        self.gridLayout_2.addWidget(self.wavelengthToleranceSB, 3, 1, 1, 1)
         self.verticalLayout_2.addLayout(self.gridLayout_2)
         self.horizontalLayout_2.addWidget(self.groupBox)
         self.verticalLayout_6.addLayout(self.horizontalLayout_2)
@@ -295,6 +309,10 @@ class Ui_Dialog(object):
         self.frame_2.setObjectName("frame_2")
         self.horizontalLayout_6 = QtWidgets.QHBoxLayout(self.frame_2)
         self.horizontalLayout_6.setObjectName("horizontalLayout_6")
+        self.diffuseRaytracerCB = QtWidgets.QCheckBox(self.frame_2)
+        self.diffuseRaytracerCB.setChecked(False)
+        self.diffuseRaytracerCB.setObjectName("diffuseRaytracerCB")
+        self.horizontalLayout_6.addWidget(self.diffuseRaytracerCB)
         self.label_6 = QtWidgets.QLabel(self.frame_2)
         self.label_6.setAlignment(QtCore.Qt.AlignRight|QtCore.Qt.AlignTrailing|QtCore.Qt.AlignVCenter)
         self.label_6.setObjectName("label_6")
@@ -352,12 +370,15 @@ class Ui_Dialog(object):
         self.label_14.setText(_translate("Dialog", "polarization:"))
         self.polTERB.setText(_translate("Dialog", "TE (s)"))
         self.polTMRB.setText(_translate("Dialog", "TM (p)"))
+        self.polUnpolRB.setText(_translate("Dialog", "unpolarized"))
         self.label_5.setText(_translate("Dialog", "pol angle [°]:"))
         self.groupBox.setTitle(_translate("Dialog", "spectrum"))
         self.label_4.setText(_translate("Dialog", "wavelength (nm)"))
         self.label.setText(_translate("Dialog", "start value"))
         self.label_2.setText(_translate("Dialog", "end value"))
         self.label_3.setText(_translate("Dialog", "step"))
+        self.label_20.setText(_translate("Dialog", "adaptive tolerance"))
+        self.wavelengthToleranceSB.setToolTip(_translate("Dialog", "relative error of the integrated currents for a non-uniform grid of the wavelengths above (0 = all wavelengths)"))
         self.groupBox_4.setTitle(_translate("Dialog", "path to material database"))
         self.pathButton.setText(_translate("Dialog", "..."))
         self.reloadButton.setText(_translate("Dialog", "reload"))
@@ -375,6 +396,7 @@ class Ui_Dialog(object):
         self.EMA_MaxwellGarnett.setText(_translate("Dialog", "Maxwell-Garnett"))
         self.roughFresnelCB.setText(_translate("Dialog", "use modified Fresnel coeffizients"))
         self.calcDiffuseLightCB.setText(_translate("Dialog", "include diffuse light (raytracer) if Haze > 0"))
+        self.diffuseRaytracerCB.setText(_translate("Dialog", "iterative raytracer"))
         self.label_6.setText(_translate("Dialog", "max. no. of iterations"))
         self.label_7.setText(_translate("Dialog", "min. intensity"))
         self.tabWidget.setTabText(self.tabWidget.indexOf(self.tab_2), _translate("Dialog", "options"))
@@ -155,6 +155,16 @@ class Ui_Dialog(object):
         self.endeVLabel = QtWidgets.QLabel(self.groupBox_2)
         self.endeVLabel.setObjectName("endeVLabel")
         self.horizontalLayout_5.addWidget(self.endeVLabel)
+        self.pointsLabel = QtWidgets.QLabel(self.groupBox_2)
+        self.pointsLabel.setObjectName("pointsLabel")
+        self.horizontalLayout_5.addWidget(self.pointsLabel)
+        self.pointsSB = QtWidgets.QSpinBox(self.groupBox_2)
+        self.pointsSB.setMinimum(4)
+        self.pointsSB.setMaximum(10000)
+        self.pointsSB.setSingleStep(50)
+        self.pointsSB.setProperty("value", 100)
+        self.pointsSB.setObjectName("pointsSB")
+        self.horizontalLayout_5.addWidget(self.pointsSB)
         self.horizontalLayout_4.addWidget(self.groupBox_2)
         spacerItem1 = QtWidgets.QSpacerItem(40, 20, QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Minimum)
         self.horizontalLayout_4.addItem(spacerItem1)
@@ -207,6 +217,7 @@ class Ui_Dialog(object):
         self.starteVLabel.setText(_translate("Dialog", "TextLabel"))
         self.endeVSBLabel.setText(_translate("Dialog", "end [eV]"))
         self.endeVLabel.setText(_translate("Dialog", "TextLabel"))
+        self.pointsLabel.setText(_translate("Dialog", "points"))
         self.loadReference.setText(_translate("Dialog", "load reference"))
 
 from ui.mplwidget_dielFunc import MplWidgetDielFunc
@@ -179,7 +179,7 @@ class ESubwindow(MplWidget):
         if int % self.step > 0:
             int = int - (int % self.step)
             self.controller.wavelengthSB.setValue(int)
-        self.idx = np.nonzero(self.wvl == int)[0][0]
+        self.idx = np.argmin(np.abs(self.wvl - int)) # nearest wavelength (non-uniform grid of adaptive wavelengths)
         #self.wvlset = int
         #self.Eset = self.E[idx] 
         self.updateData()
@@ -659,12 +659,29 @@ class Ui_MainWindow(object):
         self.autoDistRB = QtWidgets.QRadioButton(self.groupBox_5)
         self.autoDistRB.setObjectName("autoDistRB")
         self.verticalLayout_12.addWidget(self.autoDistRB)
+        self.horizontalLayout_18 = QtWidgets.QHBoxLayout()
+        self.horizontalLayout_18.setObjectName("horizontalLayout_18")
+        self.adaptiveDistRB = QtWidgets.QRadioButton(self.groupBox_5)
+        self.adaptiveDistRB.setObjectName("adaptiveDistRB")
+        self.horizontalLayout_18.addWidget(self.adaptiveDistRB)
+        spacerItem5 = QtWidgets.QSpacerItem(40, 20, QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Minimum)
+        self.horizontalLayout_18.addItem(spacerItem5)
+        self.adaptiveToleranceSB = QtWidgets.QDoubleSpinBox(self.groupBox_5)
+        self.adaptiveToleranceSB.setEnabled(False)
+        self.adaptiveToleranceSB.setDecimals(5)
+        self.adaptiveToleranceSB.setMinimum(1e-05)
+        self.adaptiveToleranceSB.setMaximum(0.1)
+        self.adaptiveToleranceSB.setSingleStep(0.001)
+        self.adaptiveToleranceSB.setProperty("value", 0.001)
+        self.adaptiveToleranceSB.setObjectName("adaptiveToleranceSB")
+        self.horizontalLayout_18.addWidget(self.adaptiveToleranceSB)
+        self.verticalLayout_12.addLayout(self.horizontalLayout_18)
         self.verticalLayout_6.addWidget(self.groupBox_5)
         self.meshLabel = QtWidgets.QLabel(self.page_11)
         self.meshLabel.setObjectName("meshLabel")
         self.verticalLayout_6.addWidget(self.meshLabel)
-        spacerItem5 = QtWidgets.QSpacerItem(259, 161, QtWidgets.QSizePolicy.Minimum, QtWidgets.QSizePolicy.MinimumExpanding)
-        self.verticalLayout_6.addItem(spacerItem5)
+        spacerItem6 = QtWidgets.QSpacerItem(259, 161, QtWidgets.QSizePolicy.Minimum, QtWidgets.QSizePolicy.MinimumExpanding)
+        self.verticalLayout_6.addItem(spacerItem6)
         self.toolBox.addItem(self.page_11, "")
         self.verticalLayout_18.addWidget(self.toolBox)
         self.verticalLayout_15.addWidget(self.groupBox)
@@ -764,8 +781,8 @@ class Ui_MainWindow(object):
         self.calcOptBeamCB.setObjectName("calcOptBeamCB")
         self.gridLayout_5.addWidget(self.calcOptBeamCB, 1, 0, 1, 1)
         self.verticalLayout_16.addWidget(self.groupBox_7)
-        spacerItem6 = QtWidgets.QSpacerItem(20, 40, QtWidgets.QSizePolicy.Minimum, QtWidgets.QSizePolicy.Expanding)
-        self.verticalLayout_16.addItem(spacerItem6)
+        spacerItem7 = QtWidgets.QSpacerItem(20, 40, QtWidgets.QSizePolicy.Minimum, QtWidgets.QSizePolicy.Expanding)
+        self.verticalLayout_16.addItem(spacerItem7)
         self.tabWidget_2.addTab(self.tab_3, "")
         self.verticalLayout_13.addWidget(self.tabWidget_2)
         self.scrollArea.setWidget(self.scrollAreaWidgetContents)
@@ -887,6 +904,7 @@ class Ui_MainWindow(object):
         self.collectionSelection.currentIndexChanged['int'].connect(self.colSourceArea.setCurrentIndex)
         self.constantPointsRB.toggled['bool'].connect(self.constantPointsSB.setEnabled)
         self.constantDistRB.toggled['bool'].connect(self.constantDistSB.setEnabled)
+        self.adaptiveDistRB.toggled['bool'].connect(self.adaptiveToleranceSB.setEnabled)
         QtCore.QMetaObject.connectSlotsByName(MainWindow)
 
     def retranslateUi(self, MainWindow):
@@ -935,6 +953,8 @@ class Ui_MainWindow(object):
         self.constantPointsRB.setText(_translate("MainWindow", "constant no of points"))
         self.constantDistRB.setText(_translate("MainWindow", "constant depth step (nm)"))
         self.autoDistRB.setText(_translate("MainWindow", "automatic (interface refinement)"))
+        self.adaptiveDistRB.setText(_translate("MainWindow", "adaptive to n, k (absorption error)"))
+        self.adaptiveToleranceSB.setToolTip(_translate("MainWindow", "relative integration error of the absorption, nodes are set from n, k of the layer for each simulation"))
         self.meshLabel.setText(_translate("MainWindow", "TextLabel"))
         self.toolBox.setItemText(self.toolBox.indexOf(self.page_11), _translate("MainWindow", "mesh"))
         self.tabWidget_2.setTabText(self.tabWidget_2.indexOf(self.tab_2), _translate("MainWindow", "setup"))
@@ -5,7 +5,7 @@ Module implementing BatchDlg.
 """
 
 from PyQt5.QtCore import pyqtSlot,  Qt
-from PyQt5.QtWidgets import QMessageBox, QDialog, QDoubleSpinBox, QLineEdit, QPushButton, QFileDialog, QComboBox
+from PyQt5.QtWidgets import QMessageBox, QDialog, QDoubleSpinBox, QLineEdit, QPushButton, QFileDialog, QComboBox, QLabel, QSpinBox
 
 from .Ui_batchmenu import Ui_Dialog
 
@@ -14,7 +14,7 @@ class BatchDlg(QDialog, Ui_Dialog):
     """
     Class documentation goes here.
     """
-    def __init__(self, stack, batchVariables = [], parent=None):
+    def __init__(self, stack, batchVariables = [], workers = 0, mode = 'sequential', samples = 10, parent=None):
         """
         batch menu opens as follows
         
@@ -37,6 +37,13 @@ class BatchDlg(QDialog, Ui_Dialog):
             iii) variable name as shown above
             iv) list of start, step, stop value
             
+        workers is the number of parallel processes (0 - number of cores)
+        
+        mode defines how the variables are combined
+            sequential - one variable after the other (each result in result list)
+            grid - all combinations
+            latin hypercube - samples combinations filling the parameter space
+        grid and latin hypercube results are written to one table
         """
         super().__init__(parent)
         self.setupUi(self)
@@ -50,6 +57,33 @@ class BatchDlg(QDialog, Ui_Dialog):
         self.stackParameters = ['angle of incidence']
        
         self.variables = batchVariables.copy()
+        self.workers = workers
+        
+        self.workersSB = QSpinBox()
+        self.workersSB.setRange(0, 256)
+        self.workersSB.setSpecialValueText('auto')
+        self.workersSB.setValue(self.workers)
+        self.workersSB.valueChanged.connect(self.workersSBChanged)
+        self.horizontalLayout.addWidget(QLabel('parallel processes'))
+        self.horizontalLayout.addWidget(self.workersSB)
+        
+        self.modes = ['sequential', 'grid', 'latin hypercube']
+        self.mode = mode
+        self.samples = samples
+        self.modeCB = QComboBox()
+        self.modeCB.addItems(self.modes)
+        self.modeCB.setCurrentIndex(self.modes.index(self.mode))
+        self.modeCB.currentIndexChanged.connect(self.modeCBChanged)
+        self.samplesSB = QSpinBox()
+        self.samplesSB.setRange(2, 100000)
+        self.samplesSB.setValue(self.samples)
+        self.samplesSB.setEnabled(self.mode == 'latin hypercube')
+        self.samplesSB.valueChanged.connect(self.samplesSBChanged)
+        self.horizontalLayout.addWidget(QLabel('combination'))
+        self.horizontalLayout.addWidget(self.modeCB)
+        self.horizontalLayout.addWidget(QLabel('samples'))
+        self.horizontalLayout.addWidget(self.samplesSB)
+        
         self.variableNumberSB.setValue(len(self.variables))
         self.updateLayout()
 
@@ -200,6 +234,16 @@ class BatchDlg(QDialog, Ui_Dialog):
     def stopSBChanged(self, p0):
         self.variables[self.currentVariable][3][2] = p0
         
+    def workersSBChanged(self, p0):
+        self.workers = p0
+        
+    def modeCBChanged(self, i):
+        self.mode = self.modes[i]
+        self.samplesSB.setEnabled(self.mode == 'latin hypercube')
+        
+    def samplesSBChanged(self, p0):
+        self.samples = p0
+        
     @pyqtSlot(int)
     def on_variableNumberSB_valueChanged(self, p0):
         if p0 > len(self.variables):
@@ -31,6 +31,10 @@ class ConfigDlg(QDialog, Ui_Dialog):
         
         if 'roughness Haze calc diffuse' not in self.settings:
             self.settings['roughness Haze calc diffuse'] = [True, 20, 0.00001]
+        if 'diffuse light raytracer' not in self.settings:
+            self.settings['diffuse light raytracer'] = False
+        if 'wavelength tolerance' not in self.settings:
+            self.settings['wavelength tolerance'] = 0.0
             
             
         if lastFile is not "":
@@ -51,6 +55,7 @@ class ConfigDlg(QDialog, Ui_Dialog):
         self.startSB.setValue(self.settings['wavelengthRange'][0])
         self.endSB.setValue(self.settings['wavelengthRange'][1])
         self.stepSB.setValue(self.settings['wavelengthRange'][2])
+        self.wavelengthToleranceSB.setValue(self.settings['wavelength tolerance'])
 
         # calculation options
         self.LBcorrectForReflCB.setChecked(self.settings['LB correct for Reflection'])
@@ -59,8 +64,11 @@ class ConfigDlg(QDialog, Ui_Dialog):
         self.roughFresnelCB.setChecked(self.settings['roughness Fresnel model'])
         self.calcDiffuseLightCB.setChecked(self.settings['roughness Haze calc diffuse'][0])
         
+        self.diffuseRaytracerCB.setChecked(self.settings['diffuse light raytracer'])
         self.RaytracerIterationsSB.setValue(self.settings['roughness Haze calc diffuse'][1])
         self.RaytracerIntensitySB.setValue(self.settings['roughness Haze calc diffuse'][2])
+        self.RaytracerIterationsSB.setEnabled(self.settings['diffuse light raytracer'])
+        self.RaytracerIntensitySB.setEnabled(self.settings['diffuse light raytracer'])
         
         # EMA models
         if 'EMA model' in self.settings:
@@ -77,7 +85,9 @@ class ConfigDlg(QDialog, Ui_Dialog):
             
         
         # polarization
-        self.polTMRB.setChecked(self.settings['polarization']) # 0 => TE(s) 1 => TM (p)
+        # 0 => TE(s) 1 => TM (p) 2 => unpolarized
+        self.polTMRB.setChecked(self.settings['polarization'] == 1)
+        self.polUnpolRB.setChecked(self.settings['polarization'] == 2)
         
         # others
         self.pathEdit.setText(self.settings['MaterialDBPath'])
@@ -105,6 +115,10 @@ class ConfigDlg(QDialog, Ui_Dialog):
         self.settings['wavelengthRange'][2] = p0
         self.makeSpectrum()
         
+    @pyqtSlot(float)
+    def on_wavelengthToleranceSB_valueChanged(self, p0):
+        self.settings['wavelength tolerance'] = p0
+        
     @pyqtSlot()
     def on_pathButton_clicked(self):
         DirName = QFileDialog.getExistingDirectory(self, 'select a folder containing the nk files', os.getcwd()+'\\materialDB')
@@ -196,13 +210,28 @@ class ConfigDlg(QDialog, Ui_Dialog):
     
     @pyqtSlot(bool)
     def on_polTERB_toggled(self, checked):
-        pol = self.polTMRB.isChecked()
-        self.settings['polarization'] = pol
+        self.setPolarization()
     
     @pyqtSlot(bool)
     def on_polTMRB_toggled(self, checked):
-        pol = self.polTMRB.isChecked()
-        self.settings['polarization'] = pol
+        self.setPolarization()
+    
+    @pyqtSlot(bool)
+    def on_polUnpolRB_toggled(self, checked):
+        self.setPolarization()
+        
+    def setPolarization(self):
+        if self.polUnpolRB.isChecked():
+            self.settings['polarization'] = 2
+        else:
+            self.settings['polarization'] = int(self.polTMRB.isChecked())
+    
+    @pyqtSlot(bool)
+    def on_diffuseRaytracerCB_toggled(self, checked):
+        # iterations and intensity limit are only used by the raytracer, otherwise all bounces are solved at once
+        self.settings['diffuse light raytracer'] = checked
+        self.RaytracerIterationsSB.setEnabled(checked)
+        self.RaytracerIntensitySB.setEnabled(checked)
     
     @pyqtSlot(int)
     def on_RaytracerIterationsSB_valueChanged(self, p0):
@@ -6,6 +6,7 @@ Module implementing FittingAdvancedDlg.
 
 import time
 import copy
+import logging
 import numpy as np
 from scipy.optimize import minimize # minimize_scalar, basinhopping, curve_fit
 
@@ -15,12 +16,14 @@ from PyQt5.QtGui import QStandardItemModel, QStandardItem
 from PyQt5.QtWidgets import QDialog, QHeaderView, QMessageBox
 
 from .Ui_fitting_advanced import Ui_Dialog
-from .dielectric_function import MODELS
-from .dielectric_function import calcFunction as calcOsciFunction
+from classes.errors import *
+from classes.dielectricfunction import MODELS
+from classes.dielectricfunction import calcFunction as calcOsciFunction
 
 
 from classes.layerstack import LayerStack
 from classes.optics import Optics
+from classes.simulation import updateOptics, chiSquareGradient, GRADIENTMETHODS, REFERENCEMODELS
 #from classes.advancedFitingTreeModel import TreeOfParamtersModel
 
 
@@ -136,21 +139,8 @@ class FittingAdvancedDlg(QDialog, Ui_Dialog):
         plotDict = {}
         for ref in self.referenceList:
             if ref[1]:
-                if ref[0] == 'R reference':
-                    plotDict['R reference'] = self.referenceData['R reference']
-                    plotDict['R'] = self.optics.RspectrumSystem
-                if ref[0] == 'T reference':                    
-                    plotDict['T reference'] = self.referenceData['T reference']
-                    plotDict['T'] = self.optics.TspectrumSystem
-                if ref[0] == 'EQE reference':
-                    plotDict['EQE reference'] = self.referenceData['EQE reference']
-                    plotDict['EQE'] = self.optics.EQE
-                if ref[0] == 'psi reference':
-                    plotDict['psi reference'] = self.referenceData['psi reference']
-                    plotDict['psi'] = self.optics.psi
-                if ref[0] == 'delta reference':
-                    plotDict['delta reference'] = self.referenceData['delta reference']
-                    plotDict['delta'] = self.optics.delta
+                plotDict[ref[0]] = self.referenceData[ref[0]]
+                plotDict[ref[0].split()[0]] = self.optics.request(REFERENCEMODELS[ref[0]])
         x = self.optics.wavelength
         if plotDict:
             self.plotView.showCurves(x, plotDict, 'wavelength (nm)', 'value [a.u.]')
@@ -265,12 +255,9 @@ class FittingAdvancedDlg(QDialog, Ui_Dialog):
     def runOptics(self):
         input = LayerStack(self.StackName, self.stack, self.settings, self.getCRI)
         self.optics = Optics(self.StackName, input, self.references, self.settings)
-        self.optics.calcStack()
         self.optics.createReferenceCurves()
-        self.optics.calcFieldIntensity()
-        self.optics.calcAbsorption()
-        self.optics.calcQE()
-        self.optics.calcEllipsometry()
+        # only stack optics, the other curves are calculated when they are plotted or fitted (Optics.request)
+        self.optics.calculate('stack')
         #get reference data
         self.referenceData = {}
         
@@ -310,9 +297,20 @@ class FittingAdvancedDlg(QDialog, Ui_Dialog):
         for item in parameterList:
             parameters.append(item[2])
         # run fitting
+        self.fitOptics = None # updated incrementally in each iteration
+        self.fitValues = None
+        self.fitGradient = None
+        # gradient methods get the analytic gradient if it is supported (probed once), else scipy's finite differences
+        jac = None
+        if self.configuration['method'] in GRADIENTMETHODS:
+            try:
+                self.jacobianFunction(np.array(parameters, dtype = float), parameterList)
+                jac = self.jacobianFunction
+            except NotImplementedError as e:
+                logging.info('\t{} --> gradient by finite differences'.format(e))
         try:
             self.resultTextEdit.setText("busy fitting ...")
-            minResult = minimize(self.minimizeFunction, parameters, args = (parameterList),
+            minResult = minimize(self.minimizeFunction, parameters, args = (parameterList), jac = jac,
                                     method= self.configuration['method'], tol=self.configuration['tolerance'], 
                                     options = {'maxiter' : self.configuration['noOfIterations']}) #, tol=1e-6
         except RuntimeError as e:
@@ -336,6 +334,20 @@ class FittingAdvancedDlg(QDialog, Ui_Dialog):
         #logging.info('\n' + 50 * '#' + '\n' + message + '\n do final calculation ...\n' + 50 * '#')
 
     def minimizeFunction(self, values, parameterList):
+        # what has to be recalculated for each parameter (None: new LayerStack)
+        changes = { self.changeThickness: 'thickness', 
+                    self.changeSroughThickness: 'roughness', 
+                    self.changeSroughHazeR: 'roughness', 
+                    self.changeSroughHazeT: 'roughness', 
+                    self.changeConstantn: 'nk', 
+                    self.changeConstantk: 'nk', 
+                    self.changeConstante: 'nk', 
+                    self.changeOscillator: 'nk', 
+                    self.changeConstantCollection: 'collection', 
+                    self.changeSCR: 'collection', 
+                    self.changeDiffL: 'collection', 
+                    self.changerecVel: 'collection'}
+        dirty = {}
         #set the parameters
         for i, value in enumerate(values):
             layer = parameterList[i][1]
@@ -346,38 +358,52 @@ class FittingAdvancedDlg(QDialog, Ui_Dialog):
                 func(layer, osciNum, itemNum, value)
             else:
                 func(layer, value)
-        input = LayerStack(self.StackName, self.stack, self.settings, self.getCRI)
-        self.optics = Optics(self.StackName, input, self.references, self.settings)
-        self.optics.calcStack()
+            if changes.get(func) is None:
+                self.fitOptics = None
+            dirty.setdefault(self.stack[layer].name, set()).add(changes.get(func))
+        # only collection changed: the optics of the last iteration are kept, only collection and QE are calculated
+        collectionOnly = self.fitOptics is not None and all(kinds == {'collection'} for kinds in dirty.values()) \
+                            and self.fitOptics.updateCollection(self.stack, list(dirty))
+        if not collectionOnly:
+            self.optics = updateOptics(self.fitOptics, self.StackName, self.stack, self.settings, self.references, self.getCRI, dirty)
+            self.fitOptics = self.optics
         #print(len(self.referenceDataSelected))
+        # only the stages of the selected references which changed are calculated
+        keys = list(self.referenceDataSelected)
+        models = self.optics.request(*[REFERENCEMODELS[key] for key in keys])
+        if len(keys) == 1:
+            models = [models]
         errorArray = np.zeros(len(self.optics.wavelength))
-        for key, exp in self.referenceDataSelected.items():
-            if key == 'R reference':
-                model = self.optics.RspectrumSystem
-                errorArray += ((model - exp)/exp)**2
-            elif key == 'T reference':
-                model = self.optics.TspectrumSystem
-                errorArray += ((model - exp)/exp)**2
-            elif key == 'EQE reference':
-                self.optics.calcFieldIntensity()
-                self.optics.calcAbsorption()
-                self.optics.calcQE()
-                model = self.optics.EQE
-                errorArray += ((model - exp)/exp)**2
-            elif key == 'psi reference':
-                self.optics.calcEllipsometry()
-                model = self.optics.psi
-                errorArray += ((model - exp)/exp)**2
-            elif key == 'delta reference':
-                self.optics.calcEllipsometry()
-                model = self.optics.delta
-                errorArray += ((model - exp)/exp)**2
+        for key, model in zip(keys, models):
+            exp = self.referenceDataSelected[key]
+            errorArray += ((model - exp)/exp)**2
         #N = len(errorArray)
         #M = len(parameterList)
         if self.configuration['plotInBetween']:
             self.updatePlot()
+        self.fitValues = np.array(values)
         return np.sum(errorArray) # chi² or MSE = 1/(2N-M) * chi² 
         
+    def jacobianFunction(self, values, parameterList):
+        '''
+        gradient of minimizeFunction from the analytic derivatives of R, T and EQE (thickness and constant n, k),
+        the gradient of the last values is kept
+        raises NotImplementedError for other parameters and references (see Optics.calcDerivatives)
+        '''
+        derivatives = { self.changeThickness: 'thickness', 
+                        self.changeConstantn: 'n', 
+                        self.changeConstantk: 'k'}
+        if any(item[3] not in derivatives for item in parameterList):
+            raise NotImplementedError('no derivatives of the selected parameters')
+        if self.fitGradient is not None and np.array_equal(values, self.fitGradient[0]):
+            return self.fitGradient[1]
+        if self.fitValues is None or not np.array_equal(values, self.fitValues):
+            self.minimizeFunction(values, parameterList)
+        parameters = [(self.stack[item[1]].name, derivatives[item[3]]) for item in parameterList]
+        gradient = chiSquareGradient(self.optics, parameters, self.referenceDataSelected)
+        self.fitGradient = (np.array(values), gradient)
+        return gradient
+        
     @pyqtSlot(str)
     def on_methodCB_currentIndexChanged(self, p0):
        self.configuration['method'] = p0
@@ -388,6 +414,9 @@ class FittingAdvancedDlg(QDialog, Ui_Dialog):
 
     def changeThickness(self, layer, value):
         self.stack[layer].thickness = int(value)
+        self.stack[layer].makeXnodes()
+        self.stack[layer].makeXcollection()
+        self.stack[layer].makeXgrading()
         
     def changeSroughThickness(self, layer, value):
         self.stack[layer].sroughThickness = int(value)
@@ -17,7 +17,6 @@ from PyQt5.QtWidgets import QMainWindow
 
 import time
 import pickle
-import glob # for deleting tmp files
 import numpy as np
 import numexpr as ne
 
@@ -52,21 +51,15 @@ from classes.errors import *
 from classes.layer import Layer
 from classes.layerstack import LayerStack
 from classes.optics import Optics
+from classes.materials import CRILoader, loadMaterialDB, compileMaterialDB, materialStoreIsStale
+from classes.simulation import simulate, updateOptics, chiSquareGradient, GRADIENTMETHODS, REFERENCEMODELS
+from classes.batch import makeBatchJobs, runBatch, ResultTable
 from classes.resulttablemodel import ResultTableModel
 from classes.navtoolbar import NavToolBar as NavigationToolbar
 
 __version__ = "0.6.0"
 
  
-def num(s):
-    try:
-        return int(s)
-    except ValueError:
-        try:
-            return float(s)
-        except ValueError:
-            raise LoadError('Can not convert string {} into number!'.format(s))
-
 class MainWindow(QMainWindow, Ui_MainWindow):
     """
     Class documentation goes here.
@@ -157,16 +150,26 @@ class MainWindow(QMainWindow, Ui_MainWindow):
                         ('MaterialDBPath', MaterialDBPath),
                         ('wavelengthRange', wavelengthRange),
                         ('wavelength', np.arange(wavelengthRange[0], wavelengthRange[1] + wavelengthRange[2], wavelengthRange[2])),  
+                        ('wavelength tolerance', 0.0), # relative error of integrated currents for adaptive wavelengths, 0 => all wavelengths
                         ('angle', 0), 
-                        ('polarization', 0),  # 0 => TE(s) 1 => TM (p)
+                        ('polarization', 0),  # 0 => TE(s) 1 => TM (p) 2 => unpolarized
                         ('LB correct for Reflection', True),
                         ('grading advanced', True),
+                        ('grading tolerance', 0.0), # max. difference of xMole in one sublayer of graded layers, 0 => one sublayer per 5 mesh points
                         ('roughness EMA model', True),
                         ('roughness Fresnel model', False),
                         ('roughness Haze calc diffuse', [True, 100, 0.00001]), # calc diffuse light, max iterations, min intensity 
+                        ('diffuse light raytracer', False), # iterative raytracer for diffuse light (max iterations, min intensity), False => all bounces solved at once
                         ('EMA model',  1), # 0 => mean, 1 => Bruggemann, 2 => Maxwell-Garnett
                         ('intensity', 100),  # % prefactor for incident light intensity
-                        ('spectrum', Spectrum)
+                        ('spectrum', Spectrum),
+                        ('vectorized engine', True), # transfer matrices for all wavelengths at once
+                        ('parallel stages', False), # independent calculations (e.g. ellipsometry and field intensity) at the same time in threads
+                        ('batch workers', 0), # number of processes for batch simulations, 0 => number of cores
+                        ('batch mode', 'sequential'), # 'sequential', 'grid' or 'latin hypercube'
+                        ('batch samples', 10), # number of samples for latin hypercube
+                        ('keep 2D data', True), # (x, wavelength) maps for 2D plots, False => field intensity in depth chunks (less memory)
+                        ('export nk data', '') # directory for n, k of all layers of each calculation, '' => no export
                         ])
         
         self.references = dict([    
@@ -266,6 +269,9 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         self.removeLayerAction = self.createAction("&Remove layer", self.removeLayer,
                 None, "removeLayer",
                 "remove selected layer")
+        self.repeatBlockAction = self.createAction("Re&peat block ...", self.repeatBlock,
+                None, None,
+                "repeat the selected layer and the following layers (e.g. Bragg reflector)")
         
         self.showReferencesAction = self.createAction("references ...", self.showReferences, 
                 None, None, "define path for reference files")
@@ -349,7 +355,7 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         
         self.stackMenu = self.menuBar.addMenu("&Stack")
         self.addActions(self.stackMenu, (self.addAboveAction, self.addBelowAction,
-                            self.moveUpAction, self.moveDownAction, self.removeLayerAction, None, self.showReferencesAction, self.showAllCRIAction))
+                            self.moveUpAction, self.moveDownAction, self.removeLayerAction, self.repeatBlockAction, None, self.showReferencesAction, self.showAllCRIAction))
         
         simulationMenu = self.menuBar.addMenu("S&imulation")
         self.addActions(simulationMenu, (self.runAction, self.defineBatchAction, self.runBatchAction, None))
@@ -411,7 +417,7 @@ class MainWindow(QMainWindow, Ui_MainWindow):
             Button.deleteLater()
         for Position, layer in enumerate(self.stack):
             LayerButton = QtWidgets.QPushButton()
-            LayerButton.setText('%s (%i nm)' %(layer.name, layer.thickness))
+            LayerButton.setText(self.layerButtonText(layer))
             LayerButton.setAutoExclusive(True)
             LayerButton.setCheckable(True)
             LayerButton.setStyleSheet('background-color: %s' %self.stack[Position].color.name())
@@ -496,6 +502,52 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         self.updateStatus("changed stack order")
 
 
+    def layerButtonText(self, layer):
+        '''
+        name and thickness of the layer and the repeat block starting at the layer
+        '''
+        text = '%s (%i nm)' %(layer.name, layer.thickness)
+        repeat = getattr(layer, 'repeat', None) # None for layers of old stack files
+        if repeat is not None and repeat['times'] > 1:
+            text += ' - %i layers x %i' %(repeat['layers'], repeat['times'])
+        return text
+    
+    def repeatBlock(self):
+        '''
+        repeat block of the selected layer and the following layers (see LayerStack.expandRepeatBlocks):
+        number of layers, number of periods (1 removes the block) and the periods with depth profiles
+        '''
+        repeat = getattr(self.currentLayer, 'repeat', None) or {'layers': 1, 'times': 1, 'show': []}
+        layers, ok = QtWidgets.QInputDialog.getInt(self, "repeat block", 
+                        "number of layers of the block (from {}):".format(self.currentLayer.name), 
+                        repeat['layers'], 1, len(self.stack) - self.selectedLayer)
+        if not ok:
+            return
+        times, ok = QtWidgets.QInputDialog.getInt(self, "repeat block", 
+                        "number of periods (1 = no repeat block):", repeat['times'], 1, 100000)
+        if not ok:
+            return
+        show, ok = QtWidgets.QInputDialog.getText(self, "repeat block", 
+                        "periods with depth profiles (0 = top period, e.g. 0, 5):", 
+                        QtWidgets.QLineEdit.Normal, ', '.join(map(str, repeat['show'])))
+        if not ok:
+            return
+        try:
+            show = [int(no) for no in show.replace(',', ' ').split()]
+        except ValueError:
+            QtWidgets.QMessageBox.warning(self,
+                "repeat block",
+                'Error - periods must be integer numbers!',
+                QtWidgets.QMessageBox.StandardButtons(QtWidgets.QMessageBox.Close))
+            return
+        self.currentLayer.repeat = {'layers': layers, 'times': times, 'show': show}
+        self.ButtonGroup.checkedButton().setText(self.layerButtonText(self.currentLayer))
+        self.dirty = True
+        if times > 1:
+            self.updateStatus("repeat {} layers from {} {} times".format(layers, self.currentLayer.name, times))
+        else:
+            self.updateStatus("removed repeat block of {}".format(self.currentLayer.name))
+
     def getnewlayername(self):
         '''
         find latest 'new layer' number and iterate for the new layer
@@ -554,10 +606,16 @@ class MainWindow(QMainWindow, Ui_MainWindow):
             self.constantPointsRB.setChecked(True)
         elif self.currentLayer.mesh['meshing'] == 1:
             self.constantDistRB.setChecked(True)
+        elif self.currentLayer.mesh['meshing'] == 3:
+            self.adaptiveDistRB.setChecked(True)
         else:
             self.autoDistRB.setChecked(True)
         self.constantPointsSB.setValue(self.currentLayer.mesh['Points'])
         self.constantDistSB.setValue(self.currentLayer.mesh['Dist'])
+        if 'tolerance' in self.currentLayer.mesh:
+            self.adaptiveToleranceSB.setValue(self.currentLayer.mesh['tolerance'])
+        else:
+            self.adaptiveToleranceSB.setValue(0.001) # layers of old stack files
         self.updateMeshPoints()
 
     def fillSimulationOptions(self):
@@ -646,7 +704,7 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         """
         newName = self.layerNameField.text()
         self.currentLayer.name = newName
-        self.ButtonGroup.checkedButton().setText('%s (%i nm)' %(newName, self.currentLayer.thickness))
+        self.ButtonGroup.checkedButton().setText(self.layerButtonText(self.currentLayer))
         self.dirty = True
         self.updateStatus("changed name of selected layer to {}".format(newName))
    
@@ -657,7 +715,7 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         """
         if not self.currentLayer.thickness == p0:
             self.currentLayer.thickness = p0
-            self.ButtonGroup.checkedButton().setText('%s (%i nm)' %(self.currentLayer.name, self.currentLayer.thickness))
+            self.ButtonGroup.checkedButton().setText(self.layerButtonText(self.currentLayer))
             self.currentLayer.makeXnodes()
             self.currentLayer.makeXcollection()
             self.currentLayer.makeXgrading()
@@ -910,6 +968,13 @@ class MainWindow(QMainWindow, Ui_MainWindow):
             self.dirty = True
             self.updateStatus("changed meshing for {} to automatic.".format(self.currentLayer.name))
     
+    @pyqtSlot(bool)
+    def on_adaptiveDistRB_toggled(self, checked):
+        if checked and not self.currentLayer.mesh['meshing'] == 3:
+            self.setMeshing()
+            self.dirty = True
+            self.updateStatus("changed meshing for {} to adaptive.".format(self.currentLayer.name))
+    
     @pyqtSlot(int)
     def on_constantPointsSB_valueChanged(self, p0):
         if not self.currentLayer.mesh['Points'] == p0:
@@ -932,11 +997,20 @@ class MainWindow(QMainWindow, Ui_MainWindow):
             self.dirty = True
             self.updateStatus("changed constant depth step for meshing of {} to {}.".format(self.currentLayer.name, p0))
     
+    @pyqtSlot(float)
+    def on_adaptiveToleranceSB_valueChanged(self, p0):
+        if not ('tolerance' in self.currentLayer.mesh and self.currentLayer.mesh['tolerance'] == p0):
+            self.currentLayer.mesh['tolerance'] = p0
+            self.dirty = True
+            self.updateStatus("changed tolerance of adaptive meshing for {} to {}.".format(self.currentLayer.name, p0))
+    
     def setMeshing(self):
         if self.constantPointsRB.isChecked():
             self.currentLayer.mesh['meshing'] = 0
         elif self.constantDistRB.isChecked():
             self.currentLayer.mesh['meshing'] = 1
+        elif self.adaptiveDistRB.isChecked():
+            self.currentLayer.mesh['meshing'] = 3 # nodes from n, k when the stack is created
         else:
             self.currentLayer.mesh['meshing'] = 2
         self.currentLayer.makeXnodes()
@@ -950,147 +1024,30 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         for layer in self.stack:
             stackPoints += len(layer.x)
         self.meshLabel.setText('number of mesh points current layer: %i\n\nnumber of mesh points complete stack: %i' %(currPoints, stackPoints))
+        if self.currentLayer.mesh['meshing'] == 3:
+            self.meshLabel.setText(self.meshLabel.text() + '\n\nadaptive meshing: number of points set from n, k for each simulation')
         
     def getCRI(self, layer):
-        fName = ''
-        wvl = self.settings['wavelength']
-        if layer.criSource == 'from database':
-            fName = self.MaterialDB[layer.criDBName]
-        elif layer.criSource == 'from file':
-            fName = layer.criFile['path']
-            if layer.criFile['alpha']:
-                w, k = self.criLoadAlphaFile(fName)
-                layer.n = np.ones(len(w)) * self.criFileSpinBox.value()
-                layer.k = k
-                layer.wavelength = w
-                return
-        elif layer.criSource == 'constant':
-            n = layer.criConstant[0]
-            k = layer.criConstant[1]
-            layer.wavelength = wvl
-            layer.n = np.ones(len(wvl)) * n
-            layer.k = np.ones(len(wvl)) * k
-            return
-        elif layer.criSource == 'dielectric function':
-            layer.n = layer.dielectricFunction['n'][::-1]
-            layer.k = layer.dielectricFunction['k'][::-1]
-            layer.wavelength =  layer.dielectricFunction['wvl'][::-1]
-            return
-            
-        elif layer.criSource == 'graded':
-            layer.criGrading['xMoles'] = []
-            layer.criGrading['Egs'] = []
-            layer.criGrading['n_idc'] = []
-            layer.criGrading['k_idc'] = []
-            for file in layer.criGrading['files']:
-                w, n, k = self.criLoadFile(file[2])
-                if w[0] > wvl[0] or w[-1] < wvl[-1]:
-                    self.warning('The cri file of {} does no cover the specified wavelength range'.format(layer.name))
-                n = np.interp(wvl, w, n)
-                k = np.interp(wvl, w, k)
-                layer.criGrading['xMoles'].append(file[0])
-                layer.criGrading['Egs'].append(file[1])
-                layer.criGrading['n_idc'].append(n) 
-                layer.criGrading['k_idc'].append(k)
-            # set first file values to defaults for plot when "show optical constants" is clicked
-            layer.wavelength = wvl
-            layer.n = layer.criGrading['n_idc'][0]
-            layer.k = layer.criGrading['k_idc'][0]
-            return
-            
-        if fName:
-            w, n, k = self.criLoadFile(fName)
-            if w[0] > wvl[0] or w[-1] < wvl[-1]:
-                    self.warning('The cri file of {} does no cover the specified wavelength range'.format(layer.name))
-            layer.wavelength = w
-            layer.n = n
-            layer.k = k
-        else:
-            raise LoadError("There is no cri file path for {} defined!".format(layer.name))
-
-
-    def criLoadFile(self, filename):
-        """opens and read cri files
-        File structure:
-        column 1 -- wavelength (nm)
-        column 2 -- n
-        column 3 -- k
-        """
-        w = []
-        n = []
-        k = []
-        wvl_factor = 1
-        ln = 1
-        try:
-            f = open(filename)
-            while True:
-                line = f.readline()
-                if not line:
-                    break
-                if '[mum]' in line:
-                    wvl_factor = 1000
-                if line[0].isdigit():
-                    fields = line.split("\t")
-                    if len(fields) != 3:
-                        raise LoadError("Line {}:\nFile {} has wrong column format!\nShould be:\n[wvl]\t[n]\t[k]".format(ln, filename))
-                    w.append(num(fields[0]) * wvl_factor)
-                    n.append(num(fields[1]))
-                    k.append(num(fields[2]))
-                ln += 1
-            return w, n, k
-            f.close()
-        except IOError as e:
-            raise LoadError("Could not read file {}: \n {}".format(filename, e.args[1]))
-    
-    def criLoadAlphaFile(self, filename):
-        w_list = []
-        k_list = []
-        wvl_factor = 1
-        alpha_factor = 1
-        ln = 1
-        try:
-            f = open(filename)
-            while True:
-                line = f.readline()
-                if not line:
-                    break
-                if '[mum]' in line:
-                    wvl_factor = 1000
-                if 'cm^-1' in line or '1/cm' in line:
-                    alpha_factor = 1e-7 # --> nm^-1
-                else:# 'm^-1' in line or '1/m' in line: default
-                    alpha_factor = 1e-9 # --> nm^-1
-                if line[0].isdigit():
-                    fields = line.split("\t")
-                    if len(fields) != 2:
-                        raise LoadError("Line {}:\nFile {} has wrong column format!\nShould be:\n[wvl]\t[alpha]".format(ln, filename))
-                    w = num(fields[0]) * wvl_factor
-                    k = num(fields[1]) * alpha_factor * w / (4 * np.pi) # k = alpha*Lambda/4pi
-                    w_list.append(w)
-                    k_list.append(k)
-                ln += 1
-            return w_list, k_list
-            f.close()
-        except IOError as e:
-            raise LoadError("Could not read file {}: \n {}".format(filename, e.args[1]))
+        loader = CRILoader(self.MaterialDB, self.settings, self.warning)
+        loader(layer)
 
     def loadMaterialDB(self):
         '''
         look for files in directory MaterialDB
         create a dictionary with Materialnames and corresponding absolute path
         '''
-        #TODO: check differen cwd at other os
         path = self.settings['MaterialDBPath']
         if not os.path.isdir(path):
             self.warning('Path to material database does not exist! Default directory is choosen. Some of your definitions may be changed.')
-            path = os.getcwd() + "\\materialDB"
-        included_extenstions = ['dat']
-        self.MaterialFiles = [fn for fn in os.listdir(path) if any([fn.endswith(ext) for ext in included_extenstions])]
-        self.Materials = []
-        for i, Mat in enumerate(self.MaterialFiles):
-            self.Materials.append(Mat.replace('.dat', ''))
-        criFilePaths = [(self.settings['MaterialDBPath'] + '\\' + i) for i in self.MaterialFiles]
-        self.MaterialDB = dict(zip(self.Materials,  criFilePaths))
+            path = os.path.join(os.getcwd(), 'materialDB')
+        self.MaterialDB = loadMaterialDB(path)
+        # binary store for fast loading, text files are used if it is not possible
+        if materialStoreIsStale(path):
+            try:
+                compileMaterialDB(path)
+            except (LoadError, WriteError) as e:
+                logging.info('\tmaterial database not compiled: {}'.format(e.msg))
+        self.Materials = list(self.MaterialDB.keys())
         self.criDBList.clear()
         self.criDBList.addItems(sorted(self.Materials))
    
@@ -1132,7 +1089,7 @@ class MainWindow(QMainWindow, Ui_MainWindow):
             if plot == 0: # stack optics
                 toPlot = currentOptics.availablePlots['spectra']['total A,R,T']
                 title = 'total A,R,T ({})'.format(self.StackName)
-                xRange = self.settings['wavelength']
+                xRange = currentOptics.wavelength # grid of the result (adaptive wavelengths)
                 xLabel = 'wavelength (nm)'
                 yLabel = 'total A,R,T'
                 PlotSubw = Subwindow(title, xRange, toPlot, xLabel, yLabel)
@@ -1150,7 +1107,7 @@ class MainWindow(QMainWindow, Ui_MainWindow):
             if plot == 2: # layerwise optics
                 toPlot = currentOptics.availablePlots['spectra']['absorption (layerwise)']
                 title = 'layerwise absorption ({})'.format(self.StackName)
-                xRange = self.settings['wavelength']
+                xRange = currentOptics.wavelength
                 xLabel = 'wavelength (nm)'
                 yLabel = 'absorption'
                 PlotSubw = Subwindow(title, xRange, toPlot, xLabel, yLabel)
@@ -1159,7 +1116,7 @@ class MainWindow(QMainWindow, Ui_MainWindow):
             if plot == 3: # layerwise optics
                 toPlot = currentOptics.availablePlots['spectra']['QE']
                 title = 'QE ({})'.format(self.StackName)
-                xRange = self.settings['wavelength']
+                xRange = currentOptics.wavelength
                 xLabel = 'wavelength (nm)'
                 yLabel = 'quantum efficiency'
                 PlotSubw = Subwindow(title, xRange, toPlot, xLabel, yLabel)
@@ -1177,7 +1134,7 @@ class MainWindow(QMainWindow, Ui_MainWindow):
             if plot == 5: # Ellipsometry
                 toPlot = currentOptics.availablePlots['spectra']['Ellipsometry']
                 title = 'SE ({})'.format(self.StackName)
-                xRange = self.settings['wavelength']
+                xRange = currentOptics.wavelength
                 xLabel = 'wavelength (nm)'
                 yLabel = 'psi / delta'
                 PlotSubw = Subwindow(title, xRange, toPlot, xLabel, yLabel)
@@ -1187,7 +1144,7 @@ class MainWindow(QMainWindow, Ui_MainWindow):
             if plot == 6: # Lambert Beer
                 toPlot = currentOptics.availablePlots['spectra']['QE']
                 title = 'EQE LB ({})'.format(self.StackName)
-                xRange = self.settings['wavelength']
+                xRange = currentOptics.wavelength
                 xLabel = 'wavelength (nm)'
                 yLabel = 'EQE'
                 PlotSubw = Subwindow(title, xRange, toPlot, xLabel, yLabel)
@@ -1209,111 +1166,87 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         
     def simulate(self):
         self.startLogging()
-            
-        #try:
-        input = LayerStack(self.StackName, self.stack, self.settings, self.getCRI)
-        #except LoadError as e:
-            
-           # raise LoadError(e)
-            
-        startCalcTime = time.time() 
-        
         self.updateStatus('calculate stack optics')
-        logging.info('\ncalculate optics...\n')
-        
-        currentOptics = Optics(self.StackName, input, self.references, self.settings)
-        currentOptics.createReferenceCurves()
-        self.onProgress(10)
-        
-        length = len(self.defaults['calculations'])
-        
-        # ------------ What to calculate? --------
-        if 0 in self.defaults['calculations']:
-            currentOptics.calcStack()
-            self.onProgress((100 * 1 / length) - 10)
-        if 1 in self.defaults['calculations']:
-            currentOptics.calcFieldIntensity()# requires calcStack
-            self.onProgress((100 * 2 / length) - 10)
-        if 2 in self.defaults['calculations']:
-            currentOptics.calcAbsorption()# requires Field intensity
-            self.onProgress((100 * 3 / length) - 10)
-        if 3 in self.defaults['calculations']:
-            currentOptics.calcQE()# requires Layerwise optics
-            self.onProgress((100 * 4 / length) - 10)        
-        if 4 in self.defaults['calculations']:
-            currentOptics.calcGeneration()# requires Layerwise optics
-            self.onProgress((100 * 5 / length) - 10)        
-        if 5 in self.defaults['calculations']:
-            currentOptics.calcEllipsometry()
-        if 6 in self.defaults['calculations']:
-            currentOptics.calcOptBeamTotal()
-            
-        endCalcTime = time.time()
-        currentOptics.scalars['calc. time (s)'] = endCalcTime - startCalcTime
-        
-        logging.info('\n... optics calculated in {:.4f} s.\n'.format(currentOptics.scalars['calc. time (s)']))
+        currentOptics = simulate(self.StackName, self.stack, self.settings, self.references, 
+                                 self.defaults['calculations'], self.getCRI, self.onProgress)
         return currentOptics
         
+    def batchOptions(self):
+        '''
+        workers, mode and samples of batch simulations (defaults for older stack files)
+        '''
+        workers = self.settings['batch workers'] if 'batch workers' in self.settings else 0
+        mode = self.settings['batch mode'] if 'batch mode' in self.settings else 'sequential'
+        samples = self.settings['batch samples'] if 'batch samples' in self.settings else 10
+        return workers, mode, samples
+        
     def defineBatch(self):
-        variables = BatchDlg(self.stack, self.batchVariables, self)
+        workers, mode, samples = self.batchOptions()
+        variables = BatchDlg(self.stack, self.batchVariables, workers, mode, samples, self)
         if variables.exec_():
             self.batchVariables = variables.variables
+            self.settings['batch workers'] = variables.workers
+            self.settings['batch mode'] = variables.mode
+            self.settings['batch samples'] = variables.samples
     
     def runBatch(self):
         if self.batchVariables:
-            for variable in self.batchVariables:
-                if variable[0] == 0:
-                    # case of layer parametervariation
-                    #print(variable[1])
-                    for i, layer in enumerate(self.stack):
-                        if layer.name == variable[1]:
-                            stackIndex = i
-                            NamePart = layer.name
-                    self.createStackView(stackIndex)
-                    if variable[2] == 'thickness':
-                        parameter = 'self.on_layerThicknessSB_valueChanged(value)'
-                        NamePart = NamePart + ' t = '
-                    elif variable[2] == 'roughness' and self.stack[stackIndex].srough == True:
-                        parameter = 'self.on_sroughThicknessEdit_valueChanged(value)'#'self.stack[stackIndex].sroughThickness'
-                        NamePart = NamePart + ' rough t = '
-                    elif variable[2] == 'Haze R' and self.stack[stackIndex].srough == True:
-                        parameter = 'self.on_hazeRSlider_valueChanged(value)'#'self.stack[stackIndex].sroughThickness'
-                        NamePart = NamePart + ' rough t = '
-                    elif variable[2] == 'Haze T' and self.stack[stackIndex].srough == True:
-                        parameter = 'self.on_Ha_valueChanged(value)'#'self.stack[stackIndex].sroughThickness'
-                        NamePart = NamePart + ' rough t = '
-                    elif variable[2] == 'constant n' and self.stack[stackIndex].criSource == 'constant':
-                        parameter = 'self.on_criConstantnEdit_valueChanged(value)'#'self.stack[stackIndex].criConstant[0]'
-                        NamePart = NamePart + ' n = '
-                    elif variable[2] == 'constant k' and self.stack[stackIndex].criSource == 'constant':
-                        parameter = 'self.on_criConstantkEdit_valueChanged(value)'
-                        NamePart = NamePart + ' n = '
-                    elif variable[2] == 'diffusion length' and self.stack[stackIndex].collection['source'] == 'from diffusion length':
-                        parameter = 'self.on_diffLengthSB_valueChanged(value)'
-                        NamePart = NamePart + ' D_l = '
+            workers, mode, samples = self.batchOptions()
+            try:
+                jobs = makeBatchJobs(self.StackNameEdit.text(), self.stack, self.settings, self.batchVariables, mode, samples)
+            except NotImplementedError as e:
+                self.warning(e.msg)
+                return
+            if not jobs:
+                self.updateStatus('no batch simulations defined for the chosen variables')
+                return
+            if mode == 'latin hypercube' and len(jobs) < samples:
+                self.warning('Only {} of {} latin hypercube samples are different stacks.'.format(len(jobs), samples))
+            # sweeps (grid, latin hypercube) give one table instead of single results
+            table = None
+            if mode != 'sequential':
+                fName, _ = QtWidgets.QFileDialog.getSaveFileName(self, 'Save table of {} batch results to file'.format(len(jobs)), '','data files (*.dat)')
+                if not fName:
+                    return
+                table = ResultTable(jobs)
+            self.startLogging()
+            logging.info('\nstart batch ({}) of {} simulations...'.format(mode, len(jobs)))
+            self.updateStatus('batch simulations running')
+            self.progressBar.setRange(0, len(jobs))
+            self.progressBar.setFormat('%v / %m')
+            self.onProgress(0)
+            failed = 0
+            try:
+                for done, (i, result) in enumerate(runBatch(jobs, self.references, self.defaults['calculations'], 
+                                                            self.MaterialDB, workers, table is not None), 1):
+                    if result is None:
+                        # error of the job is logged by runBatch, the other jobs go on
+                        failed += 1
                     else:
-                        break
-                        
-                elif variable:
-                    # case of layer stack variation
-                    if variable[1] == 'excitation':
-                       if variable[2] == 'angle of incidence':
-                            parameter = 'self.settings[\'angle\'] = value'
-                            NamePart = ' angle = '
-                else:
-                    break
-                    
-                for value in np.arange(variable[3][0], variable[3][2]+variable[3][1], variable[3][1]):
-                    self.StackName = self.StackNameEdit.text() + ' ' + NamePart + ' ' + str(value)
-                    exec(parameter)
-                    currentOptics = self.simulate()
-                    self.addResult(currentOptics)
-                    
-            self.onProgress(100)
-            
-            self.updateStatus('all batch simulations successfully done')
+                        logging.info('\t{} finished ({} of {})'.format(jobs[i][0], done, len(jobs)))
+                        if table is None:
+                            self.addResult(result)
+                        else:
+                            table.add(i, result)
+                    self.onProgress(done)
+                    QtWidgets.QApplication.processEvents()
+                if table is not None:
+                    table.write(fName)
+            except (LoadError, OutOfRangeError, WriteError, NotImplementedError) as e:
+                logging.exception("There was a problem in the batch simulation.")
+                self.warning(e.msg)
+                return
+            finally:
+                self.progressBar.setRange(0, 100)
+                self.progressBar.resetFormat()
+                self.onProgress(0)
+                logging.shutdown()
             
-            self.onProgress(0)
+            if failed:
+                self.warning('{} of {} batch simulations failed, see log file for the errors'.format(failed, len(jobs)))
+                self.updateStatus('batch simulations done, {} of {} failed'.format(failed, len(jobs)))
+            else:
+                self.updateStatus('all batch simulations successfully done')
         
     def fitThickness(self):
         #TODO: Nealder-Mead method?
@@ -1348,11 +1281,20 @@ class MainWindow(QMainWindow, Ui_MainWindow):
             ydata = data
             # curve fitting (func, xdata, ydata, p0,
             self.noOfFitIterations = 0
+            self.fitOptics = None # updated incrementally in each iteration
             self.updateStatus('busy fitting ...')
             
             try:
                 #fitParams, fitCovariances = curve_fit(self.fitThicknessFunction, xdata, ydata, t, jac='3-point',  diff_step=0.01, method='trf', bounds=(0, 5000), max_nfev=fitting.noOfIterations)# , sigma=2,  epsfcn = -0.01,
-                minResult = minimize(self.fitThicknessFunctionMinimize, t, args = (xdata, ydata), method= fitting.method, options = {'maxiter' : fitting.noOfIterations}) #, tol=1e-6
+                # analytic gradient if it is supported (probed once), else scipy's finite differences
+                jac = None
+                if fitting.method in GRADIENTMETHODS:
+                    try:
+                        self.fitThicknessJacobian(np.atleast_1d(np.array(t, dtype = float)), xdata, ydata)
+                        jac = self.fitThicknessJacobian
+                    except NotImplementedError as e:
+                        logging.info('\t{} --> gradient by finite differences'.format(e))
+                minResult = minimize(self.fitThicknessFunctionMinimize, t, args = (xdata, ydata), jac = jac, method= fitting.method, options = {'maxiter' : fitting.noOfIterations}) #, tol=1e-6
                 #minResult = basinhopping(self.fitThicknessFunctionMinimize, t, minimizer_kwargs={'args': (xdata, ydata), 'method': fitting.method}, niter=10, stepsize = 20)
                 #minResult = minimize_scalar(self.fitThicknessFunctionMinimize, args = (xdata, ydata), method= 'Bounded', bounds=(500, 1000))
             except RuntimeError as e:
@@ -1396,53 +1338,42 @@ class MainWindow(QMainWindow, Ui_MainWindow):
     def fitThicknessFunction(self, xdata, t):
         #print(t)
         self.noOfFitIterations += 1
-        self.stack[self.layerToFit].thickness = t
-        input = LayerStack(self.StackName, self.stack, self.settings, self.getCRI)   
+        layer = self.stack[self.layerToFit]
+        layer.thickness = t
+        layer.makeXnodes()
+        layer.makeXcollection()
+        layer.makeXgrading()
         self.StackName = self.checkStackName(self.StackNameEdit.text())
-        optics = Optics(self.StackName, input, self.references, self.settings)
-        optics.calcStack()
-        if 'R' in self.referenceToFit:
-            return optics.RspectrumSystem
-        elif 'T' in self.referenceToFit:
-            return optics.TspectrumSystem
-        elif 'EQE' in self.referenceToFit:
-            optics.calcFieldIntensity()
-            optics.calcAbsorption()
-            optics.calcQE()
-            return optics.EQE
-        elif 'psi' in self.referenceToFit:
-            optics.calcEllipsometry()
-            return optics.psi
-        elif 'delta' in self.referenceToFit:
-            optics.calcEllipsometry()
-            return optics.delta
+        optics = updateOptics(self.fitOptics, self.StackName, self.stack, self.settings, self.references, self.getCRI, {layer.name: {'thickness'}})
+        self.fitOptics = optics
+        # only the stages required for the reference are calculated
+        return optics.request(REFERENCEMODELS[self.referenceToFit])
         
     def fitThicknessFunctionMinimize(self, t, xdata, ydata):
         #print(t)
         self.noOfFitIterations += 1
-        self.stack[self.layerToFit].thickness = t
-        input = LayerStack(self.StackName, self.stack, self.settings, self.getCRI)   
+        layer = self.stack[self.layerToFit]
+        layer.thickness = t
+        layer.makeXnodes()
+        layer.makeXcollection()
+        layer.makeXgrading()
         self.StackName = self.checkStackName(self.StackNameEdit.text())
-        optics = Optics(self.StackName, input, self.references, self.settings)
+        optics = updateOptics(self.fitOptics, self.StackName, self.stack, self.settings, self.references, self.getCRI, {layer.name: {'thickness'}})
+        self.fitOptics = optics
         #optics.createReferenceCurves() #not needed
-        optics.calcStack()
-        if 'R' in self.referenceToFit:
-            ref = optics.RspectrumSystem
-        elif 'T' in self.referenceToFit:
-            ref = optics.TspectrumSystem
-        elif 'EQE' in self.referenceToFit:
-            optics.calcFieldIntensity()
-            optics.calcAbsorption()
-            optics.calcQE()
-            ref = optics.EQE
-        elif 'psi' in self.referenceToFit:
-            optics.calcEllipsometry()
-            ref = optics.psi
-        elif 'delta' in self.referenceToFit:
-            optics.calcEllipsometry()
-            ref = optics.delta
+        ref = optics.request(REFERENCEMODELS[self.referenceToFit])
         return np.sum((((ref - ydata)/ydata))**2) 
         
+    def fitThicknessJacobian(self, t, xdata, ydata):
+        '''
+        derivative of fitThicknessFunctionMinimize from the analytic derivatives of R, T or EQE
+        raises NotImplementedError for psi and delta (see Optics.calcDerivatives)
+        '''
+        layer = self.stack[self.layerToFit]
+        if self.fitOptics is None or not np.array_equal(layer.thickness, t):
+            self.fitThicknessFunctionMinimize(t, xdata, ydata)
+        return chiSquareGradient(self.fitOptics, [(layer.name, 'thickness')], {self.referenceToFit: ydata})
+        
     def fitDiffLength(self):
         fitting = FittingDiffusion(self.stack, self.references, self)
         if fitting.exec_():
@@ -1477,6 +1408,7 @@ class MainWindow(QMainWindow, Ui_MainWindow):
             ydata = data
             # curve fitting (func, xdata, ydata, p0,
             self.noOfFitIterations = 0
+            self.fitOptics = None # updated incrementally in each iteration
             self.updateStatus('busy fitting ...')
             try:
                 #fitParams, fitCovariances = curve_fit(self.fitDiffLengthFunction, xdata, ydata, diffL, method='trf', bounds=(100, 4000), diff_step=100, max_nfev=fitting.noOfIterations) #ftol = 0.0001 factor=20, epsfcn = -0.01, 
@@ -1520,14 +1452,8 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         #print(diffL)
         self.noOfFitIterations += 1
         self.stack[self.layerToFit].collection['diffLength'] = diffL
-        input = LayerStack(self.StackName,  self.stack, self.settings, self.getCRI)   
-        #self.StackName = self.checkStackName(self.StackNameEdit.text())
-        optics = Optics(self.StackName, input, self.references, self.settings)
-        optics.calcStack()
-        optics.calcFieldIntensity()
-        optics.calcAbsorption()
-        optics.calcQE()
-        return optics.EQE
+        self.stack[self.layerToFit].makeXcollection()
+        return self.fitCollectionEQE()
         
     def fitDiffLengthFunctionMinimize(self, diffL, xdata, ydata):
         #print(diffL)
@@ -1535,18 +1461,23 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         self.stack[self.layerToFit].collection['diffLength'] = diffL
         self.stack[self.layerToFit].makeXcollection()
         self.plotCollectionFunction()
-        input = LayerStack(self.StackName,  self.stack, self.settings, self.getCRI)   
-        #self.StackName = self.checkStackName(self.StackNameEdit.text())
-        optics = Optics(self.StackName, input, self.references, self.settings)
-        optics.calcStack()
-        optics.calcFieldIntensity()
-        optics.calcAbsorption()
-        optics.calcQE()
-        ref = optics.EQE
+        ref = self.fitCollectionEQE()
         result = np.sum(((ref - ydata)/ydata)**2) 
         #print(result)
         return result
         
+    def fitCollectionEQE(self):
+        '''
+        EQE after the collection of the fitted layer changed, 
+        the optics are calculated only once and the absorption is reused (Optics.updateCollection)
+        '''
+        name = self.stack[self.layerToFit].name
+        if self.fitOptics is None or not self.fitOptics.updateCollection(self.stack, [name]):
+            optics = updateOptics(None, self.StackName, self.stack, self.settings, self.references, self.getCRI, {name: {'collection'}})
+            optics.calculate('QE')
+            self.fitOptics = optics
+        return self.fitOptics.EQE
+        
     def fitAdvanced(self):
         fitting = FittingAdvancedDlg(self.stack, self.references, self.StackNameEdit.text(), self.settings, self.getCRI,self)
         
@@ -2008,12 +1939,13 @@ class MainWindow(QMainWindow, Ui_MainWindow):
                             stack = self.resultlist[result]
                             if i == 0:
                                 x = stack.x
-                            if not set(stack.x) ==  set(x):
+                                wvl = stack.wavelength
+                            if not set(stack.x) ==  set(x) or not np.array_equal(stack.wavelength, wvl):
                                 
                                 continue
                             key = item.text(0)
                             toPlot[key + ' ( ' + stack.stackname + ')'] = [stack.x, stack.availablePlots['2D'][key].T]
-                        self.plot_2D(toPlot, key)
+                        self.plot_2D(toPlot, key, wvl)
                         return
                     for result in self.selectedRows:
                         stack = self.resultlist[result]
@@ -2023,7 +1955,7 @@ class MainWindow(QMainWindow, Ui_MainWindow):
                                     [item.parent().text(0)] \
                                     [key]
                     if item.parent().parent().text(0) == 'spectra':
-                        xRange = self.settings['wavelength']
+                        xRange = self.resultlist[result].wavelength # grid of the result (adaptive wavelengths)
                         xLabel = 'wavelength (nm)'
                     elif item.parent().parent().text(0) == 'profiles':
                         xRange = self.resultlist[result].x
@@ -2044,7 +1976,7 @@ class MainWindow(QMainWindow, Ui_MainWindow):
                                     [item.text(0)] \
                                     [key]
                             if item.parent().text(0) == 'spectra':
-                                xRange = self.settings['wavelength']
+                                xRange = self.resultlist[result].wavelength
                                 xLabel = 'wavelength (nm)'
                             elif item.parent().text(0) == 'profiles':
                                 xRange = self.resultlist[result].x
@@ -2064,12 +1996,11 @@ class MainWindow(QMainWindow, Ui_MainWindow):
                     
             #elif not item.parent().parent()
                 #curveName = item.
-    def plot_2D(self, toPlot, key):
+    def plot_2D(self, toPlot, key, wvl):
         if 'intensity' in key:
             ylabel = 'norm. intensity'
         else:
             ylabel = 'gen. rate (1/cm³s nm)'
-        wvl = self.settings['wavelength']
         step = self.settings['wavelengthRange'][2]
         #dsf
         plot = ESubwindow(wvl, step, toPlot, ylabel)
@@ -2104,8 +2035,6 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         if self.okToContinue():
             self.AppSettings.setValue("LastFile", self.lastFile)
             self.AppSettings.setValue("RecentFiles", self.recentFiles or [])
-            for filename in glob.glob("./tmp_*"):
-                os.remove(filename) 
             #settings.setValue("MainWindow/Geometry", self.saveGeometry())
             #settings.setValue("MainWindow/State", self.saveState())
         else: